@@ -0,0 +1,101 @@
+"""
+Kinematics benchmark for Sperm Analyzer AI
+Times kinematics.measure() on synthetic populations of tracks, with the
+cost of each group of metrics, against a per-track Python loop computing
+VCL alone.
+
+    python -m backend.bench_kinematics --tracks 100 1000 --points 300
+"""
+
+import argparse
+import time
+from typing import Callable
+
+import numpy as np
+
+from backend.config import settings
+from backend.services import kinematics
+from backend.services.trajectories import Trajectories, normalize_tracks
+
+
+def population(tracks: int, points: int, frame_rate: float, seed: int = 0) -> Trajectories:
+    """Straight swimmers at random headings and speeds, with detection jitter"""
+    rng = np.random.default_rng(seed)
+    t = np.arange(points) / frame_rate
+    paths = []
+    for i in range(tracks):
+        heading, speed = rng.uniform(0, 2 * np.pi), rng.uniform(0, 80)
+        xy = np.outer(t, speed * np.array([np.cos(heading), np.sin(heading)]))
+        xy += rng.normal(0, 0.5, xy.shape) + rng.uniform(0, 600, 2)
+        paths.append({"track_id": i, "positions": np.c_[np.arange(points), xy]})
+    return normalize_tracks(paths)
+
+
+def best_ms(work: Callable[[], object], repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        work()
+        timings.append(time.perf_counter() - started)
+    return min(timings) * 1000
+
+
+def stage_costs(trajectories: Trajectories, window: int, repeat: int) -> dict:
+    """Cost of each group of metrics, in the order measure() computes them"""
+    offsets, xy = trajectories.offsets, trajectories.xy.astype(np.float64)
+    first, last = offsets[:-1], offsets[1:] - 1
+    track = kinematics._track_index(offsets)
+    average = kinematics._running_mean(xy, offsets, track, window)
+
+    def lateral():
+        heading = np.gradient(average, axis=0)
+        heading[first] = average[first + 1] - average[first]
+        heading[last] = average[last] - average[last - 1]
+        deviation = xy - average
+        offset = (heading[:, 0] * deviation[:, 1] - heading[:, 1] * deviation[:, 0]) / np.hypot(*heading.T)
+        np.bincount(track, weights=np.abs(offset))
+        return offset
+
+    offset = lateral()
+    side = np.sign(offset)
+    return {
+        "VCL + VSL": best_ms(lambda: (
+            kinematics._path_length(xy, offsets, kinematics._track_index(offsets)),
+            np.hypot(*(xy[last] - xy[first]).T)
+        ), repeat),
+        "+ VAP": best_ms(lambda: kinematics._path_length(
+            kinematics._running_mean(xy, offsets, track, window), offsets, track
+        ), repeat),
+        "+ ALH": best_ms(lateral, repeat),
+        "+ BCF": best_ms(lambda: np.bincount(
+            track[1:][(side[1:] * side[:-1] < 0) & (track[1:] == track[:-1])], minlength=len(first)
+        ), repeat),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tracks", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--points", type=int, default=300, help="points per track")
+    parser.add_argument("--window", type=int, default=settings.AVERAGE_PATH_WINDOW)
+    parser.add_argument("--repeat", type=int, default=7, help="runs per timing; the best is reported")
+    args = parser.parse_args()
+
+    frame_rate = float(settings.FRAME_RATE)
+    for tracks in args.tracks:
+        trajectories = population(tracks, args.points, frame_rate)
+        print(f"{tracks} tracks x {args.points} points")
+        for stage, ms in stage_costs(trajectories, args.window, args.repeat).items():
+            print(f"  {stage:<12} {ms:>8.2f} ms")
+        total = best_ms(lambda: kinematics.measure(
+            trajectories, frame_rate, settings.MICRONS_PER_PIXEL, args.window
+        ), args.repeat)
+        loop = best_ms(lambda: [
+            np.hypot(*np.diff(trajectories.points(i)[1], axis=0).T).sum() for i in range(len(trajectories))
+        ], args.repeat)
+        print(f"  {'measure()':<12} {total:>8.2f} ms, all metrics")
+        print(f"  {'per-track':<12} {loop:>8.2f} ms, Python loop for VCL alone")
+
+
+if __name__ == "__main__":
+    main()
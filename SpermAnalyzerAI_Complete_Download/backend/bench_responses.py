@@ -0,0 +1,136 @@
+"""
+Response encoding benchmark for Sperm Analyzer AI
+Times a result endpoint in-process (straight ASGI calls, no network) with
+the stock JSONResponse, a plain dict return (FastAPI's jsonable_encoder
+path), FastJSONResponse, and FastJSONResponse behind CompressionMiddleware
+with gzip and brotli, for results with and without per-track detail.
+
+    python -m backend.bench_responses --tracks 0 50 300 [--gzip-level 6]
+"""
+
+import argparse
+import asyncio
+import time
+from typing import Dict, Tuple
+
+import numpy as np
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+
+from backend.config import settings
+from backend.responses import CompressionMiddleware, FastJSONResponse, brotli
+
+
+def sample_result(tracks: int, points: int = 150, seed: int = 0) -> dict:
+    """A result shaped like the pipeline's, with `tracks` per-track entries"""
+    rng = np.random.default_rng(seed)
+    return {
+        "job_id": "00000000-0000-0000-0000-000000000000",
+        "analysis": {
+            "sperm_count": tracks,
+            "concentration": 42.0,
+            "motility": {"progressive": 40.0, "non_progressive": 20.0, "immotile": 40.0},
+            "velocities": {"vcl": 50.1, "vsl": 30.2, "vap": 35.3},
+            "linearity": 0.6
+        },
+        "tracks": [
+            {
+                "track_id": i,
+                "vcl": float(rng.uniform(0, 200)),
+                "vsl": float(rng.uniform(0, 100)),
+                "alh": float(rng.uniform(0, 5)),
+                "class": "progressive",
+                "path": np.round(rng.uniform(0, 640, (points, 2)), 2).tolist()
+            }
+            for i in range(tracks)
+        ]
+    }
+
+
+def _apps(payload: dict, gzip_level: int, brotli_quality: int) -> Dict[str, FastAPI]:
+    stock = FastAPI(default_response_class=JSONResponse)
+
+    @stock.get("/response")
+    async def stock_response():
+        return JSONResponse(content=payload)
+
+    @stock.get("/dict")
+    async def stock_dict():
+        return payload
+
+    fast = FastAPI(default_response_class=FastJSONResponse)
+
+    @fast.get("/response")
+    async def fast_response():
+        return FastJSONResponse(payload)
+
+    fast.add_middleware(
+        CompressionMiddleware,
+        minimum_size=settings.COMPRESSION_MIN_SIZE,
+        gzip_level=gzip_level,
+        brotli_quality=brotli_quality
+    )
+    return {"stock": stock, "fast": fast}
+
+
+async def _get(app: FastAPI, path: str, accept_encoding: str) -> Tuple[bytes, Dict[str, str]]:
+    """One GET through the ASGI interface; returns (body, headers)"""
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+        "headers": [(b"host", b"bench"), (b"accept-encoding", accept_encoding.encode())],
+        "client": ("127.0.0.1", 1), "server": ("bench", 80),
+    }
+    chunks, headers = [], {}
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            headers.update((k.decode(), v.decode()) for k, v in message["headers"])
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return b"".join(chunks), headers
+
+
+async def _median_ms(app: FastAPI, path: str, accept_encoding: str, repeat: int) -> Tuple[float, int, str]:
+    body, headers = await _get(app, path, accept_encoding)  # warm-up
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await _get(app, path, accept_encoding)
+        timings.append(time.perf_counter() - started)
+    return sorted(timings)[repeat // 2] * 1000, len(body), headers.get("content-encoding", "")
+
+
+async def run(args: argparse.Namespace) -> None:
+    cases = [
+        ("JSONResponse", "stock", "/response", "identity"),
+        ("dict return", "stock", "/dict", "identity"),
+        ("orjson", "fast", "/response", "identity"),
+        ("orjson + gzip", "fast", "/response", "gzip"),
+    ]
+    if brotli is not None:
+        cases.append(("orjson + brotli", "fast", "/response", "br"))
+    print(f"{'tracks':>6} {'encoding':<16} {'median ms':>10} {'body kB':>8}")
+    for tracks in args.tracks:
+        apps = _apps(sample_result(tracks), args.gzip_level, args.brotli_quality)
+        for name, app, path, accept_encoding in cases:
+            ms, size, coding = await _median_ms(apps[app], path, accept_encoding, args.repeat)
+            print(f"{tracks:>6} {name:<16} {ms:>10.2f} {size / 1000:>8.1f} {coding}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tracks", type=int, nargs="+", default=[0, 50, 300], help="per-track entries in the result")
+    parser.add_argument("--repeat", type=int, default=21, help="timed requests per case")
+    parser.add_argument("--gzip-level", type=int, default=settings.GZIP_LEVEL)
+    parser.add_argument("--brotli-quality", type=int, default=settings.BROTLI_QUALITY)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+CASA rollup benchmark for Sperm Analyzer AI
+Fills a scratch database with synthetic completed analyses (through the
+results writer, so the daily rollups are built as in production), then
+times /stats queries against the rollups and against a full scan of the
+analyses table, and the one-off backfill of an existing history.
+
+    python -m backend.bench_stats --analyses 1000000 --database /tmp/bench.db
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+from sqlalchemy import delete, select
+
+from backend.services.analytics import CasaDailyRollup, casa_analytics
+from backend.services.results_db import AnalysisRecord, ResultsStore, record_row
+
+# (query arguments, analyses column for the full-scan baseline)
+QUERIES = [
+    (dict(metric="progressive"), "progressive"),
+    (dict(metric="vcl", group_by="month"), "vcl"),
+    (dict(metric="concentration", group_by="device", histogram=True), "concentration"),
+    (dict(metric="progressive", group_by="technician", since=date(2024, 6, 1), until=date(2025, 1, 1)), "progressive"),
+    (dict(metric="vsl", group_by="day"), "vsl"),
+]
+
+
+def _analysis(rng: random.Random) -> dict:
+    progressive = rng.uniform(0, 80)
+    non_progressive = rng.uniform(0, 100 - progressive)
+    return {"analysis": {
+        "sperm_count": rng.randint(10, 400),
+        "concentration": rng.lognormvariate(3.5, 0.6),
+        "motility": {
+            "progressive": progressive,
+            "non_progressive": non_progressive,
+            "immotile": 100 - progressive - non_progressive
+        },
+        "velocities": {"vcl": rng.gauss(90, 25), "vsl": rng.gauss(40, 12), "vap": rng.gauss(55, 15)},
+        "linearity": rng.uniform(20, 80),
+        "morphology": {"normal": rng.uniform(0, 15), "abnormal": None}
+    }}
+
+
+async def _fill(store: ResultsStore, analyses: int, devices: int, technicians: int, chunk: int = 10_000) -> float:
+    """Write `analyses` rows spread evenly over 2024-2025; returns seconds taken"""
+    rng = random.Random(0)
+    start = datetime(2024, 1, 1)
+    started = time.perf_counter()
+    for first in range(0, analyses, chunk):
+        rows = [
+            record_row(
+                f"{i:036d}", "completed", _analysis(rng),
+                created_at=start + timedelta(days=730) * (i / analyses),
+                device_id=f"device-{i % devices}",
+                technician_id=f"technician-{i % technicians}"
+            )
+            for i in range(first, min(first + chunk, analyses))
+        ]
+        await store._write(rows)
+    return time.perf_counter() - started
+
+
+def _percentiles_ms(samples):
+    samples = sorted(samples)
+    return samples[len(samples) // 2] * 1000, samples[int(0.95 * (len(samples) - 1))] * 1000
+
+
+async def _time_queries(store: ResultsStore, repeat: int, scan: bool) -> None:
+    table = AnalysisRecord.__table__
+    print(f"{'query':<90} {'p50 ms':>8} {'p95 ms':>8} {'scan ms':>8} {'p50 error':>10}")
+    for arguments, column in QUERIES:
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            answer = await casa_analytics.query(store.engine, **arguments)
+            timings.append(time.perf_counter() - started)
+        p50, p95 = _percentiles_ms(timings)
+
+        overall = await casa_analytics.query(store.engine, **{**arguments, "group_by": "none"})
+        scan_ms = error = float("nan")
+        if scan:
+            # Baseline: read every matching value and let NumPy answer (ungrouped)
+            query = select(table.c[column]).where(table.c.status == "completed")
+            if "since" in arguments:
+                query = query.where(table.c.created_at >= datetime.combine(arguments["since"], datetime.min.time()))
+                query = query.where(table.c.created_at < datetime.combine(arguments["until"], datetime.min.time()))
+            started = time.perf_counter()
+            async with store.engine.connect() as conn:
+                values = np.array([value for (value,) in await conn.execute(query)], dtype=np.float64)
+            exact = float(np.percentile(values, 50))
+            scan_ms = (time.perf_counter() - started) * 1000
+            error = abs(overall["groups"][0]["percentiles"]["p50"] - exact)
+        label = ", ".join(f"{key}={value}" for key, value in arguments.items())
+        print(f"{label:<90} {p50:>8.1f} {p95:>8.1f} {scan_ms:>8.1f} {error:>10.3f}   ({len(answer['groups'])} groups)")
+
+
+async def run(args: argparse.Namespace) -> None:
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(args.database + suffix):
+            os.remove(args.database + suffix)
+    store = ResultsStore(f"sqlite:///{args.database}", pool_size=5, batch_size=10_000, flush_interval=0.5)
+    await store.start()
+    store.write_hooks.append(casa_analytics.apply)
+    try:
+        seconds = await _fill(store, args.analyses, args.devices, args.technicians)
+        print(f"{args.analyses} analyses written with rollups in {seconds:.1f} s")
+        await _time_queries(store, args.repeat, not args.skip_scan)
+
+        async with store.engine.begin() as conn:
+            await conn.execute(delete(CasaDailyRollup.__table__))
+        started = time.perf_counter()
+        folded = await casa_analytics.backfill(store.engine)
+        print(f"backfill of {folded} analyses: {time.perf_counter() - started:.1f} s")
+    finally:
+        await store.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--analyses", type=int, default=100_000)
+    parser.add_argument("--devices", type=int, default=5)
+    parser.add_argument("--technicians", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=50, help="timed runs per query")
+    parser.add_argument("--skip-scan", action="store_true", help="skip the full-scan baseline, slow on large tables")
+    parser.add_argument("--database", default="bench_stats.db", help="scratch SQLite file, replaced on each run")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,7 @@ Configuration settings for Sperm Analyzer AI Backend
 """
 
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import Dict, Optional
 
 class Settings(BaseSettings):
     # Server settings
@@ -22,20 +22,85 @@ class Settings(BaseSettings):
     
     # Database
     DATABASE_URL: str = "sqlite:///./sperm_analyzer.db"
+    DB_POOL_SIZE: int = 5
+    DB_WRITE_BATCH: int = 200  # rows per write transaction
+    DB_FLUSH_INTERVAL: float = 0.5  # seconds a queued row may wait for its batch to fill
+    
+    # Responses
+    COMPRESSION_MIN_SIZE: int = 1024  # bytes; smaller bodies are sent uncompressed
+    GZIP_LEVEL: int = 1  # level 6 is ~7x slower for ~15% smaller results
+    BROTLI_QUALITY: int = 3  # 0-11; used when the brotli package is installed
     
     # AI Models
     YOLO_MODEL_PATH: str = "models/yolov8n.pt"
+    MODEL_DIR: str = "models"  # the only place /models may load new versions from
+    ADMIN_TOKEN: Optional[str] = None  # X-Admin-Token for /models; unset disables the endpoints
     DETECTION_CONFIDENCE: float = 0.5
+    MORPHOLOGY_MODEL_PATH: Optional[str] = None  # head-crop classifier; unset keeps the calculator's morphology
+    MORPHOLOGY_INPUT_SIZE: int = 64
+    MORPHOLOGY_BATCH_SIZE: int = 64  # crops per classifier call
+    MORPHOLOGY_CROP_SIZE: int = 48  # px around each head, at detector-input resolution
+    MORPHOLOGY_CANDIDATES: int = 8  # frames per track scored for sharpness
+    MORPHOLOGY_CROPS_PER_TRACK: int = 2  # sharpest crops classified per track
+    MORPHOLOGY_FRAME_STEP: int = 15  # candidate frames lie on this grid so tracks share decodes
     TRACKING_MAX_AGE: int = 30
+    TRACKING_MAX_DISTANCE: float = 20.0  # native px per frame a cell may move, for running estimates
+    MODEL_INPUT_SIZE: int = 640  # detector input is MODEL_INPUT_SIZE x MODEL_INPUT_SIZE, letterboxed
+    MODEL_COLOR_MODE: str = "bgr"  # "bgr" or "gray"
+    MODEL_WARMUP_RUNS: int = 2  # inferences on a blank frame before a new model version goes live
+    
+    # Worker processes
+    WORKERS: int = 1  # uvicorn worker processes started by `python backend/main.py`; >1 disables reload, see README
+    INTRAOP_THREADS: Optional[int] = None  # torch threads within one op; None keeps library defaults
+    INTEROP_THREADS: Optional[int] = None  # torch threads running independent ops
+    OPENCV_THREADS: Optional[int] = None  # 0 runs OpenCV single-threaded
+    BLAS_THREADS: Optional[int] = None  # OpenBLAS/MKL/OpenMP under NumPy; defaults to INTRAOP_THREADS
+    CPU_AFFINITY: bool = False  # pin each worker to a disjoint share of the CPUs; unset thread counts fit the share
     
     # File upload
     MAX_FILE_SIZE: int = 100 * 1024 * 1024  # 100MB
     UPLOAD_DIR: str = "uploads"
+    BATCH_MAX_FILES: int = 20  # fields of view per batch request
+    BATCH_CONCURRENCY: int = 4
+    UPLOAD_SESSION_TTL: int = 24 * 60 * 60  # seconds an unfinished resumable upload is kept
+    UPLOAD_RETENTION_TTL: int = 7 * 24 * 60 * 60  # seconds since last access before a blob is deleted
+    UPLOAD_QUOTA_BYTES: int = 20 * 1024 * 1024 * 1024  # 20GB; least recently used blobs go first
+    RETENTION_INTERVAL: int = 10 * 60  # seconds between garbage-collection passes
+    TRACKS_RETENTION_TTL: int = 30 * 24 * 60 * 60  # seconds since last read before a job's trajectories are deleted
+    TRACKS_QUOTA_BYTES: int = 2 * 1024 * 1024 * 1024  # 2GB; least recently read trajectories go first
+    
+    # Analysis jobs
+    PROGRESS_INTERVAL: float = 0.5  # seconds between job progress events
+    SSE_KEEPALIVE: int = 15  # seconds between keep-alive comments on idle event streams
+    LONG_POLL_MAX: int = 60  # longest ?wait= a job status request may be held for
+    QUICK_PASS_SECONDS: float = 2.0  # length of clip used for the progressive first pass
+    QUICK_PASS_SCALE: float = 0.5  # fraction of MODEL_INPUT_SIZE used for the first pass
+    MAX_CONCURRENT_ANALYSES: int = 4  # per worker process
+    ANALYSIS_QUEUE_SIZE: int = 16  # analyses waiting for a slot before new ones get 503
+    CHECKPOINT_INTERVAL: float = 30.0  # seconds of video work between job checkpoints
+    PRIORITY_AGING_SECONDS: float = 30.0  # waiting this long promotes a job one priority lane
+    TENANT_WEIGHTS: Dict[str, float] = {}  # fair-share weight per tenant ("key:<sha256[:12]>" or "host:<addr>"), default 1
     
     # CASA parameters
     FRAME_RATE: int = 30
     MICRONS_PER_PIXEL: float = 0.5
     CHAMBER_DEPTH: float = 20.0  # micrometers
+    AVERAGE_PATH_WINDOW: int = 5  # points in the moving average that defines the average path (VAP, ALH, BCF)
+    DECODE_BATCH_SIZE: int = 32  # frames decoded per batch in the video pipeline
+    EARLY_STOP_ENABLED: bool = True  # stop a clip once motility estimates converge
+    EARLY_STOP_TOLERANCE: float = 5.0  # max 95% CI half-width, percentage points
+    EARLY_STOP_MIN_CELLS: int = 200  # WHO count; enough tracked cells to stop regardless
+    EARLY_STOP_MIN_SECONDS: float = 3.0  # never stop before this much of the clip
+    EARLY_STOP_CHECK_SECONDS: float = 1.0  # clip time between convergence checks
+    QC_MIN_SHARPNESS: float = 5.0  # variance of Laplacian, 8-bit grey at 1/QC_DOWNSCALE size; 0 disables
+    QC_MAX_CLIPPED: float = 0.5  # fraction of pixels at 0-2 or 253-255; 0 disables
+    QC_MAX_DRIFT: float = 20.0  # whole-field shift in detector-input pixels per frame; 0 disables
+    QC_DOWNSCALE: int = 4  # quality checks run on frames shrunk by this factor
+    
+    # Live analysis (WebSocket)
+    LIVE_WINDOW_FRAMES: int = 90  # frames of track history each update is computed over
+    LIVE_MAX_SESSIONS: int = 2  # concurrent live sessions per worker; more are closed with 1013
+    LIVE_UPDATE_INTERVAL: float = 0.25  # seconds between pushed updates
     
     class Config:
         env_file = ".env"
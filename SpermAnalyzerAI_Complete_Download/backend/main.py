@@ -3,22 +3,28 @@ Sperm Analyzer AI - FastAPI Backend
 Main application entry point
 """
 
-from fastapi import FastAPI, File, UploadFile, HTTPException, Depends
+from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
 import uvicorn
 import os
-from pathlib import Path
 import asyncio
 from datetime import datetime
+from typing import List, Optional
 import uuid
 
 from backend.config import settings
-from backend.routes import analysis, health
-from backend.services.video_processor import VideoProcessor
-from backend.services.sperm_detector import SpermDetector
-from backend.services.sperm_tracker import SpermTracker
-from backend.services.casa_calculator import CASACalculator
+from backend.responses import CompressionMiddleware, FastJSONResponse
+from backend.routes import analysis, blobs, health, history, jobs, live, metrics, models, stats, uploads
+from backend.services.analytics import casa_analytics
+from backend.services.admission import Overloaded, Priority, admission, tenant_for
+from backend.services.blob_store import blob_store
+from backend.services.job_manager import job_manager
+from backend.services.pipeline import (
+    is_still_image, pool_fields, resume_interrupted_jobs, run_analysis, submit_analysis
+)
+from backend.services.results_db import record_row, results_store
+from backend.services.retention import retention
+from backend.services.worker_tuning import ThreadConfig, configure_worker, thread_env, worker_config
 
 # Create FastAPI app
 app = FastAPI(
@@ -26,7 +32,8 @@ app = FastAPI(
     description="AI-powered sperm analysis system",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    default_response_class=FastJSONResponse
 )
 
 # CORS middleware
@@ -38,15 +45,51 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress large bodies (results with per-track detail) for slow mobile links
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=settings.COMPRESSION_MIN_SIZE,
+    gzip_level=settings.GZIP_LEVEL,
+    brotli_quality=settings.BROTLI_QUALITY
+)
+
 # Include routers
 app.include_router(analysis.router, prefix="/api/v1")
 app.include_router(health.router, prefix="/api/v1")
+app.include_router(uploads.router, prefix="/api/v1")
+app.include_router(jobs.router, prefix="/api/v1")
+app.include_router(blobs.router, prefix="/api/v1")
+app.include_router(metrics.router, prefix="/api/v1")
+app.include_router(live.router, prefix="/api/v1")
+app.include_router(history.router, prefix="/api/v1")
+app.include_router(stats.router, prefix="/api/v1")
+app.include_router(models.router, prefix="/api/v1")
+
+@app.exception_handler(Overloaded)
+async def overloaded_handler(request: Request, exc: Overloaded):
+    """Shed load with 503 instead of letting every request slow down"""
+    return FastJSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+@app.on_event("startup")
+async def start_background_tasks():
+    """Size this worker's thread pools, start retention and the results writer, then requeue interrupted jobs"""
+    worker_config.update(configure_worker())
+    retention.start()
+    await results_store.start()
+    results_store.write_hooks.append(casa_analytics.apply)
+    await casa_analytics.backfill(results_store.engine)
+    job_manager.on_finished.append(results_store.record_job)
+    resume_interrupted_jobs()
 
-# Initialize services
-video_processor = VideoProcessor()
-sperm_detector = SpermDetector()
-sperm_tracker = SpermTracker()
-casa_calculator = CASACalculator()
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    """Stop upload retention, persist buffered access times and queued results"""
+    await retention.stop()
+    await results_store.stop()
 
 @app.get("/")
 async def root():
@@ -60,74 +103,174 @@ async def root():
     }
 
 @app.post("/analyze")
-async def analyze_sample(file: UploadFile = File(...)):
-    """Main analysis endpoint"""
+async def analyze_sample(
+    request: Request,
+    file: UploadFile = File(...),
+    progressive: bool = False,
+    budget: Optional[float] = Query(None, gt=0, description="Time budget in seconds"),
+    priority: Priority = Priority.routine,
+    patient_id: Optional[str] = Query(None, max_length=64),
+    sample_id: Optional[str] = Query(None, max_length=64),
+    device_id: Optional[str] = Query(None, max_length=64),
+    technician_id: Optional[str] = Query(None, max_length=64)
+):
+    """Main analysis endpoint
+    
+    With `progressive=true`, videos answer 202 as soon as a quick estimate
+    is ready; the full result follows on /api/v1/jobs/{job_id}. With
+    `budget`, video analysis degrades as needed to finish within it.
+    Results are kept in the history under `patient_id`/`sample_id`;
+    `device_id`/`technician_id` group them in /api/v1/stats.
+    """
+    ticket = admission.admit(priority, tenant_for(request.headers.get("X-API-Key"), request.client and request.client.host))
     try:
         # Generate job ID
         job_id = str(uuid.uuid4())
+        created_at = datetime.now()
         
-        # Save uploaded file
-        upload_dir = Path("uploads")
-        upload_dir.mkdir(exist_ok=True)
+        sha256, content = await _save_upload(file)
+        still = is_still_image(file.filename, file.content_type)
         
-        file_path = upload_dir / f"{job_id}_{file.filename}"
+        if progressive and not still:
+            job = submit_analysis(
+                job_id, file.filename, sha256, still,
+                progressive=True, budget=budget, ticket=ticket,
+                patient_id=patient_id, sample_id=sample_id,
+                device_id=device_id, technician_id=technician_id
+            )
+            while job.preliminary is None and not job.finished:
+                await job.wait_for_change(job.version)
+            return FastJSONResponse(status_code=202, content=job.to_dict())
         
-        with open(file_path, "wb") as buffer:
-            content = await file.read()
-            buffer.write(content)
+        async with ticket:
+            results = await run_analysis(job_id, file.filename, sha256, still, content, budget=budget)
+        results_store.record(record_row(
+            job_id, "completed", results, created_at=created_at, filename=file.filename,
+            patient_id=patient_id, sample_id=sample_id,
+            device_id=device_id, technician_id=technician_id
+        ))
         
-        # Process video/image
-        frames = await video_processor.extract_frames(file_path)
+        return FastJSONResponse(content=results)
         
-        # Detect sperm
-        detections = []
-        for frame in frames:
-            detection = await sperm_detector.detect(frame)
-            detections.append(detection)
+    except HTTPException:
+        ticket.cancel()
+        raise
+    except Exception as e:
+        ticket.cancel()
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post(f"{settings.API_V1_STR}/analyze/batch")
+async def analyze_batch(
+    request: Request,
+    files: List[UploadFile] = File(...),
+    priority: Priority = Priority.routine,
+    patient_id: Optional[str] = Query(None, max_length=64),
+    sample_id: Optional[str] = Query(None, max_length=64),
+    device_id: Optional[str] = Query(None, max_length=64),
+    technician_id: Optional[str] = Query(None, max_length=64)
+):
+    """Analyze several fields of view of one sample in a single request
+    
+    Up to BATCH_CONCURRENCY fields run at once on the shared detector, but
+    each field still sends its frames to the detector one at a time: the
+    detector interface takes a single frame, so frames of different fields
+    are not combined into one inference batch.
+    
+    A field that fails is listed with its error and left out of the
+    summary, and the batch status is "partial". The request fails only if
+    every field does.
+    """
+    if len(files) > settings.BATCH_MAX_FILES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {settings.BATCH_MAX_FILES} files per batch"
+        )
+    # Refuse the whole batch before any field is stored or analyzed
+    for file in files:
+        _check_size(file, file.size)
+    
+    # Every field counts against the worker's limit; admit the batch whole or not at all
+    tickets = admission.admit_many(len(files), priority, tenant_for(request.headers.get("X-API-Key"), request.client and request.client.host))
+    try:
+        sample_id = sample_id or str(uuid.uuid4())
+        limiter = asyncio.Semaphore(settings.BATCH_CONCURRENCY)
         
-        # Track sperm movement
-        tracks = await sperm_tracker.track(detections)
+        async def analyze_field(file: UploadFile, ticket) -> dict:
+            async with limiter, ticket:
+                job_id = str(uuid.uuid4())
+                created_at = datetime.now()
+                sha256, content = await _save_upload(file)
+                still = is_still_image(file.filename, file.content_type)
+                results = await run_analysis(job_id, file.filename, sha256, still, content)
+                results_store.record(record_row(
+                    job_id, "completed", results, created_at=created_at, filename=file.filename,
+                    patient_id=patient_id, sample_id=sample_id,
+                    device_id=device_id, technician_id=technician_id
+                ))
+                return results
         
-        # Calculate CASA metrics
-        casa_metrics = await casa_calculator.calculate(tracks)
+        # A failed field is reported in its place; the others are still pooled
+        outcomes = await asyncio.gather(
+            *(analyze_field(file, ticket) for file, ticket in zip(files, tickets)),
+            return_exceptions=True
+        )
+        fields, completed = [], []
+        for file, outcome in zip(files, outcomes):
+            if isinstance(outcome, BaseException):
+                if not isinstance(outcome, Exception):
+                    raise outcome
+                fields.append({
+                    "filename": file.filename,
+                    "status": "failed",
+                    "status_code": outcome.status_code if isinstance(outcome, HTTPException) else 500,
+                    "error": outcome.detail if isinstance(outcome, HTTPException) else str(outcome)
+                })
+            else:
+                fields.append(outcome)
+                completed.append(outcome)
+        if not completed:
+            raise outcomes[0]
         
-        # Prepare results
-        results = {
-            "job_id": job_id,
+        return FastJSONResponse(content={
+            "sample_id": sample_id,
             "timestamp": datetime.now().isoformat(),
-            "filename": file.filename,
-            "analysis": {
-                "sperm_count": casa_metrics["count"],
-                "concentration": casa_metrics["concentration"],
-                "motility": {
-                    "progressive": casa_metrics["progressive_motility"],
-                    "non_progressive": casa_metrics["non_progressive_motility"],
-                    "immotile": casa_metrics["immotile"]
-                },
-                "velocities": {
-                    "vcl": casa_metrics["vcl"],
-                    "vsl": casa_metrics["vsl"],
-                    "vap": casa_metrics["vap"]
-                },
-                "linearity": casa_metrics["linearity"],
-                "morphology": {
-                    "normal": casa_metrics["normal_morphology"],
-                    "abnormal": casa_metrics["abnormal_morphology"]
-                }
-            },
-            "processing_time": casa_metrics["processing_time"],
-            "status": "completed"
-        }
-        
-        return JSONResponse(content=results)
+            "fields": fields,
+            "summary": pool_fields(completed),
+            "status": "completed" if len(completed) == len(fields) else "partial"
+        })
         
+    except HTTPException:
+        for ticket in tickets:
+            ticket.cancel()
+        raise
     except Exception as e:
+        for ticket in tickets:
+            ticket.cancel()
         raise HTTPException(status_code=500, detail=str(e))
 
+def _check_size(file: UploadFile, size: Optional[int]) -> None:
+    if size is not None and size > settings.MAX_FILE_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"{file.filename} is larger than {settings.MAX_FILE_SIZE} bytes"
+        )
+
+async def _save_upload(file: UploadFile):
+    """Persist an upload in the blob store; returns (sha256, content)"""
+    # One byte past the limit is enough to tell an oversized file
+    content = await file.read(settings.MAX_FILE_SIZE + 1)
+    _check_size(file, len(content))
+    sha256, _ = await asyncio.to_thread(blob_store.put_bytes, content)
+    return sha256, content
+
 if __name__ == "__main__":
+    # Inherited by the workers, so BLAS pools are sized before NumPy loads there
+    os.environ.update(thread_env(ThreadConfig.from_settings()))
     uvicorn.run(
         "main:app",
         host=settings.HOST,
         port=settings.PORT,
-        reload=settings.DEBUG
+        # uvicorn ignores `workers` when reloading, so reload only runs single-process
+        reload=settings.DEBUG and settings.WORKERS == 1,
+        workers=settings.WORKERS
     )
@@ -0,0 +1,156 @@
+"""
+HTTP responses for Sperm Analyzer AI
+JSON is rendered with orjson (NumPy values included) and large bodies are
+compressed with brotli or gzip, whichever the client prefers.
+"""
+
+import asyncio
+import gzip
+from typing import Any, List, Optional, Tuple
+
+import orjson
+from fastapi.responses import JSONResponse, Response
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+_CODINGS = ("br", "gzip")
+_COMPRESSIBLE = ("application/json", "application/vnd.apache.arrow.stream", "text/")
+# Bodies above this are compressed off the event loop
+_THREAD_THRESHOLD = 256 * 1024
+
+
+def dumps(content: Any) -> bytes:
+    """orjson encoding used by every JSON body; NumPy arrays and scalars serialize natively
+
+    Unlike the standard encoder, NaN and infinity become null.
+    """
+    return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered by orjson (see dumps())"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+def parse_accept(header: str) -> List[Tuple[str, float]]:
+    """(value, q) pairs of an Accept or Accept-Encoding header, in header order"""
+    accepted = []
+    for part in header.split(","):
+        value, *params = [item.strip() for item in part.split(";")]
+        q = 1.0
+        for param in params:
+            name, _, number = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(number)
+                except ValueError:
+                    q = 0.0
+        if value:
+            accepted.append((value.lower(), q))
+    return accepted
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """"br" or "gzip" per the client's Accept-Encoding, else None"""
+    offered = ("br", "gzip") if brotli is not None else ("gzip",)
+    best, best_q = None, 0.0
+    for coding, q in parse_accept(accept_encoding):
+        for offer in offered:
+            if coding in (offer, "*") and q > best_q:
+                best, best_q = offer, q
+                break
+    return best
+
+
+def etag_match(if_none_match: Optional[str], etag: str) -> Optional[str]:
+    """The If-None-Match entry naming `etag` (or its compressed variant), if any"""
+    if not if_none_match:
+        return None
+    if if_none_match.strip() == "*":
+        return etag
+    base = etag[:-1] + "-"
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        # If-None-Match uses weak comparison
+        opaque = tag[2:] if tag.startswith("W/") else tag
+        if opaque == etag or (opaque.startswith(base) and opaque[len(base):-1] in _CODINGS):
+            return tag
+    return None
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+
+def compress(body: bytes, encoding: str, gzip_level: int = 1, brotli_quality: int = 3) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=brotli_quality)
+    return gzip.compress(body, compresslevel=gzip_level, mtime=0)
+
+
+class CompressionMiddleware:
+    """Compress complete response bodies of at least `minimum_size` bytes
+
+    Streaming responses (SSE, chunked downloads) and bodies that already
+    carry a Content-Encoding pass through untouched. A strong ETag gets the
+    coding appended; etag_match() accepts either form.
+    """
+
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, gzip_level: int = 1, brotli_quality: int = 3):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start: Optional[Message] = None
+
+        async def send_compressed(message: Message) -> None:
+            nonlocal start
+            if message["type"] == "http.response.start":
+                # Held back until the first body chunk shows whether the body is complete
+                start = message
+                return
+            if start is None:
+                await send(message)
+                return
+            headers = MutableHeaders(raw=start["headers"])
+            body = message.get("body", b"")
+            if (
+                not message.get("more_body", False)
+                and len(body) >= self.minimum_size
+                and "content-encoding" not in headers
+                and headers.get("content-type", "").startswith(_COMPRESSIBLE)
+            ):
+                if len(body) >= _THREAD_THRESHOLD:
+                    body = await asyncio.to_thread(compress, body, encoding, self.gzip_level, self.brotli_quality)
+                else:
+                    body = compress(body, encoding, self.gzip_level, self.brotli_quality)
+                headers["Content-Encoding"] = encoding
+                etag = headers.get("etag")
+                if etag and etag.startswith('"'):
+                    # A strong validator must differ per content coding
+                    headers["ETag"] = f'{etag[:-1]}-{encoding}"'
+                headers["Content-Length"] = str(len(body))
+                headers.add_vary_header("Accept-Encoding")
+                message = {**message, "body": body}
+            await send(start)
+            start = None
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,70 @@
+"""
+Content-addressed blob endpoints
+Clients check for an existing SHA-256 before uploading and analyze by hash
+"""
+
+import uuid
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Request, Response
+from pydantic import BaseModel, Field
+
+from backend.services.admission import Priority, admission, tenant_for
+from backend.services.blob_store import InvalidDigest, blob_store
+from backend.services.pipeline import is_still_image, submit_analysis
+
+router = APIRouter(prefix="/blobs", tags=["blobs"])
+
+
+class BlobAnalysis(BaseModel):
+    filename: Optional[str] = None
+    content_type: Optional[str] = None
+    progressive: bool = False
+    budget: Optional[float] = Field(None, gt=0)  # seconds
+    priority: Priority = Priority.routine
+    patient_id: Optional[str] = Field(None, max_length=64)
+    sample_id: Optional[str] = Field(None, max_length=64)
+    device_id: Optional[str] = Field(None, max_length=64)
+    technician_id: Optional[str] = Field(None, max_length=64)
+
+
+def _stored_size(sha256: str) -> int:
+    try:
+        size = blob_store.size(sha256)
+    except InvalidDigest as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if size is None:
+        raise HTTPException(status_code=404, detail=f"Blob {sha256} not found")
+    return size
+
+
+@router.head("/{sha256}")
+async def head_blob(sha256: str):
+    """200 if the server already holds these bytes, 404 otherwise"""
+    size = _stored_size(sha256)
+    # A hit means the client is about to reference it; keep it off the eviction list
+    blob_store.touch(sha256)
+    return Response(status_code=200, headers={"Content-Length": str(size), "ETag": f'"{sha256.lower()}"'})
+
+
+@router.post("/{sha256}/analyze", status_code=202)
+async def analyze_blob(sha256: str, request: Request, body: Optional[BlobAnalysis] = None):
+    """Queue an analysis of a stored blob without re-uploading it"""
+    _stored_size(sha256)
+    body = body or BlobAnalysis()
+    sha256 = sha256.lower()
+
+    job_id = str(uuid.uuid4())
+    filename = body.filename or sha256
+    still = is_still_image(body.filename, body.content_type)
+    job = submit_analysis(
+        job_id, filename, sha256, still,
+        progressive=body.progressive,
+        budget=body.budget,
+        patient_id=body.patient_id,
+        sample_id=body.sample_id,
+        device_id=body.device_id,
+        technician_id=body.technician_id,
+        ticket=admission.admit(body.priority, tenant_for(request.headers.get("X-API-Key"), request.client and request.client.host)),
+    )
+    return {**job.to_dict(), "sha256": sha256}
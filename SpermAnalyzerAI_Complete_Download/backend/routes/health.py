@@ -0,0 +1,22 @@
+"""
+Health check endpoint
+"""
+
+from datetime import datetime
+
+from fastapi import APIRouter
+
+from backend.services.admission import admission
+
+router = APIRouter(tags=["health"])
+
+
+@router.get("/health")
+async def health():
+    """Liveness plus how much analysis work this worker has queued"""
+    stats = admission.stats
+    return {
+        "status": "busy" if stats["queued"] >= stats["max_queue"] else "healthy",
+        "timestamp": datetime.now().isoformat(),
+        "admission": stats,
+    }
@@ -0,0 +1,52 @@
+"""
+Analysis history endpoints
+"""
+
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request
+
+from backend.responses import FastJSONResponse, etag_match, not_modified
+from backend.services.results_db import MAX_PAGE_SIZE, results_store, stored_etag
+
+router = APIRouter(prefix="/analyses", tags=["history"])
+
+
+@router.get("")
+async def list_analyses(
+    patient_id: Optional[str] = None,
+    sample_id: Optional[str] = None,
+    status: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+):
+    """Stored analyses, newest first; pass `next_cursor` back to page on"""
+    try:
+        items, next_cursor = await results_store.history(
+            patient_id=patient_id,
+            sample_id=sample_id,
+            status=status,
+            since=since,
+            until=until,
+            limit=limit,
+            cursor=cursor,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return FastJSONResponse({"items": items, "next_cursor": next_cursor})
+
+
+@router.get("/{job_id}")
+async def get_analysis(job_id: str, request: Request):
+    """One stored analysis with its full result; honours If-None-Match"""
+    record = await results_store.get(job_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail=f"Analysis {job_id} not found")
+    etag = stored_etag(record)
+    matched = etag_match(request.headers.get("if-none-match"), etag)
+    if matched:
+        return not_modified(matched)
+    return FastJSONResponse(record, headers={"ETag": etag, "Cache-Control": "no-cache"})
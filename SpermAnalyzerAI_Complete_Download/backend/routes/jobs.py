@@ -0,0 +1,158 @@
+"""
+Analysis job endpoints
+"""
+
+import asyncio
+from typing import List
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import Response, StreamingResponse
+
+from backend.config import settings
+from backend.responses import FastJSONResponse, dumps, etag_match, not_modified, parse_accept
+from backend.services import trajectories
+from backend.services.job_manager import Job, job_manager
+from backend.services.results_db import results_store, stored_etag
+from backend.services.trajectories import trajectory_store
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+
+def _get_job(job_id: str) -> Job:
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
+
+
+@router.get("/{job_id}")
+async def get_job(
+    job_id: str,
+    request: Request,
+    wait: float = Query(0, ge=0, le=settings.LONG_POLL_MAX, description="Long-poll seconds"),
+):
+    """Status and, once completed, results of an analysis job
+
+    Jobs no longer held in memory (e.g. after a restart) come from the history.
+    Responses carry an ETag; while If-None-Match still names the current
+    state the answer is 304. With `wait`, that 304 is held back until the
+    job changes (then 200 with the new state) or the wait runs out.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    job = job_manager.get(job_id)
+    if job is None:
+        record = await results_store.get(job_id)
+        if record is None:
+            raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+        etag = stored_etag(record)
+        matched = etag_match(if_none_match, etag)
+        if matched:
+            return not_modified(matched)
+        return FastJSONResponse(record, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+    version = job.version
+    matched = etag_match(if_none_match, job.etag)
+    if matched and wait and not job.finished and await job.wait_for_change(version, timeout=wait):
+        matched = None
+    if matched:
+        return not_modified(matched)
+    # Returned as a response so results skip FastAPI's jsonable_encoder pass
+    return FastJSONResponse(job.to_dict(), headers={"ETag": job.etag, "Cache-Control": "no-cache"})
+
+
+@router.delete("/{job_id}")
+async def delete_job(job_id: str):
+    """Cancel a queued or running job, or forget a finished one
+
+    202 while a running job winds down (it stops within about one batch);
+    200 with the final state otherwise.
+    """
+    job = _get_job(job_id)
+    if job.finished:
+        job_manager.forget(job_id)
+        return job.to_dict()
+    job_manager.cancel(job_id)
+    return FastJSONResponse(status_code=202, content=job.to_dict())
+
+
+def _negotiate(accept: str, offered: List[str]) -> str:
+    """Best of `offered` for an Accept header; the first offer wins ties"""
+    best, best_q = None, 0.0
+    for media_type, q in parse_accept(accept or "*/*"):
+        for offer in offered:
+            if media_type in (offer, "*/*", offer.split("/")[0] + "/*") and q > best_q:
+                best, best_q = offer, q
+                break
+    if best is None:
+        raise HTTPException(status_code=406, detail=f"Trajectories are available as {', '.join(offered)}")
+    return best
+
+
+@router.get("/{job_id}/tracks")
+async def job_tracks(
+    job_id: str,
+    request: Request,
+    tolerance: float = Query(0.0, ge=0, le=50, description="Douglas-Peucker tolerance in pixels"),
+):
+    """Per-track trajectories of a finished video analysis
+
+    Chosen by Accept: NumPy .npz (default), Arrow IPC stream (if pyarrow
+    is installed) or JSON. The binary forms hold each track's first point
+    in `frame0`/`xy0` and the rest as uint16 frame and int16 coordinate
+    deltas, in 1/`scale` pixel units.
+    """
+    offered = [trajectories.NPZ_MEDIA_TYPE]
+    if trajectories.pa is not None:
+        offered.append(trajectories.ARROW_MEDIA_TYPE)
+    offered.append(trajectories.JSON_MEDIA_TYPE)
+    media_type = _negotiate(request.headers.get("accept"), offered)
+
+    tracks = await asyncio.to_thread(trajectory_store.load, job_id)
+    if tracks is None:
+        raise HTTPException(status_code=404, detail=f"No trajectories for job {job_id}")
+
+    def encode() -> bytes:
+        if media_type == trajectories.JSON_MEDIA_TYPE:
+            return trajectories.to_json(tracks, tolerance)
+        columns = trajectories.delta_encode(tracks, tolerance)
+        if media_type == trajectories.ARROW_MEDIA_TYPE:
+            return trajectories.to_arrow(columns)
+        return trajectories.to_npz(columns)
+
+    return Response(await asyncio.to_thread(encode), media_type=media_type, headers={"Vary": "Accept"})
+
+
+@router.get("/{job_id}/events")
+async def job_events(job_id: str, request: Request):
+    """Server-Sent Events stream of a job's progress until it finishes"""
+    job = _get_job(job_id)
+
+    def event(name: str, data) -> bytes:
+        # Encoded like the JSON endpoints, so NumPy values in results serialize
+        return b"event: " + name.encode() + b"\ndata: " + dumps(data) + b"\n\n"
+
+    async def stream():
+        version = -1
+        sent_preliminary = False
+        while True:
+            if job.version != version:
+                version = job.version
+                if job.preliminary is not None and not sent_preliminary:
+                    sent_preliminary = True
+                    yield event("preliminary", job.preliminary)
+                if job.finished:
+                    yield event(job.status, job.to_dict())
+                    return
+                payload = {"job_id": job.job_id, "status": job.status, **job.progress}
+                yield event("progress", payload)
+            elif await request.is_disconnected():
+                return
+            elif not await job.wait_for_change(version, timeout=settings.SSE_KEEPALIVE):
+                yield b": keep-alive\n\n"
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        # nginx in front of the backend must not buffer the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
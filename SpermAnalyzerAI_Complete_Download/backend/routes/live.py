@@ -0,0 +1,152 @@
+"""
+Live analysis over WebSocket
+The client streams JPEG frames as binary messages while positioning the
+slide; partial counts and motility are pushed back several times a second.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Optional
+
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+
+from backend.config import settings
+from backend.responses import dumps
+from backend.services.model_registry import DETECTOR, model_registry
+from backend.services.online_tracker import OnlineTracker
+from backend.services.pipeline import casa_calculator, native_detections, processor_for, video_processor
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(tags=["live"])
+
+# Sessions open in this worker; each one runs the detector on every frame it keeps
+_active_sessions = 0
+
+
+class LatestFrame:
+    """Single-slot mailbox between the socket reader and the detector
+
+    A frame that arrives while the previous one is still waiting replaces
+    it and is counted as dropped, so latency stays at one frame of work
+    instead of a growing queue.
+    """
+
+    def __init__(self):
+        self._data: Optional[bytes] = None
+        self._ready = asyncio.Event()
+        self.closed = False
+        self.received = 0
+        self.dropped = 0
+
+    def put(self, data: bytes) -> None:
+        self.received += 1
+        if self._data is not None:
+            self.dropped += 1
+        self._data = data
+        self._ready.set()
+
+    def close(self) -> None:
+        self.closed = True
+        self._ready.set()
+
+    async def get(self) -> Optional[bytes]:
+        """Next frame to process, or None once the client has gone"""
+        while self._data is None:
+            if self.closed:
+                return None
+            self._ready.clear()
+            await self._ready.wait()
+        data, self._data = self._data, None
+        return data
+
+
+async def _receive_frames(websocket: WebSocket, mailbox: LatestFrame) -> None:
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("bytes"):
+                mailbox.put(message["bytes"])
+    except WebSocketDisconnect:
+        pass
+    finally:
+        mailbox.close()
+
+
+@router.websocket("/live")
+async def live_analysis(websocket: WebSocket):
+    """Stream JPEG frames in, receive incremental CASA updates out
+
+    Sessions beyond LIVE_MAX_SESSIONS in this worker are closed straight
+    away with code 1013 (try again later).
+    """
+    global _active_sessions
+    await websocket.accept()
+    if _active_sessions >= settings.LIVE_MAX_SESSIONS:
+        await websocket.send_json({"type": "error", "detail": "Too many live sessions, try again later"})
+        await websocket.close(code=1013)
+        return
+    _active_sessions += 1
+
+    mailbox = LatestFrame()
+    receiver = asyncio.create_task(_receive_frames(websocket, mailbox))
+    # Linked as frames arrive, so an update costs the new frame, not the whole window
+    tracker = OnlineTracker(settings.TRACKING_MAX_DISTANCE, settings.TRACKING_MAX_AGE)
+    processed = 0
+    last_update = 0.0
+
+    try:
+        while (data := await mailbox.get()) is not None:
+            # Dropped frames keep their time slot with no detections
+            frame_index = mailbox.received - 1
+            started = time.perf_counter()
+            # Leased per frame so a long session moves to a new model version promptly
+            async with model_registry.lease(DETECTOR) as model:
+                processor = processor_for(video_processor, model)
+                try:
+                    frames, native_shape = await processor.decode_image(data)
+                except ValueError:
+                    await websocket.send_json({"type": "error", "detail": "Could not decode frame"})
+                    continue
+
+                detection = await model.detect(frames[0])
+                tracker.extend([[]] * (frame_index - tracker.frames_seen))
+                tracker.extend([native_detections(detection, processor.letterbox(native_shape))])
+            processed += 1
+
+            if started - last_update < settings.LIVE_UPDATE_INTERVAL:
+                continue
+            last_update = started
+
+            tracker.drop(tracker.frames_seen - settings.LIVE_WINDOW_FRAMES)
+            casa_metrics = await casa_calculator.calculate(tracker.tracks())
+
+            # Calculator values may be NumPy scalars, which send_json cannot encode
+            await websocket.send_text(dumps({
+                "type": "update",
+                "frames_received": mailbox.received,
+                "frames_processed": processed,
+                "frames_dropped": mailbox.dropped,
+                "window_frames": min(tracker.frames_seen, settings.LIVE_WINDOW_FRAMES),
+                "sperm_count": casa_metrics["count"],
+                "concentration": casa_metrics["concentration"],
+                "motility": {
+                    "progressive": casa_metrics["progressive_motility"],
+                    "non_progressive": casa_metrics["non_progressive_motility"],
+                    "immotile": casa_metrics["immotile"]
+                },
+                "latency_ms": round((time.perf_counter() - started) * 1000, 1)
+            }).decode())
+    except (WebSocketDisconnect, RuntimeError):
+        # Client went away mid-send
+        pass
+    finally:
+        _active_sessions -= 1
+        receiver.cancel()
+        logger.info(
+            "Live session closed: %d received, %d processed, %d dropped",
+            mailbox.received, processed, mailbox.dropped,
+        )
@@ -0,0 +1,23 @@
+"""
+Operational metrics endpoint
+"""
+
+from fastapi import APIRouter
+
+from backend.services.admission import admission
+from backend.services.results_db import results_store
+from backend.services.retention import retention
+from backend.services.worker_tuning import worker_config
+
+router = APIRouter(tags=["metrics"])
+
+
+@router.get("/metrics")
+async def get_metrics():
+    """Counters for admission control and background maintenance tasks, and this worker's thread setup"""
+    return {
+        "admission": admission.stats,
+        "retention": retention.stats,
+        "results_db": results_store.stats,
+        "worker": worker_config,
+    }
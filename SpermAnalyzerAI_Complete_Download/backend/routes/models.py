@@ -0,0 +1,66 @@
+"""
+Model registry endpoints
+Inspect loaded detector versions and roll out a new one without a restart
+"""
+
+import hmac
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException
+from pydantic import BaseModel, Field
+
+from backend.config import settings
+from backend.services.model_registry import ModelBusy, ModelLoadError, backends, model_registry
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)) -> None:
+    """Loading a model file runs code from it, so only administrators may"""
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Model management is disabled (ADMIN_TOKEN is not set)")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token.encode(), settings.ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid or missing X-Admin-Token")
+
+
+router = APIRouter(prefix="/models", tags=["models"], dependencies=[Depends(require_admin)])
+
+
+class ModelVersion(BaseModel):
+    path: str  # relative to MODEL_DIR
+    sha256: str = Field(..., pattern="^[0-9a-fA-F]{64}$")  # refused if the file differs
+    backend: str = "ultralytics"
+    input_size: Optional[int] = Field(None, ge=32, le=4096)  # default MODEL_INPUT_SIZE
+
+
+@router.get("")
+async def list_models():
+    """Every known version per model name, with its state and the jobs using it"""
+    return {"backends": backends(), "models": model_registry.entries(), "stats": model_registry.stats}
+
+
+@router.get("/{name}")
+async def get_model(name: str):
+    models = model_registry.entries(name)
+    if not models[name]:
+        raise HTTPException(status_code=404, detail=f"Model {name} not found")
+    return {"name": name, "versions": models[name]}
+
+
+@router.post("/{name}", status_code=202)
+async def load_model(name: str, version: ModelVersion):
+    """Load, verify and warm up a new version in the background
+
+    It replaces the active version for jobs started after it is ready;
+    poll GET /models/{name} for its state. Running jobs keep the version
+    they started with, which is unloaded when the last of them finishes.
+
+    Only the worker process serving this request switches models. With
+    WORKERS > 1 each worker keeps its own registry, so roll out a new
+    version by restarting the workers or by sending the request to each.
+    """
+    try:
+        entry = model_registry.load(name, version.path, version.sha256, version.backend, version.input_size)
+    except ModelBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ModelLoadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return entry.to_dict()
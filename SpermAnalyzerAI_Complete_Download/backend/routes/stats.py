@@ -0,0 +1,49 @@
+"""
+Population statistics endpoint
+"""
+
+from datetime import date
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query
+
+from backend.services.analytics import DEFAULT_PERCENTILES, GROUP_BY, METRIC_BINS, casa_analytics
+from backend.services.results_db import results_store
+
+router = APIRouter(tags=["stats"])
+
+
+@router.get("/stats")
+async def get_stats(
+    metric: str = "progressive",
+    group_by: str = "none",
+    since: Optional[date] = None,
+    until: Optional[date] = None,
+    device_id: Optional[str] = None,
+    technician_id: Optional[str] = None,
+    percentiles: str = Query(",".join(map(str, DEFAULT_PERCENTILES)), description="Comma-separated, 0-100"),
+    histogram: bool = False,
+):
+    """Distribution of one CASA metric over completed analyses, optionally grouped"""
+    if metric not in METRIC_BINS:
+        raise HTTPException(status_code=400, detail=f"metric must be one of {', '.join(METRIC_BINS)}")
+    if group_by not in GROUP_BY:
+        raise HTTPException(status_code=400, detail=f"group_by must be one of {', '.join(GROUP_BY)}")
+    try:
+        quantiles = [float(q) for q in percentiles.split(",") if q.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="percentiles must be numbers")
+    if any(not 0 <= q <= 100 for q in quantiles):
+        raise HTTPException(status_code=400, detail="percentiles must be between 0 and 100")
+
+    return await casa_analytics.query(
+        results_store.engine,
+        metric,
+        since=since,
+        until=until,
+        device_id=device_id,
+        technician_id=technician_id,
+        group_by=group_by,
+        percentiles=quantiles,
+        histogram=histogram,
+    )
@@ -0,0 +1,107 @@
+"""
+Resumable upload endpoints
+"""
+
+import uuid
+from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request
+from pydantic import BaseModel
+
+from backend.responses import FastJSONResponse
+from backend.services.admission import Priority, admission, tenant_for
+from backend.services.pipeline import is_still_image, submit_analysis
+from backend.services.upload_sessions import (
+    ChecksumMismatch,
+    OffsetMismatch,
+    UploadIncomplete,
+    UploadNotFound,
+    UploadTooLarge,
+    upload_sessions,
+)
+
+router = APIRouter(prefix="/uploads", tags=["uploads"])
+
+
+class UploadCreate(BaseModel):
+    filename: str
+    size: int
+    content_type: Optional[str] = None
+    sha256: Optional[str] = None
+
+
+@router.post("", status_code=201)
+async def create_upload(body: UploadCreate):
+    """Start a resumable upload session"""
+    try:
+        session = await upload_sessions.create(body.filename, body.size, body.content_type, body.sha256)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    return session.to_dict()
+
+
+@router.get("/{upload_id}")
+async def get_upload(upload_id: str):
+    """Report how many bytes have been received so far"""
+    try:
+        return upload_sessions.get(upload_id).to_dict()
+    except UploadNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@router.put("/{upload_id}")
+async def put_chunk(upload_id: str, request: Request, offset: int = Query(..., ge=0)):
+    """Write the request body at `offset`; it must equal the received offset"""
+    try:
+        session = await upload_sessions.write_chunk(upload_id, offset, request.stream())
+    except UploadNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except OffsetMismatch as e:
+        return FastJSONResponse(status_code=409, content={"detail": str(e), "offset": e.expected})
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    return session.to_dict()
+
+
+async def _finalize(upload_id: str):
+    try:
+        session = upload_sessions.get(upload_id)
+        sha256 = await upload_sessions.finalize(upload_id)
+    except UploadNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except UploadIncomplete as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ChecksumMismatch as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return session, sha256
+
+
+@router.post("/{upload_id}/finalize", status_code=202)
+async def finalize_upload(
+    upload_id: str,
+    request: Request,
+    progressive: bool = False,
+    priority: Priority = Priority.routine,
+    patient_id: Optional[str] = Query(None, max_length=64),
+    sample_id: Optional[str] = Query(None, max_length=64),
+    device_id: Optional[str] = Query(None, max_length=64),
+    technician_id: Optional[str] = Query(None, max_length=64),
+):
+    """Verify a complete upload and queue it for analysis"""
+    # Turn the client away before the upload is consumed, so it can retry finalize
+    ticket = admission.admit(priority, tenant_for(request.headers.get("X-API-Key"), request.client and request.client.host))
+    try:
+        session, sha256 = await _finalize(upload_id)
+    except BaseException:
+        ticket.cancel()
+        raise
+
+    job_id = str(uuid.uuid4())
+    still = is_still_image(session.filename, session.content_type)
+    job = submit_analysis(
+        job_id, session.filename, sha256, still,
+        progressive=progressive, ticket=ticket,
+        patient_id=patient_id, sample_id=sample_id,
+        device_id=device_id, technician_id=technician_id,
+    )
+    return {**job.to_dict(), "sha256": sha256}
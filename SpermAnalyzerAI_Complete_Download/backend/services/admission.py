@@ -0,0 +1,262 @@
+"""
+Admission control for Sperm Analyzer AI
+Bounds how many analyses run at once in this worker and how many may wait
+for a slot; anything beyond that is turned away immediately. Waiting work
+is ordered by priority lane, then weighted fair share between tenants.
+"""
+
+import asyncio
+import hashlib
+import math
+import time
+from collections import deque
+from enum import Enum
+from typing import Any, Deque, Dict, List, Optional
+
+from backend.config import settings
+
+# Completions older than this no longer count towards the drain rate
+_DRAIN_WINDOW = 60.0
+# Service time assumed until the first analysis finishes
+_DEFAULT_SERVICE_SECONDS = 10.0
+_MAX_RETRY_AFTER = 300
+
+
+class Priority(str, Enum):
+    """Scheduling lanes, most urgent first"""
+
+    stat = "stat"  # clinical results someone is waiting for
+    routine = "routine"
+    bulk = "bulk"  # research re-analyses and other batch work
+
+
+_RANK = {lane: rank for rank, lane in enumerate(Priority)}
+
+
+def tenant_for(api_key: Optional[str], client_host: Optional[str]) -> str:
+    """Fair-share key: a digest of the API key if sent, else the client address"""
+    if api_key:
+        return "key:" + hashlib.sha256(api_key.encode()).hexdigest()[:12]
+    return f"host:{client_host or 'unknown'}"
+
+
+class Overloaded(Exception):
+    """No room to run or queue another analysis"""
+
+    def __init__(self, retry_after: int):
+        super().__init__(f"Server is at capacity, retry in {retry_after}s")
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """An admitted analysis; `async with ticket:` waits for and holds a slot"""
+
+    def __init__(self, controller: "AdmissionController", lane: Priority, tenant: str):
+        self._controller = controller
+        self.lane = lane
+        self.tenant = tenant
+        self.state = "reserved"  # reserved -> waiting -> active -> done
+        self.admitted_at = time.monotonic()
+        self.enqueued_at: Optional[float] = None
+        self.started_at: Optional[float] = None
+        self.start_tag = self.finish_tag = 0.0  # WFQ virtual times
+        self._granted: Optional[asyncio.Future] = None
+
+    async def __aenter__(self) -> "Ticket":
+        self._controller._enter(self)
+        try:
+            await self._granted
+        except asyncio.CancelledError:
+            self._controller._leave(self)
+            raise
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self._controller._leave(self)
+
+    def cancel(self) -> None:
+        """Give the reservation back if it was never used; no-op otherwise"""
+        if self.state == "reserved":
+            self._controller._leave(self)
+
+
+class _LaneStats:
+    def __init__(self):
+        self.admitted = self.rejected = self.completed = 0
+        self.mean_wait: Optional[float] = None
+        self.max_wait = 0.0
+        self.completions: Deque[float] = deque(maxlen=256)
+
+    def record_wait(self, seconds: float) -> None:
+        self.mean_wait = seconds if self.mean_wait is None else 0.2 * seconds + 0.8 * self.mean_wait
+        self.max_wait = max(self.max_wait, seconds)
+
+
+class AdmissionController:
+    """Concurrency limit plus a bounded wait queue
+
+    A freed slot goes to the waiting ticket with the most urgent lane; a
+    ticket is promoted one lane for every `aging_seconds` it has waited, so
+    bulk work is never starved. Within a lane, tenants share slots by
+    weighted fair queuing on virtual finish times.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int,
+        max_queue: int,
+        aging_seconds: float = 30.0,
+        tenant_weights: Optional[Dict[str, float]] = None,
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.aging_seconds = aging_seconds
+        self.tenant_weights = tenant_weights or {}
+        self.active = 0
+        self.pending = 0  # admitted and not yet finished, running or not
+        self._waiting: List[Ticket] = []
+        self._virtual_time = 0.0
+        self._last_finish: Dict[str, float] = {}
+        self._completions: Deque[float] = deque(maxlen=256)
+        self._service_seconds: Optional[float] = None
+        self.counters = {"admitted": 0, "rejected": 0, "completed": 0}
+        self._lanes = {lane: _LaneStats() for lane in Priority}
+
+    @property
+    def capacity(self) -> int:
+        return self.max_concurrent + self.max_queue
+
+    @property
+    def queued(self) -> int:
+        return self.pending - self.active
+
+    def admit(self, lane: Priority = Priority.routine, tenant: str = "") -> Ticket:
+        return self.admit_many(1, lane, tenant)[0]
+
+    def admit_many(self, count: int, lane: Priority = Priority.routine, tenant: str = "") -> List[Ticket]:
+        """Reserve room for `count` analyses, all or nothing; raises Overloaded"""
+        overflow = self.pending + count - self.capacity
+        if overflow > 0:
+            self.counters["rejected"] += count
+            self._lanes[lane].rejected += count
+            raise Overloaded(self.retry_after(overflow))
+        self.pending += count
+        self.counters["admitted"] += count
+        self._lanes[lane].admitted += count
+        return [Ticket(self, lane, tenant) for _ in range(count)]
+
+    def drain_rate(self) -> float:
+        """Analyses finished per second, measured over the recent window"""
+        recent = _recent(self._completions)
+        if recent >= 2:
+            span = max(time.monotonic() - self._completions[0], 1e-3)
+            return recent / span
+        service = self._service_seconds or _DEFAULT_SERVICE_SECONDS
+        return self.max_concurrent / service
+
+    def retry_after(self, overflow: int = 1) -> int:
+        """Seconds until `overflow` analyses have drained and made room"""
+        seconds = math.ceil(overflow / self.drain_rate())
+        return min(max(seconds, 1), _MAX_RETRY_AFTER)
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "queued": self.queued,
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            **self.counters,
+            "drain_rate_per_second": round(self.drain_rate(), 3),
+            "mean_service_seconds": round(self._service_seconds, 2) if self._service_seconds else None,
+            "lanes": {lane.value: self._lane_stats(lane) for lane in Priority},
+        }
+
+    def _lane_stats(self, lane: Priority) -> Dict[str, Any]:
+        stats = self._lanes[lane]
+        return {
+            "queued": sum(1 for ticket in self._waiting if ticket.lane is lane),
+            "admitted": stats.admitted,
+            "rejected": stats.rejected,
+            "completed": stats.completed,
+            "completed_last_minute": _recent(stats.completions),
+            "mean_wait_seconds": round(stats.mean_wait, 3) if stats.mean_wait is not None else None,
+            "max_wait_seconds": round(stats.max_wait, 3),
+        }
+
+    def _enter(self, ticket: Ticket) -> None:
+        ticket._granted = asyncio.get_running_loop().create_future()
+        ticket.state = "waiting"
+        ticket.enqueued_at = time.monotonic()
+        weight = self.tenant_weights.get(ticket.tenant, 1.0)
+        start = max(self._virtual_time, self._last_finish.get(ticket.tenant, 0.0))
+        ticket.start_tag = start
+        ticket.finish_tag = self._last_finish[ticket.tenant] = start + 1.0 / weight
+        if self.active < self.max_concurrent and not self._waiting:
+            self._grant(ticket)
+        else:
+            self._waiting.append(ticket)
+
+    def _grant(self, ticket: Ticket) -> None:
+        now = time.monotonic()
+        self.active += 1
+        ticket.state = "active"
+        ticket.started_at = now
+        self._lanes[ticket.lane].record_wait(now - ticket.enqueued_at)
+        self._virtual_time = max(self._virtual_time, ticket.start_tag)
+        ticket._granted.set_result(None)
+
+    def _leave(self, ticket: Ticket) -> None:
+        if ticket.state == "done":
+            return
+        if ticket.state == "active":
+            self.active -= 1
+            self._record_completion(ticket)
+        elif ticket.state == "waiting":
+            self._waiting.remove(ticket)
+        ticket.state = "done"
+        self.pending -= 1
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        if not (self._waiting and self.active < self.max_concurrent):
+            return
+        now = time.monotonic()
+
+        def order(ticket: Ticket):
+            promoted = int((now - ticket.enqueued_at) // self.aging_seconds) if self.aging_seconds > 0 else 0
+            return max(_RANK[ticket.lane] - promoted, 0), ticket.finish_tag, ticket.enqueued_at
+
+        while self._waiting and self.active < self.max_concurrent:
+            ticket = min(self._waiting, key=order)
+            self._waiting.remove(ticket)
+            self._grant(ticket)
+        # Tenants whose last tag is behind virtual time would restart from it anyway
+        self._last_finish = {t: f for t, f in self._last_finish.items() if f > self._virtual_time}
+
+    def _record_completion(self, ticket: Ticket) -> None:
+        now = time.monotonic()
+        self._completions.append(now)
+        self._lanes[ticket.lane].completions.append(now)
+        self._lanes[ticket.lane].completed += 1
+        self.counters["completed"] += 1
+        elapsed = now - ticket.started_at
+        self._service_seconds = elapsed if self._service_seconds is None else (
+            0.2 * elapsed + 0.8 * self._service_seconds
+        )
+
+
+def _recent(completions: Deque[float]) -> int:
+    """Drop completions older than the drain window; returns how many remain"""
+    now = time.monotonic()
+    while completions and now - completions[0] > _DRAIN_WINDOW:
+        completions.popleft()
+    return len(completions)
+
+
+admission = AdmissionController(
+    settings.MAX_CONCURRENT_ANALYSES,
+    settings.ANALYSIS_QUEUE_SIZE,
+    aging_seconds=settings.PRIORITY_AGING_SECONDS,
+    tenant_weights=settings.TENANT_WEIGHTS,
+)
@@ -0,0 +1,251 @@
+"""
+Population statistics over stored CASA results
+Every completed analysis is folded into per-day, per-device, per-technician
+histograms, one row per metric, so aggregates over any number of analyses
+read a few hundred small rows instead of every result.
+"""
+
+from collections import defaultdict
+from datetime import date
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import Date, Float, Integer, LargeBinary, String, func, select
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+from sqlalchemy.orm import Mapped, mapped_column
+
+from backend.services.results_db import AnalysisRecord, Base, dialect_insert, write_transaction
+
+# metric -> (low, high, bins). Percentiles are exact to one bin width;
+# values outside the range land in the edge bins (min/max stay exact).
+METRIC_BINS: Dict[str, Tuple[float, float, int]] = {
+    "sperm_count": (0.0, 1000.0, 200),
+    "concentration": (0.0, 300.0, 300),  # million/ml
+    "progressive": (0.0, 100.0, 200),  # percent
+    "non_progressive": (0.0, 100.0, 200),
+    "immotile": (0.0, 100.0, 200),
+    "vcl": (0.0, 300.0, 300),  # um/s
+    "vsl": (0.0, 300.0, 300),
+    "vap": (0.0, 300.0, 300),
+    "linearity": (0.0, 100.0, 1000),
+    "normal_morphology": (0.0, 100.0, 200),
+}
+
+GROUP_BY = ("none", "day", "month", "device", "technician")
+DEFAULT_PERCENTILES = (10, 25, 50, 75, 90)
+
+
+class CasaDailyRollup(Base):
+    __tablename__ = "casa_daily"
+
+    # Metric first, so a query for one metric over a date range is a primary-key range scan
+    metric: Mapped[str] = mapped_column(String(32), primary_key=True)
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    device_id: Mapped[str] = mapped_column(String(64), primary_key=True)  # "" when unknown
+    technician_id: Mapped[str] = mapped_column(String(64), primary_key=True)
+    count: Mapped[int] = mapped_column(Integer)
+    total: Mapped[float] = mapped_column(Float)
+    total_sq: Mapped[float] = mapped_column(Float)
+    minimum: Mapped[float] = mapped_column(Float)
+    maximum: Mapped[float] = mapped_column(Float)
+    hist: Mapped[bytes] = mapped_column(LargeBinary)  # little-endian int32 bin counts
+
+
+def _histogram(values: np.ndarray, low: float, high: float, bins: int) -> np.ndarray:
+    index = np.floor((values - low) * (bins / (high - low))).astype(np.int64)
+    return np.bincount(np.clip(index, 0, bins - 1), minlength=bins).astype(np.int32)
+
+
+def _group_keys(group_by: str, days, devices, technicians) -> np.ndarray:
+    """Group label per rollup row; "" stands for unknown device/technician"""
+    if group_by == "day":
+        return np.array([day.isoformat() for day in days])
+    if group_by == "month":
+        return np.array([day.strftime("%Y-%m") for day in days])
+    if group_by == "device":
+        return np.array(devices)
+    if group_by == "technician":
+        return np.array(technicians)
+    return np.zeros(len(days), dtype=np.int8)
+
+
+def _percentiles(
+    hists: np.ndarray, q: float, low: float, width: float, minimum: np.ndarray, maximum: np.ndarray
+) -> np.ndarray:
+    """q-th percentile of each histogram row, interpolated within its bin"""
+    cumulative = np.cumsum(hists, axis=1)
+    target = q / 100.0 * cumulative[:, -1]
+    index = np.minimum((cumulative < target[:, None]).sum(axis=1), hists.shape[1] - 1)
+    rows = np.arange(len(hists))
+    before = np.where(index > 0, cumulative[rows, index - 1], 0)
+    inside = hists[rows, index]
+    fraction = np.divide(target - before, inside, out=np.zeros(len(hists)), where=inside > 0)
+    return np.clip(low + (index + fraction) * width, minimum, maximum)
+
+
+class CasaAnalytics:
+    """Maintains the daily rollups and answers aggregate queries from them"""
+
+    async def apply(self, conn: AsyncConnection, rows: List[Dict[str, Any]]) -> None:
+        """ResultsStore write hook: fold newly completed analyses into the rollups
+
+        Counters are added by the upsert itself. Histograms are merged here,
+        so `conn` must be inside results_db.write_transaction(), which keeps
+        another process from changing them between the read and the write.
+        """
+        if not rows:
+            return
+        groups: Dict[Tuple[date, str, str], List[Dict[str, Any]]] = defaultdict(list)
+        for row in rows:
+            groups[(row["created_at"].date(), row["device_id"] or "", row["technician_id"] or "")].append(row)
+
+        table = CasaDailyRollup.__table__
+        existing = {
+            (metric, day, device_id, technician_id): hist
+            for metric, day, device_id, technician_id, hist in await conn.execute(
+                select(table.c.metric, table.c.day, table.c.device_id, table.c.technician_id, table.c.hist)
+                .where(table.c.day.in_({key[0] for key in groups}))
+            )
+        }
+
+        updates = []
+        for (day, device_id, technician_id), group in groups.items():
+            for metric, (low, high, bins) in METRIC_BINS.items():
+                values = np.array([row[metric] for row in group if row[metric] is not None], dtype=np.float64)
+                if not len(values):
+                    continue
+                hist = _histogram(values, low, high, bins)
+                count, total, total_sq = len(values), float(values.sum()), float(np.square(values).sum())
+                minimum, maximum = float(values.min()), float(values.max())
+                previous = existing.get((metric, day, device_id, technician_id))
+                if previous is not None:
+                    hist += np.frombuffer(previous, dtype="<i4")
+                updates.append({
+                    "metric": metric,
+                    "day": day,
+                    "device_id": device_id,
+                    "technician_id": technician_id,
+                    "count": count,
+                    "total": total,
+                    "total_sq": total_sq,
+                    "minimum": minimum,
+                    "maximum": maximum,
+                    "hist": hist.astype("<i4").tobytes(),
+                })
+        if not updates:
+            return
+        insert = dialect_insert(conn.dialect.name, CasaDailyRollup)
+        # SQLite's two-argument min()/max() are Postgres' least()/greatest()
+        least, greatest = (func.min, func.max) if conn.dialect.name == "sqlite" else (func.least, func.greatest)
+        await conn.execute(
+            insert.on_conflict_do_update(
+                index_elements=["metric", "day", "device_id", "technician_id"],
+                set_={
+                    "count": table.c["count"] + insert.excluded["count"],
+                    "total": table.c.total + insert.excluded.total,
+                    "total_sq": table.c.total_sq + insert.excluded.total_sq,
+                    "minimum": least(table.c.minimum, insert.excluded.minimum),
+                    "maximum": greatest(table.c.maximum, insert.excluded.maximum),
+                    "hist": insert.excluded.hist,
+                },
+            ),
+            updates,
+        )
+
+    async def backfill(self, engine: AsyncEngine, chunk: int = 50_000) -> int:
+        """Build the rollups from existing history the first time they are empty
+
+        Runs under the write lock, so workers starting together fold the
+        history once and no write lands between the check and the fold.
+        """
+        rollups, analyses = CasaDailyRollup.__table__, AnalysisRecord.__table__
+        async with write_transaction(engine) as conn:
+            if await conn.scalar(select(func.count()).select_from(rollups)):
+                return 0
+            columns = [analyses.c.created_at, analyses.c.device_id, analyses.c.technician_id]
+            columns += [analyses.c[metric] for metric in METRIC_BINS]
+            result = await conn.stream(select(*columns).where(analyses.c.status == "completed"))
+            folded = 0
+            async for partition in result.mappings().partitions(chunk):
+                await self.apply(conn, [dict(row) for row in partition])
+                folded += len(partition)
+        return folded
+
+    async def query(
+        self,
+        engine: AsyncEngine,
+        metric: str,
+        since: Optional[date] = None,
+        until: Optional[date] = None,
+        device_id: Optional[str] = None,
+        technician_id: Optional[str] = None,
+        group_by: str = "none",
+        percentiles: Sequence[float] = DEFAULT_PERCENTILES,
+        histogram: bool = False,
+    ) -> Dict[str, Any]:
+        """Count, mean, spread, percentiles (and histogram) of one metric per group"""
+        low, high, bins = METRIC_BINS[metric]
+        width = (high - low) / bins
+        table = CasaDailyRollup.__table__
+        query = select(
+            table.c.day, table.c.device_id, table.c.technician_id, table.c.count, table.c.total,
+            table.c.total_sq, table.c.minimum, table.c.maximum, table.c.hist,
+        ).where(table.c.metric == metric)
+        if since is not None:
+            query = query.where(table.c.day >= since)
+        if until is not None:
+            query = query.where(table.c.day < until)
+        if device_id is not None:
+            query = query.where(table.c.device_id == device_id)
+        if technician_id is not None:
+            query = query.where(table.c.technician_id == technician_id)
+        async with engine.connect() as conn:
+            rows = (await conn.execute(query)).all()
+
+        groups = []
+        if rows:
+            days, devices, technicians, counts, totals, totals_sq, minima, maxima, blobs = zip(*rows)
+            keys = _group_keys(group_by, days, devices, technicians)
+            order, index = np.unique(keys, return_inverse=True)
+            size = len(order)
+
+            # Sum rows per group: counts and moments by bincount, histograms by reduceat over sorted rows
+            count = np.bincount(index, weights=counts, minlength=size)
+            total = np.bincount(index, weights=totals, minlength=size)
+            total_sq = np.bincount(index, weights=totals_sq, minlength=size)
+            minimum = np.full(size, np.inf)
+            np.minimum.at(minimum, index, minima)
+            maximum = np.full(size, -np.inf)
+            np.maximum.at(maximum, index, maxima)
+            hists = np.frombuffer(b"".join(blobs), dtype="<i4").reshape(len(rows), bins).astype(np.int64)
+            sort = np.argsort(index, kind="stable")
+            hists = np.add.reduceat(hists[sort], np.searchsorted(index[sort], np.arange(size)), axis=0)
+
+            mean = total / count
+            std = np.sqrt(np.maximum(total_sq / count - mean * mean, 0.0))
+            quantiles = {f"p{q:g}": _percentiles(hists, q, low, width, minimum, maximum) for q in percentiles}
+            for g, key in enumerate(order):
+                group = {
+                    "key": str(key) if group_by != "none" and key else None,
+                    "count": int(count[g]),
+                    "mean": round(float(mean[g]), 3),
+                    "std": round(float(std[g]), 3),
+                    "min": float(minimum[g]),
+                    "max": float(maximum[g]),
+                    "percentiles": {name: round(float(values[g]), 3) for name, values in quantiles.items()},
+                }
+                if histogram:
+                    group["histogram"] = hists[g].tolist()
+                groups.append(group)
+
+        return {
+            "metric": metric,
+            "group_by": group_by,
+            "since": since.isoformat() if since else None,
+            "until": until.isoformat() if until else None,
+            "bins": {"low": low, "high": high, "width": width} if histogram else None,
+            "groups": groups,
+        }
+
+
+casa_analytics = CasaAnalytics()
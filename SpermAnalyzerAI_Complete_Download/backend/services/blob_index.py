@@ -0,0 +1,109 @@
+"""
+Size and last-access index for the blob store
+Lets retention pick expired and least-recently-used blobs without walking
+the upload tree.
+"""
+
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class BlobIndex:
+    """SQLite-backed (sha256, size, last_access) table
+
+    Accesses are buffered in memory and written on flush(), so reading a
+    blob never costs a database write on the request path.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.needs_seed = False
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._touched: Dict[str, float] = {}
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # A brand-new index has to learn about blobs stored before it existed
+            self.needs_seed = not self.path.exists()
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS blobs ("
+                "sha256 TEXT PRIMARY KEY, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS blobs_last_access ON blobs (last_access)")
+            self._conn.commit()
+        return self._conn
+
+    def record(self, sha256: str, size: int, last_access: Optional[float] = None) -> None:
+        """Add or refresh a stored blob"""
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "INSERT OR REPLACE INTO blobs (sha256, size, last_access) VALUES (?, ?, ?)",
+                (sha256, size, last_access or time.time()),
+            )
+            conn.commit()
+
+    def record_many(self, entries: Iterable[Tuple[str, int, float]]) -> None:
+        with self._lock:
+            conn = self._connection()
+            conn.executemany(
+                "INSERT OR IGNORE INTO blobs (sha256, size, last_access) VALUES (?, ?, ?)",
+                entries,
+            )
+            conn.commit()
+
+    def touch(self, sha256: str) -> None:
+        """Note an access; persisted on the next flush()"""
+        self._touched[sha256] = time.time()
+
+    def flush(self) -> None:
+        touched, self._touched = self._touched, {}
+        if not touched:
+            return
+        with self._lock:
+            conn = self._connection()
+            conn.executemany(
+                "UPDATE blobs SET last_access = MAX(last_access, ?) WHERE sha256 = ?",
+                [(when, sha256) for sha256, when in touched.items()],
+            )
+            conn.commit()
+
+    def expired(self, cutoff: float, limit: int, exclude: Iterable[str] = ()) -> List[Tuple[str, int]]:
+        """Blobs not accessed since `cutoff`, oldest first, leaving out `exclude`"""
+        exclude = list(exclude)
+        with self._lock:
+            return self._connection().execute(
+                "SELECT sha256, size FROM blobs WHERE last_access < ?"
+                f" AND sha256 NOT IN ({', '.join('?' * len(exclude))}) ORDER BY last_access LIMIT ?",
+                (cutoff, *exclude, limit),
+            ).fetchall()
+
+    def least_recent(self, limit: int, exclude: Iterable[str] = ()) -> List[Tuple[str, int]]:
+        exclude = list(exclude)
+        with self._lock:
+            return self._connection().execute(
+                f"SELECT sha256, size FROM blobs WHERE sha256 NOT IN ({', '.join('?' * len(exclude))})"
+                " ORDER BY last_access LIMIT ?",
+                (*exclude, limit),
+            ).fetchall()
+
+    def totals(self) -> Tuple[int, int]:
+        """(blob count, total bytes)"""
+        with self._lock:
+            count, total = self._connection().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs"
+            ).fetchone()
+        return count, total
+
+    def remove(self, sha256s: Iterable[str]) -> None:
+        with self._lock:
+            conn = self._connection()
+            conn.executemany("DELETE FROM blobs WHERE sha256 = ?", [(s,) for s in sha256s])
+            conn.commit()
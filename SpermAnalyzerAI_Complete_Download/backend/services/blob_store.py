@@ -0,0 +1,128 @@
+"""
+Content-addressed upload storage for Sperm Analyzer AI
+
+Each upload is stored once under its SHA-256, sharded two levels deep
+(`blobs/ab/cd/abcd...`) so no directory grows without bound.
+"""
+
+import hashlib
+import os
+import re
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional, Set, Tuple
+
+from backend.config import settings
+from backend.services.blob_index import BlobIndex
+
+_SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+class InvalidDigest(ValueError):
+    pass
+
+
+class BlobStore:
+    """Stores uploaded bytes keyed by their SHA-256"""
+
+    def __init__(self, root: Path, index: Optional[BlobIndex] = None):
+        self.root = Path(root)
+        self.tmp_dir = self.root / "tmp"
+        self.index = index
+        self._readers: Counter = Counter()
+
+    @staticmethod
+    def validate(sha256: str) -> str:
+        digest = sha256.lower()
+        if not _SHA256_RE.match(digest):
+            raise InvalidDigest(f"Not a SHA-256 hex digest: {sha256}")
+        return digest
+
+    def path_for(self, sha256: str) -> Path:
+        digest = self.validate(sha256)
+        return self.root / digest[:2] / digest[2:4] / digest
+
+    def size(self, sha256: str) -> Optional[int]:
+        """Size in bytes of a stored blob, or None if it is not stored"""
+        try:
+            return self.path_for(sha256).stat().st_size
+        except FileNotFoundError:
+            return None
+
+    def exists(self, sha256: str) -> bool:
+        return self.size(sha256) is not None
+
+    def access(self, sha256: str) -> Path:
+        """Path of a blob that is about to be read, marking it recently used"""
+        path = self.path_for(sha256)
+        self.touch(sha256)
+        return path
+
+    @contextmanager
+    def in_use(self, sha256: str) -> Iterator[Path]:
+        """Path of a blob that retention keeps until the block exits"""
+        digest = self.validate(sha256)
+        self._readers[digest] += 1
+        try:
+            yield self.access(digest)
+        finally:
+            self._readers[digest] -= 1
+            if not self._readers[digest]:
+                del self._readers[digest]
+
+    def readers(self) -> Set[str]:
+        """Blobs held by in_use() in this process"""
+        return set(self._readers)
+
+    def touch(self, sha256: str) -> None:
+        if self.index is not None:
+            self.index.touch(self.validate(sha256))
+
+    def put_bytes(self, content: bytes) -> Tuple[str, Path]:
+        """Store content unless already present; returns (sha256, path)"""
+        digest = hashlib.sha256(content).hexdigest()
+        path = self.path_for(digest)
+        if path.exists():
+            self.touch(digest)
+        else:
+            self.tmp_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.tmp_dir / uuid.uuid4().hex
+            with open(tmp_path, "wb") as buffer:
+                buffer.write(content)
+            self._install(tmp_path, path, digest)
+        return digest, path
+
+    def put_file(self, src: Path, sha256: str) -> Path:
+        """Move an already-hashed file into the store, dropping it if a copy exists"""
+        path = self.path_for(sha256)
+        if path.exists():
+            Path(src).unlink(missing_ok=True)
+            self.touch(sha256)
+        else:
+            self._install(Path(src), path, self.validate(sha256))
+        return path
+
+    def delete(self, sha256: str) -> None:
+        """Remove a blob and any shard directories it leaves empty"""
+        path = self.path_for(sha256)
+        path.unlink(missing_ok=True)
+        for shard in (path.parent, path.parent.parent):
+            try:
+                shard.rmdir()
+            except OSError:
+                break
+
+    def _install(self, src: Path, path: Path, digest: str) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Same filesystem, so the blob appears atomically or not at all
+        os.replace(src, path)
+        if self.index is not None:
+            self.index.record(digest, path.stat().st_size)
+
+
+blob_store = BlobStore(
+    Path(settings.UPLOAD_DIR) / "blobs",
+    index=BlobIndex(Path(settings.UPLOAD_DIR) / "blob_index.db"),
+)
@@ -0,0 +1,71 @@
+"""
+Running CASA estimates with confidence intervals
+Used by the video pipeline to stop once motility percentages have settled.
+"""
+
+import math
+from typing import Dict, Optional, Tuple
+
+# Motility classes reported by CASACalculator, as percentages
+MOTILITY_KEYS = ("progressive_motility", "non_progressive_motility", "immotile")
+
+
+def wilson_interval(percent: float, n: int, z: float = 1.96) -> Tuple[float, float]:
+    """Wilson score interval for a percentage observed over n cells"""
+    if n <= 0:
+        return 0.0, 100.0
+    p = min(max(percent / 100.0, 0.0), 1.0)
+    denom = 1 + z * z / n
+    centre = (p + z * z / (2 * n)) / denom
+    margin = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denom
+    return 100.0 * max(centre - margin, 0.0), 100.0 * min(centre + margin, 1.0)
+
+
+class RunningCASAEstimate:
+    """Latest motility estimate and its 95% intervals
+
+    Converged when every motility class is known to within `tolerance`
+    percentage points (interval half-width), or once `min_cells` tracked
+    cells have been classified.
+    """
+
+    def __init__(self, tolerance: float, min_cells: int, z: float = 1.96):
+        self.tolerance = tolerance
+        self.min_cells = min_cells
+        self.z = z
+        self.cells = 0
+        self.percentages: Dict[str, float] = {}
+        self.updates = 0
+
+    def update(self, casa_metrics: Dict) -> None:
+        self.cells = int(casa_metrics["count"] or 0)
+        self.percentages = {key: casa_metrics[key] for key in MOTILITY_KEYS if casa_metrics.get(key) is not None}
+        self.updates += 1
+
+    @property
+    def intervals(self) -> Dict[str, Tuple[float, float]]:
+        return {key: wilson_interval(value, self.cells, self.z) for key, value in self.percentages.items()}
+
+    @property
+    def half_width(self) -> Optional[float]:
+        intervals = self.intervals
+        if not intervals:
+            return None
+        return max((high - low) / 2 for low, high in intervals.values())
+
+    @property
+    def converged(self) -> bool:
+        if self.cells >= self.min_cells:
+            return True
+        half_width = self.half_width
+        return half_width is not None and half_width <= self.tolerance
+
+    def to_dict(self) -> Dict:
+        half_width = self.half_width
+        return {
+            "cells": self.cells,
+            "half_width": round(half_width, 2) if half_width is not None else None,
+            "tolerance": self.tolerance,
+            "converged": self.converged,
+            "intervals": {key: [round(low, 2), round(high, 2)] for key, (low, high) in self.intervals.items()},
+        }
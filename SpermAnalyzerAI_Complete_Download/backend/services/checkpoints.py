@@ -0,0 +1,107 @@
+"""
+Job checkpoints for Sperm Analyzer AI
+Long video analyses periodically save their progress to the job's scratch
+directory so a restarted worker can continue instead of starting over.
+"""
+
+import fcntl
+import json
+import os
+import pickle
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+CHECKPOINT_FILE = "checkpoint.pkl"
+MANIFEST_FILE = "job.json"
+LOCK_FILE = "lock"
+# Bumped whenever the checkpoint layout changes; older checkpoints are ignored
+_CHECKPOINT_VERSION = 3
+
+
+@dataclass
+class Checkpoint:
+    frames_read: int  # next frame index to decode
+    detections: List[Any]  # per-frame detections so far (native pixels), skipped frames included
+    scale: float = 1.0
+    frame_limit: Optional[int] = None
+    detected: int = 0
+    frames_detected: int = 0
+    strides_used: List[int] = field(default_factory=list)
+    quality: Optional[Any] = None  # frame_qc.QualityStats so far
+
+
+def write_atomic(path: Path, data: bytes) -> None:
+    """Replace `path` with `data` so readers see the old or new file, never a torn one"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    # Make the rename itself durable
+    dir_fd = os.open(path.parent, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+def save_checkpoint(work_dir: Path, checkpoint: Checkpoint) -> None:
+    payload = {"version": _CHECKPOINT_VERSION, "checkpoint": checkpoint}
+    write_atomic(work_dir / CHECKPOINT_FILE, pickle.dumps(payload, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def load_checkpoint(work_dir: Path) -> Optional[Checkpoint]:
+    """The job's last checkpoint, or None if it has none usable"""
+    try:
+        # Only ever written by this service into its own job directory
+        payload = pickle.loads((work_dir / CHECKPOINT_FILE).read_bytes())
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+        return None
+    if payload.get("version") != _CHECKPOINT_VERSION:
+        return None
+    return payload["checkpoint"]
+
+
+def claim(work_dir: Path, create: bool = False) -> Optional[int]:
+    """Lock a job directory for this process; None if another process holds it
+
+    The lock dies with its process, so a crashed worker's jobs become
+    claimable again. Without `create`, a job whose directory is being
+    removed (it finished) cannot be claimed.
+    """
+    flags = os.O_RDWR
+    if create:
+        work_dir.mkdir(parents=True, exist_ok=True)
+        flags |= os.O_CREAT
+    try:
+        fd = os.open(work_dir / LOCK_FILE, flags, 0o600)
+    except FileNotFoundError:
+        return None
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        return None
+    return fd
+
+
+def release(fd: int) -> None:
+    os.close(fd)
+
+
+def save_manifest(work_dir: Path, spec: Dict[str, Any]) -> None:
+    write_atomic(work_dir / MANIFEST_FILE, json.dumps(spec).encode())
+
+
+def load_manifests(work_root: Path) -> List[Dict[str, Any]]:
+    """Specs of jobs whose scratch directory outlived the worker that ran them"""
+    specs = []
+    for manifest in sorted(work_root.glob(f"*/{MANIFEST_FILE}")):
+        try:
+            specs.append(json.loads(manifest.read_text()))
+        except (OSError, ValueError):
+            continue
+    return specs
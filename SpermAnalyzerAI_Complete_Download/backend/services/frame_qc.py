@@ -0,0 +1,139 @@
+"""
+Frame quality control for Sperm Analyzer AI
+Drops out-of-focus, badly exposed or shaken frames before they reach the
+detector. Measured on a downscaled grey copy, a whole batch at a time.
+"""
+
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Optional
+
+import cv2
+import numpy as np
+
+from backend.config import settings
+
+# Grey levels counted as clipped (crushed shadows, blown highlights)
+_DARK, _BRIGHT = 2, 253
+# Phase-correlation peaks below this are no real match (e.g. scene change); no drift is assumed
+_MIN_RESPONSE = 0.2
+
+
+@dataclass
+class QualityStats:
+    frames_checked: int = 0
+    frames_rejected: int = 0
+    # A frame can fail several checks, so these may add up to more than frames_rejected
+    rejected_blur: int = 0
+    rejected_exposure: int = 0
+    rejected_drift: int = 0
+    sharpness_total: float = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        stats = asdict(self)
+        sharpness_total = stats.pop("sharpness_total")
+        stats["rejected_fraction"] = round(self.frames_rejected / self.frames_checked, 4) if self.frames_checked else 0.0
+        stats["mean_sharpness"] = round(sharpness_total / self.frames_checked, 2) if self.frames_checked else None
+        return stats
+
+
+class FrameQC:
+    """Per-clip quality gate; keeps the previous frame to measure drift
+
+    Sharpness is the variance of the Laplacian, exposure the fraction of
+    clipped pixels, drift the whole-field shift from the previous decoded
+    frame (phase correlation), in detector-input pixels per frame. A
+    threshold of 0 disables its check.
+    """
+
+    def __init__(
+        self,
+        min_sharpness: float,
+        max_clipped: float,
+        max_drift: float,
+        downscale: int = 4,
+        stats: Optional[QualityStats] = None,
+    ):
+        self.min_sharpness = min_sharpness
+        self.max_clipped = max_clipped
+        self.max_drift = max_drift
+        self.downscale = downscale
+        self.stats = stats or QualityStats()
+        self._previous: Optional[np.ndarray] = None  # downscaled copy of the last frame checked
+        self._window: Optional[np.ndarray] = None
+        self._last_gap = 0  # frames skipped after the last frame checked
+
+    @classmethod
+    def from_settings(cls, stats: Optional[QualityStats] = None) -> "FrameQC":
+        return cls(
+            settings.QC_MIN_SHARPNESS,
+            settings.QC_MAX_CLIPPED,
+            settings.QC_MAX_DRIFT,
+            settings.QC_DOWNSCALE,
+            stats,
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.min_sharpness or self.max_clipped or self.max_drift)
+
+    def _shrink(self, batch: np.ndarray) -> np.ndarray:
+        """(n, h, w) float32 grey copies at 1/downscale size"""
+        height, width = batch.shape[1:3]
+        size = (max(width // self.downscale, 8), max(height // self.downscale, 8))
+        small = np.empty((len(batch), size[1], size[0]), dtype=np.float32)
+        for frame, out in zip(batch, small):
+            if frame.ndim == 3:
+                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+            out[...] = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        return small
+
+    def _drift(self, small: np.ndarray, intervals: np.ndarray) -> np.ndarray:
+        """Whole-field shift of each frame from the one before, per frame interval"""
+        if self._window is None or self._window.shape != small.shape[1:]:
+            self._window = cv2.createHanningWindow(small.shape[2:0:-1], cv2.CV_32F)
+            self._previous = None
+        shifts = np.zeros(len(small))
+        previous = self._previous
+        for i, frame in enumerate(small):
+            if previous is not None:
+                (dx, dy), response = cv2.phaseCorrelate(previous, frame, self._window)
+                if response >= _MIN_RESPONSE:
+                    shifts[i] = np.hypot(dx, dy)
+            previous = frame
+        self._previous = small[-1].copy()
+        return shifts * self.downscale / intervals
+
+    def check(self, batch: np.ndarray, gaps: Optional[np.ndarray] = None) -> np.ndarray:
+        """Boolean mask of the frames in `batch` that pass; `gaps[i]` frames were skipped after frame i"""
+        n = len(batch)
+        keep = np.ones(n, dtype=bool)
+        if not n or not self.enabled:
+            return keep
+        small = self._shrink(batch)
+
+        c = small[:, 1:-1, 1:-1]
+        laplacian = small[:, :-2, 1:-1] + small[:, 2:, 1:-1] + small[:, 1:-1, :-2] + small[:, 1:-1, 2:] - 4 * c
+        sharpness = laplacian.var(axis=(1, 2))
+        clipped = ((small <= _DARK) | (small >= _BRIGHT)).mean(axis=(1, 2))
+
+        blurry = sharpness < self.min_sharpness if self.min_sharpness else np.zeros(n, dtype=bool)
+        exposure = clipped > self.max_clipped if self.max_clipped else np.zeros(n, dtype=bool)
+        drifting = np.zeros(n, dtype=bool)
+        if self.max_drift:
+            # Frame i is gaps[i - 1] + 1 frames after frame i - 1
+            intervals = np.ones(n)
+            intervals[0] += self._last_gap
+            if gaps is not None:
+                intervals[1:] += gaps[:n - 1]
+                self._last_gap = int(gaps[n - 1])
+            drifting = self._drift(small, intervals) > self.max_drift
+        keep = ~(blurry | exposure | drifting)
+
+        stats = self.stats
+        stats.frames_checked += n
+        stats.frames_rejected += int(n - keep.sum())
+        stats.rejected_blur += int(blurry.sum())
+        stats.rejected_exposure += int(exposure.sum())
+        stats.rejected_drift += int(drifting.sum())
+        stats.sharpness_total += float(sharpness.sum())
+        return keep
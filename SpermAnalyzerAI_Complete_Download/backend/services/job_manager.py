@@ -0,0 +1,265 @@
+"""
+In-process job tracking for Sperm Analyzer AI
+Runs analyses in the background, keeps their status and results, and
+notifies waiters whenever a job changes.
+"""
+
+import asyncio
+import logging
+import os
+import shutil
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from backend.config import settings
+from backend.services.admission import Ticket
+from backend.services.checkpoints import claim, load_manifests, release, save_manifest
+from backend.services.trajectories import trajectory_store
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = ("completed", "failed", "cancelled")
+# Part of every job ETag, so a job resumed by a later process never repeats an old tag
+_EPOCH = os.urandom(4).hex()
+
+
+class JobCancelled(Exception):
+    """Raised inside a job's work once cancellation has been requested"""
+
+
+class CancelToken:
+    """Checked by the pipeline between batches so a cancelled job stops promptly"""
+
+    def __init__(self):
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        self.cancelled = True
+
+    def raise_if_cancelled(self) -> None:
+        if self.cancelled:
+            raise JobCancelled()
+
+
+@dataclass
+class Job:
+    job_id: str
+    filename: Optional[str] = None
+    status: str = "queued"  # queued -> running -> completed | failed | cancelled
+    created_at: datetime = field(default_factory=datetime.now)
+    updated_at: datetime = field(default_factory=datetime.now)
+    progress: Dict[str, Any] = field(default_factory=dict)
+    preliminary: Optional[Dict[str, Any]] = None  # quick estimate, superseded by result
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    spec: Dict[str, Any] = field(default_factory=dict)  # submit parameters, as saved for resuming
+    version: int = 0  # bumped on every change
+    task: Optional[asyncio.Task] = field(default=None, repr=False)
+    token: CancelToken = field(default_factory=CancelToken, repr=False)
+    _claim: Optional[int] = field(default=None, repr=False)  # lock fd on the scratch directory
+    _changed: asyncio.Event = field(default_factory=asyncio.Event, repr=False)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in TERMINAL_STATUSES
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "filename": self.filename,
+            "status": self.status,
+            "created_at": self.created_at.isoformat(),
+            "updated_at": self.updated_at.isoformat(),
+            "progress": self.progress,
+            "preliminary": self.preliminary,
+            "result": self.result,
+            "error": self.error,
+            "cancel_requested": self.token.cancelled,
+        }
+
+    @property
+    def etag(self) -> str:
+        """Strong validator for to_dict(); changes with every version"""
+        return f'"{self.job_id}-{_EPOCH}-{self.version}"'
+
+    def touch(self) -> None:
+        """Record a change and wake everyone waiting on the previous state"""
+        self.version += 1
+        self.updated_at = datetime.now()
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def wait_for_change(self, version: int, timeout: Optional[float] = None) -> bool:
+        """Wait until the job moves past `version`; False on timeout"""
+        if self.version != version:
+            return True
+        try:
+            await asyncio.wait_for(self._changed.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+
+class JobReporter:
+    """Handed to a job's work; calling it publishes a progress update"""
+
+    def __init__(self, job: Job, work_dir: Path):
+        self._job = job
+        self.work_dir = work_dir  # scratch space, removed when the job ends
+        self.cancel = job.token
+
+    def __call__(self, update: Dict[str, Any]) -> None:
+        self._job.progress = update
+        self._job.touch()
+
+    def preliminary(self, result: Dict[str, Any]) -> None:
+        """Publish a quick estimate ahead of the final result"""
+        self._job.preliminary = result
+        self._job.touch()
+
+
+# work(reporter) runs the analysis, reporting progress as it goes
+JobWork = Callable[[JobReporter], Awaitable[Dict[str, Any]]]
+
+
+class JobManager:
+    """Registry of background analysis jobs"""
+
+    def __init__(self, work_root: Path):
+        self._jobs: Dict[str, Job] = {}
+        self.work_root = work_root
+        # Called with each job as it reaches a terminal status
+        self.on_finished: List[Callable[[Job], None]] = []
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def work_dir(self, job_id: str) -> Path:
+        return self.work_root / job_id
+
+    def submit(
+        self,
+        job_id: str,
+        work: JobWork,
+        filename: Optional[str] = None,
+        ticket: Optional[Ticket] = None,
+        spec: Optional[Dict[str, Any]] = None,
+        claimed: Optional[int] = None,
+    ) -> Job:
+        """Register a job and start running `work` on the event loop
+
+        With an admission `ticket` the job stays queued until it gets a slot.
+        A JSON `spec` is saved in the job's scratch directory so a restarted
+        worker can requeue it (see interrupted); `claimed` is the lock of a
+        directory already claimed for such a resumed job.
+        """
+        job = Job(job_id=job_id, filename=filename, spec=spec or {})
+        if spec is not None:
+            work_dir = self.work_dir(job_id)
+            job._claim = claimed if claimed is not None else claim(work_dir, create=True)
+            save_manifest(work_dir, spec)
+        self._jobs[job_id] = job
+        job.task = asyncio.create_task(self._admit(job, work, ticket))
+        job.task.add_done_callback(lambda task: self._cancelled_before_start(job, ticket, task))
+        return job
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Ask a job to stop; it ends as cancelled within about one batch
+
+        A job still waiting for an admission slot is dropped from the queue
+        straight away.
+        """
+        job = self._jobs.get(job_id)
+        if job is None or job.finished:
+            return job
+        job.token.cancel()
+        if job.status == "queued":
+            job.task.cancel()
+        job.touch()
+        return job
+
+    def interrupted(self):
+        """(spec, lock) for each job left behind by a worker that died
+
+        Jobs still held by another live worker process are skipped.
+        """
+        for spec in load_manifests(self.work_root):
+            if spec.get("job_id") in self._jobs:
+                continue
+            lock = claim(self.work_dir(spec["job_id"]))
+            if lock is not None:
+                yield spec, lock
+
+    def forget(self, job_id: str) -> None:
+        """Drop a finished job, its result and its stored trajectories"""
+        job = self._jobs.get(job_id)
+        if job is not None and job.finished:
+            del self._jobs[job_id]
+            trajectory_store.delete(job_id)
+
+    async def _admit(self, job: Job, work: JobWork, ticket: Optional[Ticket]) -> None:
+        try:
+            if ticket is None:
+                await self._run(job, work)
+                return
+            async with ticket:
+                await self._run(job, work)
+        except asyncio.CancelledError:
+            self._stopped(job)
+            raise
+
+    def _cancelled_before_start(self, job: Job, ticket: Optional[Ticket], task: asyncio.Task) -> None:
+        # A task cancelled before its first step never enters _admit
+        if task.cancelled() and not job.finished:
+            if ticket is not None:
+                ticket.cancel()
+            self._stopped(job)
+
+    def _stopped(self, job: Job) -> None:
+        """The job's task was cancelled: by the user (via cancel) or by the worker shutting down"""
+        if job.token.cancelled:
+            self._release_scratch(job)
+            self._set_status(job, "cancelled")
+        elif job._claim is not None:
+            # Shutdown: keep the checkpoint and manifest so the next start resumes the job
+            release(job._claim)
+            job._claim = None
+
+    async def _run(self, job: Job, work: JobWork) -> None:
+        self._set_status(job, "running")
+        status = "completed"
+        try:
+            job.token.raise_if_cancelled()
+            job.result = await work(JobReporter(job, self.work_dir(job.job_id)))
+        except JobCancelled:
+            logger.info("Job %s cancelled", job.job_id)
+            status = "cancelled"
+        except Exception as e:
+            logger.exception("Job %s failed", job.job_id)
+            job.error = str(e)
+            status = "failed"
+        # Scratch files (partial output, checkpoints) are only needed while the job runs
+        await asyncio.to_thread(self._release_scratch, job)
+        self._set_status(job, status)
+
+    def _release_scratch(self, job: Job) -> None:
+        # Delete before unlocking so no other worker can claim a finished job
+        shutil.rmtree(self.work_dir(job.job_id), True)
+        if job._claim is not None:
+            release(job._claim)
+            job._claim = None
+
+    def _set_status(self, job: Job, status: str) -> None:
+        job.status = status
+        job.touch()
+        if job.finished:
+            for callback in self.on_finished:
+                try:
+                    callback(job)
+                except Exception:
+                    logger.exception("Finished-job hook failed for %s", job.job_id)
+
+
+job_manager = JobManager(Path(settings.UPLOAD_DIR) / "jobs")
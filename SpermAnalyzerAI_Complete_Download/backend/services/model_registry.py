@@ -0,0 +1,295 @@
+"""
+Detection model registry for Sperm Analyzer AI
+Versioned model entries that can be replaced without a restart: a new
+version is verified, loaded and warmed up in the background, then swapped
+in for new jobs while running jobs finish on the version they started
+with. A replaced version is unloaded once its last job releases it.
+"""
+
+import asyncio
+import gc
+import hashlib
+import logging
+import threading
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+import numpy as np
+
+from backend.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Loader(path, input_size) -> object with `async detect(frame)`; runs in a worker thread
+Loader = Callable[[str, int], Any]
+
+_BACKENDS: Dict[str, Loader] = {}
+
+
+def register_backend(name: str, loader: Loader) -> None:
+    """Make an inference backend available to ModelRegistry.load()"""
+    _BACKENDS[name] = loader
+
+
+def backends() -> List[str]:
+    return sorted(_BACKENDS)
+
+
+class UltralyticsDetector:
+    """An ultralytics YOLO model behind the detector interface
+
+    detect() returns ([left, top, width, height], confidence, class) per
+    box, the tracker's input format. The model is shared by every job in
+    the worker and an ultralytics model is not safe to call from several
+    threads at once, so calls take turns.
+    """
+
+    def __init__(self, path: str, input_size: int, confidence: float = 0.5):
+        from ultralytics import YOLO
+
+        self.model = YOLO(path)
+        self.input_size = input_size
+        self.confidence = confidence
+        self._lock = threading.Lock()
+
+    def _detect(self, frame: np.ndarray) -> list:
+        if frame.ndim == 2:
+            frame = np.repeat(frame[..., None], 3, axis=-1)
+        with self._lock:
+            result = self.model.predict(frame, imgsz=self.input_size, conf=self.confidence, verbose=False)[0]
+            boxes = result.boxes
+            xyxy = boxes.xyxy.cpu().numpy()
+            confidences, labels = boxes.conf.cpu().numpy(), boxes.cls.cpu().numpy()
+        return [
+            ([float(x1), float(y1), float(x2 - x1), float(y2 - y1)], float(confidence), int(label))
+            for (x1, y1, x2, y2), confidence, label in zip(xyxy, confidences, labels)
+        ]
+
+    async def detect(self, frame: np.ndarray) -> list:
+        return await asyncio.to_thread(self._detect, frame)
+
+
+register_backend("ultralytics", lambda path, input_size: UltralyticsDetector(path, input_size, settings.DETECTION_CONFIDENCE))
+
+
+class ModelLoadError(Exception):
+    pass
+
+
+class ModelBusy(ModelLoadError):
+    pass
+
+
+@dataclass
+class ModelEntry:
+    """One version of a named model and its lifecycle state
+
+    state: loading -> active -> retired -> unloaded, or loading -> failed.
+    """
+
+    name: str
+    version: int
+    backend: str
+    path: str
+    input_size: int
+    sha256: Optional[str] = None
+    state: str = "loading"
+    error: Optional[str] = None
+    refcount: int = 0
+    created_at: float = field(default_factory=time.time)
+    activated_at: Optional[float] = None
+    warmup_ms: Optional[float] = None
+    model: Any = field(default=None, repr=False)
+
+    async def detect(self, frame: np.ndarray) -> list:
+        return await self.model.detect(frame)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "version": self.version,
+            "backend": self.backend,
+            "path": self.path,
+            "input_size": self.input_size,
+            "sha256": self.sha256,
+            "state": self.state,
+            "error": self.error,
+            "in_use": self.refcount,
+            "created_at": self.created_at,
+            "activated_at": self.activated_at,
+            "warmup_ms": self.warmup_ms,
+        }
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _release_memory() -> None:
+    gc.collect()
+    try:
+        import torch
+    except ImportError:
+        return
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+class ModelRegistry:
+    """Active model per name plus every version still loaded
+
+    Jobs hold a lease on the version that was active when they started
+    (see lease()); swapping versions never touches a running job. Swaps
+    and refcounts only change on the event loop, so they need no lock.
+    The registry is per process: with several workers, each one has to
+    be told to load a new version.
+
+    Model files are only loaded from `model_dir`, and only with a known
+    checksum: loading a .pt file unpickles it, which can run code.
+    """
+
+    def __init__(self, model_dir: Path, warmup_runs: int = 2, history: int = 10):
+        self.model_dir = model_dir
+        self.warmup_runs = warmup_runs
+        self.history = history
+        self._active: Dict[str, ModelEntry] = {}
+        self._entries: Dict[str, List[ModelEntry]] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.stats = {"loads": 0, "load_failures": 0, "swaps": 0, "unloads": 0}
+
+    def _add(self, entry: ModelEntry) -> None:
+        entries = self._entries.setdefault(entry.name, [])
+        entries.append(entry)
+        # Forget old versions that are no longer loaded
+        while len(entries) > self.history and entries[0].state in ("unloaded", "failed"):
+            entries.pop(0)
+
+    def _next_version(self, name: str) -> int:
+        return max((entry.version for entry in self._entries.get(name, [])), default=0) + 1
+
+    def install(
+        self,
+        name: str,
+        model: Any,
+        backend: str,
+        path: str,
+        input_size: int,
+        sha256: Optional[str] = None,
+    ) -> ModelEntry:
+        """Activate an already loaded model immediately (used for the startup model)"""
+        entry = ModelEntry(name, self._next_version(name), backend, path, input_size, sha256, model=model)
+        self._add(entry)
+        self._activate(entry)
+        return entry
+
+    def load(
+        self,
+        name: str,
+        path: str,
+        sha256: str,
+        backend: str = "ultralytics",
+        input_size: Optional[int] = None,
+    ) -> ModelEntry:
+        """Start loading a new version in the background; it goes live once warmed up
+
+        `path` is relative to the model directory and the file must match
+        `sha256`. Raises ModelLoadError if the backend is unknown, the path
+        leaves the model directory, and ModelBusy if a load for `name` is
+        already in progress.
+        """
+        if backend not in _BACKENDS:
+            raise ModelLoadError(f"Unknown backend {backend!r}; available: {', '.join(backends())}")
+        if not sha256:
+            raise ModelLoadError("A sha256 checksum is required to load a model")
+        root = self.model_dir.resolve()
+        resolved = (root / path).resolve()
+        if not resolved.is_relative_to(root):
+            raise ModelLoadError(f"Model files must be inside {self.model_dir}")
+        if name in self._tasks and not self._tasks[name].done():
+            raise ModelBusy(f"A version of {name!r} is already loading")
+        entry = ModelEntry(
+            name,
+            self._next_version(name),
+            backend,
+            str(resolved),
+            input_size or settings.MODEL_INPUT_SIZE,
+            sha256.lower(),
+        )
+        self._add(entry)
+        self._tasks[name] = asyncio.create_task(self._load(entry))
+        return entry
+
+    async def _load(self, entry: ModelEntry) -> None:
+        try:
+            if not Path(entry.path).is_file():
+                raise ModelLoadError(f"Model file not found: {entry.path}")
+            checksum = await asyncio.to_thread(file_sha256, entry.path)
+            if checksum != entry.sha256:
+                raise ModelLoadError(f"Checksum mismatch: expected {entry.sha256}, file has {checksum}")
+            entry.model = await asyncio.to_thread(_BACKENDS[entry.backend], entry.path, entry.input_size)
+
+            # The first inferences pay for lazy initialisation (CUDA context, kernel selection)
+            channels = () if settings.MODEL_COLOR_MODE == "gray" else (3,)
+            blank = np.zeros((entry.input_size, entry.input_size) + channels, dtype=np.uint8)
+            started = time.perf_counter()
+            for _ in range(self.warmup_runs):
+                await entry.detect(blank)
+            entry.warmup_ms = round((time.perf_counter() - started) * 1000, 1)
+        except Exception as e:
+            entry.state, entry.error, entry.model = "failed", str(e), None
+            self.stats["load_failures"] += 1
+            logger.warning("Loading %s v%d from %s failed: %s", entry.name, entry.version, entry.path, e)
+            return
+        self.stats["loads"] += 1
+        self._activate(entry)
+
+    def _activate(self, entry: ModelEntry) -> None:
+        previous = self._active.get(entry.name)
+        entry.state, entry.activated_at = "active", time.time()
+        self._active[entry.name] = entry
+        logger.info("Model %s v%d (%s) active", entry.name, entry.version, entry.path)
+        if previous is not None:
+            self.stats["swaps"] += 1
+            previous.state = "retired"
+            self._unload_if_idle(previous)
+
+    def _unload_if_idle(self, entry: ModelEntry) -> None:
+        if entry.state == "retired" and entry.refcount == 0:
+            entry.state, entry.model = "unloaded", None
+            self.stats["unloads"] += 1
+            _release_memory()
+            logger.info("Model %s v%d unloaded", entry.name, entry.version)
+
+    def active(self, name: str) -> ModelEntry:
+        try:
+            return self._active[name]
+        except KeyError:
+            raise KeyError(f"No active model named {name!r}") from None
+
+    @asynccontextmanager
+    async def lease(self, name: str) -> AsyncIterator[ModelEntry]:
+        """The active version of `name`, kept loaded until the block exits"""
+        entry = self.active(name)
+        entry.refcount += 1
+        try:
+            yield entry
+        finally:
+            entry.refcount -= 1
+            self._unload_if_idle(entry)
+
+    def entries(self, name: Optional[str] = None) -> Dict[str, List[Dict[str, Any]]]:
+        names = [name] if name is not None else sorted(self._entries)
+        return {key: [entry.to_dict() for entry in self._entries.get(key, [])] for key in names}
+
+
+model_registry = ModelRegistry(Path(settings.MODEL_DIR), warmup_runs=settings.MODEL_WARMUP_RUNS)
+
+# Registry name of the sperm detector used by the analysis pipeline
+DETECTOR = "detector"
@@ -0,0 +1,208 @@
+"""
+Per-track morphology for Sperm Analyzer AI
+Each sperm is classified from its sharpest head crops instead of once per
+detection per frame: a few candidate frames per track are re-read, their
+crops scored for sharpness and the best ones classified in batches.
+"""
+
+import asyncio
+import math
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import cv2
+import numpy as np
+
+from backend.services.trajectories import Trajectories
+from backend.services.video_processor import Letterbox, VideoProcessor
+
+
+class MorphologyClassifier:
+    """Head-crop classifier (an ultralytics classification model), loaded on first use
+
+    The model must have a class named "normal"; its probability is returned.
+    One instance is shared by all jobs, and an ultralytics model is not safe
+    to call from several threads at once, so calls take turns.
+    """
+
+    def __init__(self, model_path: Optional[str], batch_size: int = 64, input_size: int = 64):
+        self.model_path = model_path
+        self.batch_size = batch_size
+        self.input_size = input_size
+        self._model = None
+        self._normal_index: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.model_path)
+
+    def _load(self):
+        with self._lock:
+            if self._model is None:
+                from ultralytics import YOLO
+
+                model = YOLO(self.model_path)
+                names = {index: str(name).lower() for index, name in model.names.items()}
+                if "normal" not in names.values():
+                    raise ValueError(f"Morphology model {self.model_path} has no 'normal' class")
+                self._normal_index = next(index for index, name in names.items() if name == "normal")
+                self._model = model
+        return self._model
+
+    def predict(self, crops: np.ndarray) -> np.ndarray:
+        """P(normal) for each (n, s, s[, 3]) uint8 crop, one model call per batch"""
+        model = self._load()
+        if crops.ndim == 3:
+            crops = np.repeat(crops[..., None], 3, axis=-1)
+        probabilities = []
+        with self._lock:
+            for start in range(0, len(crops), self.batch_size):
+                results = model.predict(list(crops[start:start + self.batch_size]), imgsz=self.input_size, verbose=False)
+                probabilities.extend(float(result.probs.data[self._normal_index]) for result in results)
+        return np.asarray(probabilities)
+
+
+def _candidates(trajectories: Trajectories, per_track: int, frame_step: int) -> List[np.ndarray]:
+    """Point indices to score for each track
+
+    Candidates are taken from frames on a `frame_step` grid where possible,
+    so tracks alive at the same time share the frames that must be decoded.
+    """
+    picks = []
+    for i in range(len(trajectories)):
+        start, end = trajectories.offsets[i], trajectories.offsets[i + 1]
+        points = np.arange(start, end)
+        on_grid = points[trajectories.frames[start:end] % frame_step == 0]
+        pool = on_grid if len(on_grid) else points[[len(points) // 2]]
+        spread = np.unique(np.linspace(0, len(pool) - 1, min(per_track, len(pool))).round().astype(int))
+        picks.append(pool[spread])
+    return picks
+
+
+def _sharpness(crops: np.ndarray) -> np.ndarray:
+    """Variance of the Laplacian of each crop"""
+    grey = crops.astype(np.float32)
+    if grey.ndim == 4:
+        grey = grey @ np.array([0.114, 0.587, 0.299], dtype=np.float32)  # BGR
+    c = grey[:, 1:-1, 1:-1]
+    laplacian = grey[:, :-2, 1:-1] + grey[:, 2:, 1:-1] + grey[:, 1:-1, :-2] + grey[:, 1:-1, 2:] - 4 * c
+    return laplacian.var(axis=(1, 2))
+
+
+async def classify_still(
+    classifier: MorphologyClassifier,
+    frame: np.ndarray,
+    centres: np.ndarray,
+    crop_size: int = 48,
+) -> Dict[str, Any]:
+    """Normal/abnormal percentages for the detections of one still frame
+
+    `centres` are (n, 2) positions in `frame`'s pixels. There is only one
+    view of each cell, so every detection is classified from that crop.
+    """
+    if not len(centres):
+        return {"normal": None, "abnormal": None, "cells_classified": 0}
+    size = (crop_size, crop_size)
+    crops = np.stack([cv2.getRectSubPix(frame, size, (float(x), float(y))) for x, y in centres])
+    normal = await asyncio.to_thread(classifier.predict, crops)
+    normal_percent = 100.0 * float(np.mean(normal >= 0.5))
+    return {
+        "normal": round(normal_percent, 2),
+        "abnormal": round(100.0 - normal_percent, 2),
+        "cells_classified": len(crops),
+    }
+
+
+class TrackMorphology:
+    """Classifies the tracks of one clip"""
+
+    def __init__(
+        self,
+        classifier: MorphologyClassifier,
+        crop_size: int = 48,
+        candidates_per_track: int = 8,
+        crops_per_track: int = 2,
+        frame_step: int = 15,
+    ):
+        self.classifier = classifier
+        self.crop_size = crop_size
+        self.candidates_per_track = candidates_per_track
+        self.crops_per_track = crops_per_track
+        self.frame_step = frame_step
+        self.stats = {"frames_read": 0, "crops_scored": 0, "crops_classified": 0, "classifier_calls": 0}
+
+    def _best_crops(
+        self,
+        processor: VideoProcessor,
+        file_path: Path,
+        trajectories: Trajectories,
+        letterbox: Letterbox,
+    ):
+        """Sharpest crops of every track, and which track each belongs to"""
+        picks = _candidates(trajectories, self.candidates_per_track, self.frame_step)
+        points = np.concatenate(picks)
+        owners = np.concatenate([np.full(len(pick), i) for i, pick in enumerate(picks)])
+        frames = trajectories.frames[points]
+        # Tracks are in native pixels; crops come from the processor's letterboxed frames
+        centres = letterbox.to_frame(trajectories.xy[points])
+        size = (self.crop_size, self.crop_size)
+
+        crops = None
+        order = np.argsort(frames, kind="stable")
+        position = 0
+        for index, frame in processor.iter_frames(file_path, frames[order].tolist()):
+            if crops is None:
+                crops = np.zeros((len(points), self.crop_size, self.crop_size) + frame.shape[2:], dtype=np.uint8)
+            self.stats["frames_read"] += 1
+            while position < len(order) and frames[order[position]] == index:
+                k = order[position]
+                x, y = centres[k]
+                crops[k] = cv2.getRectSubPix(frame, size, (float(x), float(y)))
+                position += 1
+        if crops is None:
+            return None, None
+        found = np.zeros(len(points), dtype=bool)
+        found[order[:position]] = True
+        crops, owners = crops[found], owners[found]
+        self.stats["crops_scored"] += len(crops)
+
+        # Rank each track's crops by sharpness and keep the best few
+        sharpness = _sharpness(crops)
+        ranked = np.lexsort((-sharpness, owners))
+        first = np.r_[True, owners[ranked][1:] != owners[ranked][:-1]]
+        rank = np.arange(len(ranked)) - np.maximum.accumulate(np.where(first, np.arange(len(ranked)), 0))
+        chosen = ranked[rank < self.crops_per_track]
+        return crops[chosen], owners[chosen]
+
+    async def classify(
+        self,
+        processor: VideoProcessor,
+        file_path: Path,
+        trajectories: Trajectories,
+        letterbox: Letterbox,
+    ) -> Dict[str, Any]:
+        """Normal/abnormal percentages over the clip's tracks, plus how much work it took
+
+        `letterbox` places the (native pixel) tracks in `processor`'s frames.
+        """
+        # Mean P(normal) of each track's crops
+        labelled: List[float] = []
+        if len(trajectories):
+            crops, owners = await asyncio.to_thread(self._best_crops, processor, file_path, trajectories, letterbox)
+            if crops is not None and len(crops):
+                normal = await asyncio.to_thread(self.classifier.predict, crops)
+                self.stats["crops_classified"] += len(crops)
+                self.stats["classifier_calls"] += math.ceil(len(crops) / self.classifier.batch_size)
+                totals = np.bincount(owners, weights=normal, minlength=len(trajectories))
+                counts = np.bincount(owners, minlength=len(trajectories))
+                labelled = (totals[counts > 0] / counts[counts > 0]).tolist()
+
+        normal_percent = 100.0 * sum(p >= 0.5 for p in labelled) / len(labelled) if labelled else None
+        return {
+            "normal": round(normal_percent, 2) if normal_percent is not None else None,
+            "abnormal": round(100.0 - normal_percent, 2) if normal_percent is not None else None,
+            "tracks_classified": len(labelled),
+            **self.stats,
+        }
@@ -0,0 +1,120 @@
+"""
+Online tracker for Sperm Analyzer AI
+Links detections frame by frame as they arrive, so running estimates
+(convergence checks, live sessions) cost the new frames only instead of
+re-tracking the whole history each time. Final results still come from
+the full tracker.
+"""
+
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+
+def detection_centres(detection: Any) -> np.ndarray:
+    """(n, 2) centres of one frame's detections
+
+    Understands the same formats as pipeline.native_detections():
+    ([left, top, width, height], confidence, class) tuples, {"bbox"/"box":
+    [x1, y1, x2, y2]} or {"center"/"centroid": [x, y]} mappings and
+    [x1, y1, x2, y2, ...] rows. Anything else is ignored.
+    """
+    centres = []
+    for item in detection:
+        if isinstance(item, dict):
+            box = item.get("bbox") if item.get("bbox") is not None else item.get("box")
+            centre = item.get("center") if item.get("center") is not None else item.get("centroid")
+            if centre is not None:
+                centres.append(centre[:2])
+            elif box is not None:
+                centres.append(((box[0] + box[2]) / 2, (box[1] + box[3]) / 2))
+        elif isinstance(item, (tuple, list)) and item and np.ndim(item[0]) == 1 and len(item[0]) == 4:
+            left, top, width, height = item[0]
+            centres.append((left + width / 2, top + height / 2))
+        elif isinstance(item, (tuple, list, np.ndarray)) and len(item) >= 4 and all(np.isscalar(v) for v in item[:4]):
+            centres.append(((item[0] + item[2]) / 2, (item[1] + item[3]) / 2))
+    return np.asarray(centres, dtype=np.float64).reshape(-1, 2)
+
+
+def _greedy_pairs(distance: np.ndarray):
+    """(rows, columns) matched closest pair first, ignoring infinite distances
+
+    Same result as walking all pairs in order of distance, but done in
+    rounds: a pair that is each other's nearest remaining partner would be
+    taken by that walk, so every round takes all such pairs at once.
+    Rounds are few in practice, and there is no per-pair Python loop.
+    """
+    distance = distance.copy()
+    rows, columns = [], []
+    everything = np.arange(len(distance))
+    while True:
+        nearest = distance.argmin(axis=1)
+        mutual = np.isfinite(distance[everything, nearest]) & (distance.argmin(axis=0)[nearest] == everything)
+        if not mutual.any():
+            break
+        rows.append(everything[mutual])
+        columns.append(nearest[mutual])
+        distance[rows[-1], :] = np.inf
+        distance[:, columns[-1]] = np.inf
+    if not rows:
+        return np.empty(0, dtype=int), np.empty(0, dtype=int)
+    return np.concatenate(rows), np.concatenate(columns)
+
+
+class OnlineTracker:
+    """Greedy nearest-neighbour linking of detection centres, one frame at a time
+
+    A track takes the closest unclaimed detection within `max_distance`
+    pixels per elapsed frame of its last position, and ends after
+    `max_missed` frames without one.
+    """
+
+    def __init__(self, max_distance: float, max_missed: int):
+        self.max_distance = max_distance
+        self.max_missed = max_missed
+        self.frames_seen = 0
+        self._next_id = 0
+        # track id -> [(frame, x, y), ...]
+        self._paths: Dict[int, List[tuple]] = {}
+        self._active: List[int] = []
+
+    def extend(self, detections: Iterable[Any]) -> None:
+        """Link the next frames' detections, in order"""
+        for detection in detections:
+            self._link(self.frames_seen, detection_centres(detection))
+            self.frames_seen += 1
+
+    def _link(self, frame: int, centres: np.ndarray) -> None:
+        # Tracks unseen for too long can no longer be extended
+        self._active = [t for t in self._active if frame - self._paths[t][-1][0] <= self.max_missed]
+        claimed = np.zeros(len(centres), dtype=bool)
+        if self._active and len(centres):
+            last = np.array([self._paths[t][-1] for t in self._active], dtype=np.float64)
+            distance = np.hypot(*(last[:, None, 1:] - centres[None, :, :]).transpose(2, 0, 1))
+            distance[distance > self.max_distance * (frame - last[:, :1])] = np.inf
+            for track, index in zip(*_greedy_pairs(distance)):
+                claimed[index] = True
+                x, y = centres[index]
+                self._paths[self._active[track]].append((frame, float(x), float(y)))
+        for x, y in centres[~claimed]:
+            self._paths[self._next_id] = [(frame, float(x), float(y))]
+            self._active.append(self._next_id)
+            self._next_id += 1
+
+    def drop(self, before: int) -> None:
+        """Forget points from frames before `before`, and tracks left empty"""
+        for track_id in list(self._paths):
+            path = [point for point in self._paths[track_id] if point[0] >= before]
+            if path:
+                self._paths[track_id] = path
+            else:
+                del self._paths[track_id]
+        self._active = [t for t in self._active if t in self._paths]
+
+    def tracks(self, min_points: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Tracks so far as {"track_id", "positions": [(frame, x, y), ...]}"""
+        return [
+            {"track_id": track_id, "positions": list(path)}
+            for track_id, path in self._paths.items()
+            if min_points is None or len(path) >= min_points
+        ]
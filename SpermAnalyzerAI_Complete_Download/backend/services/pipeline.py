@@ -0,0 +1,608 @@
+"""
+Analysis pipeline for Sperm Analyzer AI
+Shared by the upload, batch and job endpoints
+"""
+
+import asyncio
+import logging
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from backend.config import settings
+from backend.services.admission import Overloaded, Priority, Ticket, admission
+from backend.services.blob_store import blob_store
+from backend.services.casa_convergence import RunningCASAEstimate
+from backend.services.checkpoints import CHECKPOINT_FILE, Checkpoint, load_checkpoint, save_checkpoint
+from backend.services.deadline import estimate_seconds, plan_analysis, replan_stride, throughput
+from backend.services.frame_qc import FrameQC
+from backend.services.job_manager import CancelToken, Job, job_manager
+from backend.services.kinematics import measure, summarize
+from backend.services.model_registry import DETECTOR, ModelEntry, model_registry
+from backend.services.morphology import MorphologyClassifier, TrackMorphology, classify_still
+from backend.services.online_tracker import OnlineTracker, detection_centres
+from backend.services.trajectories import normalize_tracks, trajectory_store
+from backend.services.video_processor import Letterbox, VideoProcessor, IMAGE_EXTENSIONS
+from backend.services.sperm_detector import SpermDetector
+from backend.services.sperm_tracker import SpermTracker
+from backend.services.casa_calculator import CASACalculator
+
+logger = logging.getLogger(__name__)
+
+# Initialize services
+video_processor = VideoProcessor(
+    target_shape=(settings.MODEL_INPUT_SIZE, settings.MODEL_INPUT_SIZE),
+    color_mode=settings.MODEL_COLOR_MODE
+)
+# Quick triage pass: the first QUICK_PASS_SECONDS at reduced resolution
+_quick_size = int(settings.MODEL_INPUT_SIZE * settings.QUICK_PASS_SCALE)
+quick_video_processor = VideoProcessor(
+    target_shape=(_quick_size, _quick_size),
+    color_mode=settings.MODEL_COLOR_MODE,
+    max_frames=int(settings.QUICK_PASS_SECONDS * settings.FRAME_RATE)
+)
+# Jobs lease the detector from the registry so it can be replaced while they run;
+# the registry holds the only reference, so a replaced detector is freed
+model_registry.install(
+    DETECTOR, SpermDetector(),
+    backend="builtin",
+    path=settings.YOLO_MODEL_PATH,
+    input_size=settings.MODEL_INPUT_SIZE
+)
+sperm_tracker = SpermTracker()
+casa_calculator = CASACalculator()
+morphology_classifier = MorphologyClassifier(
+    settings.MORPHOLOGY_MODEL_PATH,
+    batch_size=settings.MORPHOLOGY_BATCH_SIZE,
+    input_size=settings.MORPHOLOGY_INPUT_SIZE
+)
+
+# Receives {"stage": ..., ...} snapshots while a job runs
+ProgressCallback = Callable[[Dict[str, Any]], None]
+
+def _no_progress(update: Dict[str, Any]) -> None:
+    pass
+
+def processor_for(processor: VideoProcessor, model: ModelEntry) -> VideoProcessor:
+    """`processor`, or a copy producing frames for a model whose input size is not MODEL_INPUT_SIZE"""
+    if model.input_size == settings.MODEL_INPUT_SIZE:
+        return processor
+    size = round(processor.target_shape[0] * model.input_size / settings.MODEL_INPUT_SIZE)
+    return VideoProcessor(
+        target_shape=(size, size),
+        color_mode=processor.color_mode,
+        max_frames=processor.max_frames
+    )
+
+def native_detections(detection: Any, letterbox: Letterbox) -> Any:
+    """Map one frame's detections from detector-frame to native pixel coordinates
+    
+    Tracks, CASA velocities and kinematics are measured on these, in the
+    camera's pixels that MICRONS_PER_PIXEL calibrates. Understands the
+    tracker's ([left, top, width, height], confidence, class) tuples,
+    {"bbox"/"box": [x1, y1, x2, y2]} mappings and [x1, y1, x2, y2, ...]
+    rows; anything else is passed through unchanged.
+    """
+    if letterbox.scale == 1.0 and not letterbox.pad_x and not letterbox.pad_y:
+        return detection
+    mapped = []
+    for item in detection:
+        if isinstance(item, dict):
+            item = dict(item)
+            for key in ("bbox", "box"):
+                if item.get(key) is not None:
+                    corners = letterbox.to_native(np.reshape(np.asarray(item[key][:4], dtype=np.float64), (2, 2)))
+                    item[key] = corners.ravel().tolist()
+            for key in ("center", "centroid"):
+                if item.get(key) is not None:
+                    item[key] = letterbox.to_native(item[key][:2]).tolist()
+        elif isinstance(item, (tuple, list)) and item and np.ndim(item[0]) == 1 and len(item[0]) == 4:
+            left, top, width, height = item[0]
+            box = [*letterbox.to_native((left, top)).tolist(), width / letterbox.scale, height / letterbox.scale]
+            item = type(item)([box, *item[1:]])
+        elif isinstance(item, (tuple, list, np.ndarray)) and len(item) >= 4 and all(np.isscalar(v) for v in item[:4]):
+            corners = letterbox.to_native(np.reshape(np.asarray(item[:4], dtype=np.float64), (2, 2)))
+            item = [*corners.ravel().tolist(), *list(item[4:])]
+        mapped.append(item)
+    return mapped
+
+def is_still_image(filename: Optional[str], content_type: Optional[str] = None) -> bool:
+    """Whether an upload is a single still frame rather than a video"""
+    if content_type and content_type.startswith("image/"):
+        return True
+    return Path(filename or "").suffix.lower() in IMAGE_EXTENSIONS
+
+def submit_analysis(
+    job_id: str,
+    filename: str,
+    sha256: str,
+    still: bool,
+    progressive: bool = False,
+    budget: Optional[float] = None,
+    ticket: Optional[Ticket] = None,
+    claimed: Optional[int] = None,
+    patient_id: Optional[str] = None,
+    sample_id: Optional[str] = None,
+    device_id: Optional[str] = None,
+    technician_id: Optional[str] = None
+) -> Job:
+    """Queue a background analysis that a restarted worker can pick up again"""
+    spec = {
+        "job_id": job_id,
+        "filename": filename,
+        "sha256": sha256,
+        "still": still,
+        "progressive": progressive,
+        "budget": budget,
+        "priority": ticket.lane.value if ticket is not None else Priority.routine.value,
+        "tenant": ticket.tenant if ticket is not None else "",
+        "patient_id": patient_id,
+        "sample_id": sample_id,
+        "device_id": device_id,
+        "technician_id": technician_id
+    }
+    return job_manager.submit(
+        job_id,
+        lambda reporter: run_analysis(
+            job_id, filename, sha256, still,
+            progress=reporter,
+            preliminary=reporter.preliminary if progressive else None,
+            budget=budget,
+            cancel=reporter.cancel,
+            work_dir=reporter.work_dir
+        ),
+        filename=filename,
+        ticket=ticket,
+        spec=spec,
+        claimed=claimed
+    )
+
+def resume_interrupted_jobs() -> int:
+    """Requeue jobs whose worker died mid-analysis; videos continue from their last checkpoint"""
+    resumed = 0
+    for spec, lock in job_manager.interrupted():
+        try:
+            ticket = admission.admit(Priority(spec["priority"]), spec["tenant"])
+        except Overloaded:
+            logger.warning("No capacity to resume job %s; it stays on disk for the next start", spec["job_id"])
+            continue
+        submit_analysis(
+            spec["job_id"], spec["filename"], spec["sha256"], spec["still"],
+            progressive=spec["progressive"], budget=spec["budget"], ticket=ticket, claimed=lock,
+            patient_id=spec.get("patient_id"), sample_id=spec.get("sample_id"),
+            device_id=spec.get("device_id"), technician_id=spec.get("technician_id")
+        )
+        resumed += 1
+    return resumed
+
+async def run_analysis(
+    job_id: str,
+    filename: str,
+    sha256: str,
+    still: bool,
+    content: Optional[bytes] = None,
+    progress: ProgressCallback = _no_progress,
+    preliminary: Optional[Callable[[dict], None]] = None,
+    budget: Optional[float] = None,
+    cancel: Optional[CancelToken] = None,
+    work_dir: Optional[Path] = None
+) -> dict:
+    """Run the matching pipeline for one stored field of view
+    
+    When `preliminary` is given, videos first get a quick estimate that is
+    handed to it before the full-accuracy run starts. `budget` bounds the
+    video run time in seconds (see analyze_video). `cancel` is checked
+    between stages and batches; once set, JobCancelled is raised. Videos
+    checkpoint into `work_dir` and resume from a checkpoint found there.
+    The whole run uses the detector version active when it started.
+    """
+    cancel = cancel or CancelToken()
+    # Retention keeps the file until the run is over; morphology reads it again at the end
+    with blob_store.in_use(sha256) as file_path:
+        async with model_registry.lease(DETECTOR) as model:
+            if still:
+                if content is None:
+                    content = await asyncio.to_thread(file_path.read_bytes)
+                cancel.raise_if_cancelled()
+                progress({"stage": "detecting"})
+                results = await analyze_still_image(job_id, filename, content, model)
+            else:
+                resuming = work_dir is not None and (work_dir / CHECKPOINT_FILE).exists()
+                if preliminary is not None and not resuming:
+                    progress({"stage": "quick_pass"})
+                    estimate = await quick_estimate(job_id, filename, file_path, model)
+                    estimate["sha256"] = sha256
+                    preliminary(estimate)
+                    cancel.raise_if_cancelled()
+                results = await analyze_video(job_id, filename, file_path, progress, budget, cancel, work_dir, model)
+    results["sha256"] = sha256
+    results["model"] = {"name": model.name, "version": model.version, "sha256": model.sha256}
+    return results
+
+async def quick_estimate(job_id: str, filename: str, file_path: Path, model: Optional[ModelEntry] = None) -> dict:
+    """Approximate count and motility from a short, downscaled subsample"""
+    model = model or model_registry.active(DETECTOR)
+    processor = processor_for(quick_video_processor, model)
+    frames = await processor.extract_frames(file_path)
+    letterbox = processor.letterbox(await asyncio.to_thread(VideoProcessor.native_shape, file_path))
+    qc = FrameQC.from_settings()
+    # Drift is measured on the frames as decoded, QUICK_PASS_SCALE of the detector input
+    qc.max_drift *= processor.target_shape[0] / model.input_size
+    keep = await asyncio.to_thread(qc.check, letterbox.content(frames))
+    detections = [
+        native_detections(await model.detect(frame), letterbox) if ok else []
+        for frame, ok in zip(frames, keep)
+    ]
+    tracks = await sperm_tracker.track(detections)
+    casa_metrics = await casa_calculator.calculate(tracks)
+    
+    results = _format_results(job_id, filename, casa_metrics)
+    results["preliminary"] = True
+    results["frames_analyzed"] = len(frames)
+    return results
+
+async def analyze_video(
+    job_id: str,
+    filename: str,
+    file_path: Path,
+    progress: ProgressCallback = _no_progress,
+    budget: Optional[float] = None,
+    cancel: Optional[CancelToken] = None,
+    work_dir: Optional[Path] = None,
+    model: Optional[ModelEntry] = None
+) -> dict:
+    """Full video pipeline: frames, detection, tracking and CASA metrics
+    
+    With a `budget` (seconds) the detector input scale and keyframe stride
+    are chosen from measured throughput so the run finishes in time;
+    frames between keyframes get empty detections and the tracker bridges
+    them with its motion model. If the clip's length cannot be told, it is
+    analysed until the next batch would overrun the budget.
+    
+    With a `work_dir`, the frame position and detections so far are saved
+    every CHECKPOINT_INTERVAL seconds and a saved checkpoint is resumed.
+    The tracker runs over the whole detection history, so the detections
+    are all the state it needs.
+    
+    `model` is the detector to use, by default the active one.
+    """
+    cancel = cancel or CancelToken()
+    model = model or model_registry.active(DETECTOR)
+    progress({"stage": "decoding"})
+    started = last_report = last_checkpoint = time.monotonic()
+    
+    checkpoint = None
+    if work_dir is not None:
+        checkpoint = await asyncio.to_thread(load_checkpoint, work_dir)
+    start_frame = checkpoint.frames_read if checkpoint is not None else 0
+    
+    processor = processor_for(video_processor, model)
+    plan = None
+    if budget is not None:
+        frames_in_clip = await asyncio.to_thread(VideoProcessor.count_frames, file_path)
+        frames_left = max(frames_in_clip - start_frame, 0)
+        plan = plan_analysis(throughput, frames_left, budget)
+        if checkpoint is not None:
+            # Earlier detections fix the input scale and frame limit for the rest of the clip
+            plan.scale, plan.frame_limit = checkpoint.scale, checkpoint.frame_limit
+            plan.stride = replan_stride(throughput, plan, frames_left, budget)
+            plan.strides_used = list(checkpoint.strides_used)
+        if plan.scale < 1.0 or plan.frame_limit is not None:
+            size = int(model.input_size * plan.scale)
+            processor = VideoProcessor(
+                target_shape=(size, size),
+                color_mode=settings.MODEL_COLOR_MODE,
+                max_frames=plan.frame_limit
+            )
+    scale = plan.scale if plan is not None else 1.0
+    
+    estimate = online = None
+    if settings.EARLY_STOP_ENABLED:
+        estimate = RunningCASAEstimate(settings.EARLY_STOP_TOLERANCE, settings.EARLY_STOP_MIN_CELLS)
+        # Checks link only the frames detected since the previous one. The
+        # online tracker is a cheap stand-in for the full one, so its estimate
+        # only decides when to stop; it is reported as early_stop_check
+        online = OnlineTracker(settings.TRACKING_MAX_DISTANCE, settings.TRACKING_MAX_AGE)
+    check_every = max(int(settings.EARLY_STOP_CHECK_SECONDS * settings.FRAME_RATE), 1)
+    next_check = max(int(settings.EARLY_STOP_MIN_SECONDS * settings.FRAME_RATE), check_every)
+    
+    # Decode and detect batch by batch so converged clips stop decoding too
+    detected = frames_detected = 0
+    detections = []
+    qc = FrameQC.from_settings()
+    if checkpoint is not None:
+        detections = checkpoint.detections
+        detected, frames_detected = checkpoint.detected, checkpoint.frames_detected
+        qc = FrameQC.from_settings(checkpoint.quality)
+        next_check = max(next_check, start_frame)
+    # Drift is measured on the frames as decoded, which are smaller when downscaled
+    qc.max_drift *= scale
+    stopped_early = False
+    async with processor.stream_frames(file_path, settings.DECODE_BATCH_SIZE) as stream:
+        total = stream.total_frames
+        if start_frame:
+            progress({"stage": "resuming", "frames_processed": start_frame, "frames_total": total})
+            await stream.seek(start_frame)
+        if plan is not None:
+            stream.stride = plan.stride
+            if plan.stride not in plan.strides_used:
+                plan.strides_used.append(plan.stride)
+        
+        read_started = time.monotonic()
+        async for batch in stream:
+            # Leaving the stream releases the capture and its batch buffer
+            cancel.raise_if_cancelled()
+            if stream.stride == 1:
+                throughput.record("decode", time.monotonic() - read_started, len(batch))
+            
+            # Judged on the picture only; the letterbox padding is flat grey
+            keep = await asyncio.to_thread(qc.check, stream.letterbox.content(batch), stream.gaps)
+            detect_started = time.monotonic()
+            for frame, gap, ok in zip(batch, stream.gaps, keep):
+                # Frames failing quality control keep their time slot, like skipped ones
+                detection = native_detections(await model.detect(frame), stream.letterbox) if ok else []
+                detections.append(detection)
+                detected += len(detection)
+                # Skipped frames keep their time slot with no detections
+                detections.extend([] for _ in range(gap))
+            kept = int(keep.sum())
+            frames_detected += kept
+            if kept:
+                throughput.record("detect", (time.monotonic() - detect_started) / (scale * scale), kept)
+            
+            index = len(detections)
+            now = time.monotonic()
+            if now - last_report >= settings.PROGRESS_INTERVAL:
+                last_report = now
+                rate = index / max(now - started, 1e-6)
+                progress({
+                    "stage": "detecting",
+                    "frames_processed": index,
+                    "frames_total": total,
+                    "eta_seconds": round(max(total - index, 0) / rate, 1) if total else None,
+                    "mean_detections_per_frame": round(detected / frames_detected, 2)
+                })
+            
+            if estimate is not None and index >= next_check:
+                next_check = index + check_every
+                track_started = time.monotonic()
+                new_frames = index - online.frames_seen
+                online.extend(detections[online.frames_seen:])
+                estimate.update(await casa_calculator.calculate(online.tracks()))
+                throughput.record("track", time.monotonic() - track_started, new_frames)
+                if estimate.converged:
+                    stopped_early = True
+                    break
+            
+            if plan is not None:
+                seconds_left = budget - (time.monotonic() - started)
+                if total:
+                    stream.stride = replan_stride(throughput, plan, max(total - stream.frames_read, 0), seconds_left)
+                    if stream.stride not in plan.strides_used:
+                        plan.strides_used.append(stream.stride)
+                elif seconds_left < estimate_seconds(throughput, settings.DECODE_BATCH_SIZE, plan.scale, stream.stride):
+                    # Length unknown, so nothing to replan against: stop before a batch that would overrun
+                    plan.frame_limit = len(detections)
+                    break
+            
+            if work_dir is not None and time.monotonic() - last_checkpoint >= settings.CHECKPOINT_INTERVAL:
+                snapshot = Checkpoint(
+                    frames_read=len(detections),
+                    detections=list(detections),
+                    scale=scale,
+                    frame_limit=plan.frame_limit if plan is not None else None,
+                    detected=detected,
+                    frames_detected=frames_detected,
+                    strides_used=list(plan.strides_used) if plan is not None else [],
+                    quality=qc.stats
+                )
+                await asyncio.to_thread(save_checkpoint, work_dir, snapshot)
+                last_checkpoint = time.monotonic()
+            read_started = time.monotonic()
+    
+    if not detections:
+        raise ValueError(f"No frames decoded from: {filename}")
+    if not frames_detected:
+        raise ValueError(f"Every frame of {filename} failed quality control: {qc.stats.to_dict()}")
+    
+    cancel.raise_if_cancelled()
+    # Track sperm movement, once over everything detected
+    progress({"stage": "tracking", "frames_total": len(detections)})
+    track_started = time.monotonic()
+    tracks = await sperm_tracker.track(detections)
+    
+    # Calculate CASA metrics
+    progress({"stage": "calculating", "tracks": len(tracks)})
+    casa_metrics = await casa_calculator.calculate(tracks)
+    throughput.record("track", time.monotonic() - track_started, len(detections))
+    # Intervals of the percentages actually reported; the online estimate
+    # that decided an early stop is only a proxy for these
+    confidence = RunningCASAEstimate(settings.EARLY_STOP_TOLERANCE, settings.EARLY_STOP_MIN_CELLS)
+    confidence.update(casa_metrics)
+    
+    results = _format_results(job_id, filename, casa_metrics)
+    trajectories = normalize_tracks(tracks)
+    if morphology_classifier.enabled and len(trajectories):
+        # One classification per track from its sharpest crops, not one per detection
+        cancel.raise_if_cancelled()
+        progress({"stage": "morphology", "tracks": len(trajectories)})
+        morphology = await TrackMorphology(
+            morphology_classifier,
+            crop_size=max(int(settings.MORPHOLOGY_CROP_SIZE * scale), 8),
+            candidates_per_track=settings.MORPHOLOGY_CANDIDATES,
+            crops_per_track=settings.MORPHOLOGY_CROPS_PER_TRACK,
+            frame_step=settings.MORPHOLOGY_FRAME_STEP
+        ).classify(processor, file_path, trajectories, stream.letterbox)
+        if morphology["normal"] is not None:
+            results["analysis"]["morphology"] = {
+                "normal": morphology["normal"],
+                "abnormal": morphology["abnormal"]
+            }
+        results["morphology"] = morphology
+    # Detections were mapped to native pixels, so tracks and kinematics are in
+    # the camera's pixels whatever the detector input size or deadline scale
+    results["tracks"] = len(trajectories)
+    results["kinematics"] = summarize(
+        measure(trajectories, settings.FRAME_RATE, settings.MICRONS_PER_PIXEL, settings.AVERAGE_PATH_WINDOW)
+    )
+    # Served by /jobs/{job_id}/tracks
+    await asyncio.to_thread(trajectory_store.save, job_id, trajectories)
+    frames_total = len(detections)
+    if plan is not None:
+        frames_total = max(frames_in_clip, frames_total)
+    elif stopped_early:
+        frames_total = max(total, frames_total)
+    results["coverage"] = {
+        "frames_analyzed": len(detections),
+        "frames_detected": frames_detected,
+        "frames_total": frames_total,
+        "fraction_analyzed": round(len(detections) / frames_total, 3),
+        "stopped_early": stopped_early,
+        "resumed_from_frame": start_frame or None,
+        "quality": qc.stats.to_dict(),
+        "convergence": confidence.to_dict(),
+        "early_stop_check": estimate.to_dict() if estimate is not None and estimate.updates else None
+    }
+    if plan is not None:
+        elapsed = time.monotonic() - started
+        results["deadline"] = {
+            "budget_seconds": budget,
+            "elapsed_seconds": round(elapsed, 2),
+            "met": elapsed <= budget,
+            "mode": plan.mode,
+            "input_scale": plan.scale,
+            "keyframe_strides": plan.strides_used,
+            "frame_limit": plan.frame_limit,
+            "estimated_seconds": round(plan.estimated_seconds, 2),
+            "measured_seconds_per_frame": throughput.snapshot()
+        }
+    return results
+
+def _format_results(job_id: str, filename: str, casa_metrics: dict) -> dict:
+    """Shape CASA metrics from a video run into the API result"""
+    return {
+        "job_id": job_id,
+        "timestamp": datetime.now().isoformat(),
+        "filename": filename,
+        "analysis": {
+            "sperm_count": casa_metrics["count"],
+            "concentration": casa_metrics["concentration"],
+            "motility": {
+                "progressive": casa_metrics["progressive_motility"],
+                "non_progressive": casa_metrics["non_progressive_motility"],
+                "immotile": casa_metrics["immotile"]
+            },
+            "velocities": {
+                "vcl": casa_metrics["vcl"],
+                "vsl": casa_metrics["vsl"],
+                "vap": casa_metrics["vap"]
+            },
+            "linearity": casa_metrics["linearity"],
+            "morphology": {
+                "normal": casa_metrics["normal_morphology"],
+                "abnormal": casa_metrics["abnormal_morphology"]
+            }
+        },
+        "processing_time": casa_metrics["processing_time"],
+        "status": "completed"
+    }
+
+def pool_fields(fields: List[dict]) -> dict:
+    """Pool per-field results into one sample-level CASA summary
+    
+    Counts are summed, concentration is averaged over the (equal-volume)
+    fields, and percentages/velocities are weighted by each field's count.
+    Fields without a value (e.g. motility of a still image) are skipped.
+    """
+    analyses = [field["analysis"] for field in fields]
+    counts = [analysis["sperm_count"] or 0 for analysis in analyses]
+    
+    def weighted(get):
+        pairs = [(get(a), n) for a, n in zip(analyses, counts) if get(a) is not None]
+        total = sum(n for _, n in pairs)
+        if not pairs or total == 0:
+            return None
+        return sum(value * n for value, n in pairs) / total
+    
+    concentrations = [a["concentration"] for a in analyses if a["concentration"] is not None]
+    
+    return {
+        "fields_analyzed": len(fields),
+        "sperm_count": sum(counts),
+        "concentration": sum(concentrations) / len(concentrations) if concentrations else None,
+        "motility": {
+            key: weighted(lambda a, key=key: a["motility"][key])
+            for key in ("progressive", "non_progressive", "immotile")
+        },
+        "velocities": {
+            key: weighted(lambda a, key=key: a["velocities"][key])
+            for key in ("vcl", "vsl", "vap")
+        },
+        "linearity": weighted(lambda a: a["linearity"]),
+        "morphology": {
+            key: weighted(lambda a, key=key: a["morphology"][key])
+            for key in ("normal", "abnormal")
+        }
+    }
+
+def still_concentration(count: int, native_shape) -> Optional[float]:
+    """Concentration (million/mL) of `count` cells seen in one field of `native_shape` (h, w) pixels
+    
+    The field's volume is its area, from MICRONS_PER_PIXEL, times the
+    counting chamber's depth.
+    """
+    height, width = native_shape
+    volume = height * width * settings.MICRONS_PER_PIXEL ** 2 * settings.CHAMBER_DEPTH  # um^3
+    if volume <= 0:
+        return None
+    # 1 mL = 1e12 um^3, reported in millions
+    return round(count / volume * 1e6, 2)
+
+async def analyze_still_image(job_id: str, filename: str, content: bytes, model: Optional[ModelEntry] = None) -> dict:
+    """Count, concentration and morphology for a single image: one decode, one detection, no tracking"""
+    started = time.monotonic()
+    model = model or model_registry.active(DETECTOR)
+    processor = processor_for(video_processor, model)
+    frames, native_shape = await processor.decode_image(content)
+    detection = await model.detect(frames[0])
+    centres = detection_centres(detection)
+    count = len(centres)
+    
+    morphology = {"normal": None, "abnormal": None}
+    if morphology_classifier.enabled and count:
+        # Crops come from the decoded (letterboxed) frame the detector saw
+        morphology = await classify_still(morphology_classifier, frames[0], centres, settings.MORPHOLOGY_CROP_SIZE)
+    
+    # Motility needs movement over time, so it is explicitly absent for stills
+    results = {
+        "job_id": job_id,
+        "timestamp": datetime.now().isoformat(),
+        "filename": filename,
+        "analysis": {
+            "sperm_count": count,
+            "concentration": still_concentration(count, native_shape),
+            "motility": {
+                "progressive": None,
+                "non_progressive": None,
+                "immotile": None
+            },
+            "velocities": {
+                "vcl": None,
+                "vsl": None,
+                "vap": None
+            },
+            "linearity": None,
+            "morphology": {
+                "normal": morphology["normal"],
+                "abnormal": morphology["abnormal"]
+            }
+        },
+        "processing_time": round(time.monotonic() - started, 3),
+        "status": "completed"
+    }
+    if morphology_classifier.enabled:
+        results["morphology"] = morphology
+    return results
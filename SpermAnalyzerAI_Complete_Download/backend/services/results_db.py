@@ -0,0 +1,392 @@
+"""
+Analysis history for Sperm Analyzer AI
+Jobs and their results are stored in DATABASE_URL. Writes are queued and
+committed in batches by a background task, never on the request path.
+"""
+
+import asyncio
+import base64
+import hashlib
+import logging
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import JSON, DateTime, Float, Index, Integer, String, Text, and_, event, or_, select, text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, create_async_engine
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from backend.config import settings
+from backend.responses import dumps
+
+logger = logging.getLogger(__name__)
+
+# Async drivers for the plain URLs used in settings
+_ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+MAX_PAGE_SIZE = 200
+# Queued after the last row on shutdown; the writer flushes and exits
+_STOP: Dict[str, Any] = {}
+
+# hook(conn, rows) runs inside each write transaction with the rows that
+# became "completed" in it
+WriteHook = Callable[[AsyncConnection, List[Dict[str, Any]]], Awaitable[None]]
+
+
+class Base(DeclarativeBase):
+    pass
+
+
+class AnalysisRecord(Base):
+    __tablename__ = "analyses"
+
+    job_id: Mapped[str] = mapped_column(String(36), primary_key=True)
+    patient_id: Mapped[Optional[str]] = mapped_column(String(64))
+    sample_id: Mapped[Optional[str]] = mapped_column(String(64))
+    device_id: Mapped[Optional[str]] = mapped_column(String(64))
+    technician_id: Mapped[Optional[str]] = mapped_column(String(64))
+    filename: Mapped[Optional[str]] = mapped_column(String(255))
+    sha256: Mapped[Optional[str]] = mapped_column(String(64))
+    status: Mapped[str] = mapped_column(String(16))
+    created_at: Mapped[datetime] = mapped_column(DateTime)
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime)
+    # Headline metrics, denormalised from `result` for filtering and listing
+    sperm_count: Mapped[Optional[int]] = mapped_column(Integer)
+    concentration: Mapped[Optional[float]] = mapped_column(Float)
+    progressive: Mapped[Optional[float]] = mapped_column(Float)
+    non_progressive: Mapped[Optional[float]] = mapped_column(Float)
+    immotile: Mapped[Optional[float]] = mapped_column(Float)
+    vcl: Mapped[Optional[float]] = mapped_column(Float)
+    vsl: Mapped[Optional[float]] = mapped_column(Float)
+    vap: Mapped[Optional[float]] = mapped_column(Float)
+    linearity: Mapped[Optional[float]] = mapped_column(Float)
+    normal_morphology: Mapped[Optional[float]] = mapped_column(Float)
+    error: Mapped[Optional[str]] = mapped_column(Text)
+    result: Mapped[Optional[Dict[str, Any]]] = mapped_column(JSON)
+
+    __table_args__ = (
+        Index("ix_analyses_patient_created", "patient_id", "created_at"),
+        Index("ix_analyses_sample_created", "sample_id", "created_at"),
+        Index("ix_analyses_status_created", "status", "created_at"),
+        Index("ix_analyses_created", "created_at"),
+    )
+
+
+# Listing columns: everything except the full result document
+_SUMMARY_COLUMNS = [column for column in AnalysisRecord.__table__.c if column.name != "result"]
+
+
+def async_url(url: str) -> str:
+    """sqlite:///x.db -> sqlite+aiosqlite:///x.db; URLs naming a driver are kept"""
+    scheme, sep, rest = url.partition("://")
+    return _ASYNC_DRIVERS.get(scheme, scheme) + sep + rest
+
+
+def _plain(kind: type, value: Any) -> Any:
+    """`value` as a Python int/float; NumPy scalars would be stored as raw bytes"""
+    return kind(value) if value is not None else None
+
+
+def record_row(
+    job_id: str,
+    status: str,
+    result: Optional[Dict[str, Any]] = None,
+    error: Optional[str] = None,
+    created_at: Optional[datetime] = None,
+    filename: Optional[str] = None,
+    sha256: Optional[str] = None,
+    patient_id: Optional[str] = None,
+    sample_id: Optional[str] = None,
+    device_id: Optional[str] = None,
+    technician_id: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Flatten one analysis into an `analyses` row"""
+    analysis = (result or {}).get("analysis") or {}
+    motility = analysis.get("motility") or {}
+    velocities = analysis.get("velocities") or {}
+    morphology = analysis.get("morphology") or {}
+    return {
+        "job_id": job_id,
+        "patient_id": patient_id,
+        "sample_id": sample_id,
+        "device_id": device_id,
+        "technician_id": technician_id,
+        "filename": filename,
+        "sha256": sha256 or (result or {}).get("sha256"),
+        "status": status,
+        "created_at": created_at or datetime.now(),
+        "finished_at": datetime.now(),
+        "sperm_count": _plain(int, analysis.get("sperm_count")),
+        "concentration": _plain(float, analysis.get("concentration")),
+        "progressive": _plain(float, motility.get("progressive")),
+        "non_progressive": _plain(float, motility.get("non_progressive")),
+        "immotile": _plain(float, motility.get("immotile")),
+        "vcl": _plain(float, velocities.get("vcl")),
+        "vsl": _plain(float, velocities.get("vsl")),
+        "vap": _plain(float, velocities.get("vap")),
+        "linearity": _plain(float, analysis.get("linearity")),
+        "normal_morphology": _plain(float, morphology.get("normal")),
+        "error": error,
+        "result": result,
+    }
+
+
+def dialect_insert(dialect_name: str, table):
+    """INSERT construct that supports on_conflict_do_update for this backend"""
+    if dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(table)
+
+
+# Postgres advisory lock key taken by write_transaction()
+_WRITE_LOCK_KEY = 0x5EA1CA5A
+
+
+@asynccontextmanager
+async def write_transaction(engine: AsyncEngine) -> AsyncIterator[AsyncConnection]:
+    """Transaction holding the database-wide write lock from its first statement
+
+    Read-then-write sequences inside it (rollup merges, backfill, schema
+    creation) cannot interleave with another worker process's. On SQLite
+    the lock is taken by BEGIN IMMEDIATE, so a second writer waits there
+    (busy_timeout) instead of failing when its read upgrades to a write.
+    """
+    async with engine.execution_options(write_lock=True).begin() as conn:
+        if conn.dialect.name == "postgresql":
+            await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _WRITE_LOCK_KEY})
+        yield conn
+
+
+def _encode_cursor(created_at: datetime, job_id: str) -> str:
+    return base64.urlsafe_b64encode(f"{created_at.isoformat()}|{job_id}".encode()).decode()
+
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        created_at, job_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        return datetime.fromisoformat(created_at), job_id
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+class ResultsStore:
+    """Batched writer and history queries over the `analyses` table"""
+
+    def __init__(self, url: str, pool_size: int, batch_size: int, flush_interval: float):
+        self.url = async_url(url)
+        self.pool_size = pool_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.engine: Optional[AsyncEngine] = None
+        self._queue: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue()
+        self._writer: Optional[asyncio.Task] = None
+        self.stats = {"queued": 0, "written": 0, "batches": 0, "failed": 0}
+        self.write_hooks: List[WriteHook] = []
+
+    def _create_engine(self) -> AsyncEngine:
+        # aiosqlite would default to opening a connection per checkout
+        engine = create_async_engine(
+            self.url,
+            poolclass=AsyncAdaptedQueuePool,
+            pool_size=self.pool_size,
+            max_overflow=self.pool_size,
+            # Results carry NumPy values, which the stdlib encoder rejects
+            json_serializer=lambda value: dumps(value).decode(),
+        )
+        if engine.dialect.name == "sqlite":
+            @event.listens_for(engine.sync_engine, "connect")
+            def _sqlite_pragmas(dbapi_connection, connection_record):
+                cursor = dbapi_connection.cursor()
+                # Readers never wait for the writer; NORMAL is durable enough under WAL
+                cursor.execute("PRAGMA journal_mode=WAL")
+                cursor.execute("PRAGMA synchronous=NORMAL")
+                cursor.execute("PRAGMA busy_timeout=5000")
+                cursor.close()
+                # BEGIN is issued below, so write transactions can take the lock up front
+                dbapi_connection.isolation_level = None
+
+            @event.listens_for(engine.sync_engine, "begin")
+            def _sqlite_begin(conn):
+                conn.exec_driver_sql("BEGIN IMMEDIATE" if conn.get_execution_options().get("write_lock") else "BEGIN")
+        return engine
+
+    async def start(self) -> None:
+        if self.engine is None:
+            self.engine = self._create_engine()
+            # Workers starting together would otherwise race to create the same tables
+            async with write_transaction(self.engine) as conn:
+                await conn.run_sync(Base.metadata.create_all)
+        if self._writer is None:
+            self._writer = asyncio.create_task(self._write_forever())
+
+    async def stop(self) -> None:
+        """Write everything still queued, then close the pool"""
+        if self._writer is not None:
+            self._queue.put_nowait(_STOP)
+            await self._writer
+            self._writer = None
+        if self.engine is not None:
+            await self.engine.dispose()
+            self.engine = None
+
+    def record(self, row: Dict[str, Any]) -> None:
+        """Queue a row from record_row(); later rows for a job replace earlier ones"""
+        self._queue.put_nowait(row)
+        self.stats["queued"] = self._queue.qsize()
+
+    def record_job(self, job) -> None:
+        """JobManager hook: store a job once it reaches a terminal status
+
+        A quick-pass estimate is kept under result["preliminary"], also
+        for jobs that failed or were cancelled after it.
+        """
+        result = job.result
+        if job.preliminary is not None:
+            result = {**(result or {}), "preliminary": job.preliminary}
+        self.record(record_row(
+            job.job_id,
+            job.status,
+            result=result,
+            error=job.error,
+            created_at=job.created_at,
+            filename=job.filename,
+            sha256=job.spec.get("sha256"),
+            patient_id=job.spec.get("patient_id"),
+            sample_id=job.spec.get("sample_id"),
+            device_id=job.spec.get("device_id"),
+            technician_id=job.spec.get("technician_id"),
+        ))
+
+    async def _write_forever(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            row = await self._queue.get()
+            if row is _STOP:
+                return
+            batch = [row]
+            stopping = False
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    row = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if row is _STOP:
+                    stopping = True
+                    break
+                batch.append(row)
+            await self._write(batch)
+            if stopping and self._queue.empty():
+                return
+            if stopping:
+                self._queue.put_nowait(_STOP)
+
+    async def _write(self, batch: List[Dict[str, Any]]) -> None:
+        # One row per job, last write wins, in a single upsert
+        rows = list({row["job_id"]: row for row in batch}.values())
+        insert = dialect_insert(self.engine.dialect.name, AnalysisRecord)
+        statement = insert.on_conflict_do_update(
+            index_elements=["job_id"],
+            set_={column: insert.excluded[column] for column in rows[0] if column not in ("job_id", "created_at")},
+        )
+        try:
+            async with write_transaction(self.engine) as conn:
+                done = await self._completed_ids(conn, rows) if self.write_hooks else set()
+                await conn.execute(statement, rows)
+                fresh = [row for row in rows if row["status"] == "completed" and row["job_id"] not in done]
+                for hook in self.write_hooks:
+                    await hook(conn, fresh)
+        except Exception:
+            logger.exception("Could not store %d analyses", len(rows))
+            self.stats["failed"] += len(rows)
+        else:
+            self.stats["written"] += len(rows)
+            self.stats["batches"] += 1
+        self.stats["queued"] = self._queue.qsize()
+
+    @staticmethod
+    async def _completed_ids(conn: AsyncConnection, rows: List[Dict[str, Any]]) -> set:
+        table = AnalysisRecord.__table__
+        result = await conn.execute(
+            select(table.c.job_id).where(
+                table.c.job_id.in_([row["job_id"] for row in rows]),
+                table.c.status == "completed",
+            )
+        )
+        return set(result.scalars())
+
+    async def history(
+        self,
+        patient_id: Optional[str] = None,
+        sample_id: Optional[str] = None,
+        status: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Newest first, keyset-paginated; returns (items, next cursor)"""
+        table = AnalysisRecord.__table__
+        query = select(*_SUMMARY_COLUMNS)
+        if patient_id is not None:
+            query = query.where(table.c.patient_id == patient_id)
+        if sample_id is not None:
+            query = query.where(table.c.sample_id == sample_id)
+        if status is not None:
+            query = query.where(table.c.status == status)
+        if since is not None:
+            query = query.where(table.c.created_at >= since)
+        if until is not None:
+            query = query.where(table.c.created_at < until)
+        if cursor is not None:
+            created_at, job_id = _decode_cursor(cursor)
+            query = query.where(or_(
+                table.c.created_at < created_at,
+                and_(table.c.created_at == created_at, table.c.job_id < job_id),
+            ))
+        limit = min(max(limit, 1), MAX_PAGE_SIZE)
+        query = query.order_by(table.c.created_at.desc(), table.c.job_id.desc()).limit(limit + 1)
+
+        async with self.engine.connect() as conn:
+            rows = (await conn.execute(query)).mappings().all()
+        items = [_serialize(row) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            next_cursor = _encode_cursor(last["created_at"], last["job_id"])
+        return items, next_cursor
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        async with self.engine.connect() as conn:
+            row = (await conn.execute(
+                select(AnalysisRecord.__table__).where(AnalysisRecord.job_id == job_id)
+            )).mappings().first()
+        return _serialize(row) if row is not None else None
+
+
+def stored_etag(record: Dict[str, Any]) -> str:
+    """Strong validator for a stored analysis; a later write for the job changes it"""
+    stamp = f"{record['status']}|{record['finished_at']}|{record['created_at']}"
+    return f'"{record["job_id"]}-{hashlib.sha256(stamp.encode()).hexdigest()[:16]}"'
+
+
+def _serialize(row) -> Dict[str, Any]:
+    item = dict(row)
+    for key in ("created_at", "finished_at"):
+        if item.get(key) is not None:
+            item[key] = item[key].isoformat()
+    return item
+
+
+results_store = ResultsStore(
+    settings.DATABASE_URL,
+    pool_size=settings.DB_POOL_SIZE,
+    batch_size=settings.DB_WRITE_BATCH,
+    flush_interval=settings.DB_FLUSH_INTERVAL,
+)
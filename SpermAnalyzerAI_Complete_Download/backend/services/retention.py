@@ -0,0 +1,232 @@
+"""
+Upload retention for Sperm Analyzer AI
+Periodically deletes blobs past their TTL and evicts least recently used
+blobs while the store is over quota. Blobs that a job still needs are
+kept, and temporary files left behind by abandoned uploads or crashed
+workers are swept. Stored job trajectories get their own TTL and quota.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Set
+
+from backend.config import settings
+from backend.services.blob_store import BlobStore, InvalidDigest, blob_store
+from backend.services.checkpoints import load_manifests
+from backend.services.job_manager import job_manager
+from backend.services.trajectories import TrajectoryStore, trajectory_store
+from backend.services.upload_sessions import UploadSessionManager, upload_sessions
+
+logger = logging.getLogger(__name__)
+
+# Rows fetched from the index per eviction round
+_BATCH = 500
+
+
+class RetentionManager:
+    """TTL + quota garbage collection driven by the blob index
+
+    Blobs named by a job manifest under `jobs_root` (queued, running or
+    checkpointed jobs of any worker) or being read in this process are
+    never deleted.
+    """
+
+    def __init__(
+        self,
+        store: BlobStore,
+        sessions: UploadSessionManager,
+        jobs_root: Path,
+        tracks: TrajectoryStore,
+        ttl: int,
+        quota_bytes: int,
+        tracks_ttl: int,
+        tracks_quota_bytes: int,
+        interval: int,
+    ):
+        self.store = store
+        self.index = store.index
+        self.sessions = sessions
+        self.jobs_root = jobs_root
+        self.tracks = tracks
+        self.ttl = ttl
+        self.quota_bytes = quota_bytes
+        self.tracks_ttl = tracks_ttl
+        self.tracks_quota_bytes = tracks_quota_bytes
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+        self.stats: Dict[str, Any] = {
+            "runs": 0,
+            "last_run": None,
+            "last_scan_seconds": 0.0,
+            "freed_bytes_total": 0,
+            "deleted_blobs_total": 0,
+            "swept_files_total": 0,
+            "deleted_tracks_total": 0,
+            "kept_in_use": 0,
+            "stored_blobs": 0,
+            "stored_bytes": 0,
+        }
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run_forever())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.index.flush()
+
+    async def _run_forever(self) -> None:
+        while True:
+            try:
+                self.sessions.expire()
+                await asyncio.to_thread(self.collect)
+            except Exception:
+                logger.exception("Upload retention pass failed")
+            await asyncio.sleep(self.interval)
+
+    def collect(self) -> Dict[str, Any]:
+        """One garbage-collection pass; returns the updated stats"""
+        started = time.perf_counter()
+        self.index.flush()
+        _, total = self.index.totals()
+        if self.index.needs_seed:
+            self._seed()
+            _, total = self.index.totals()
+
+        freed = deleted = 0
+        in_use = self._in_use()
+
+        # Expired first, regardless of quota
+        cutoff = time.time() - self.ttl
+        while True:
+            rows = self.index.expired(cutoff, _BATCH, in_use)
+            if not rows:
+                break
+            freed_now, total = self._delete(rows, total)
+            freed += freed_now
+            deleted += len(rows)
+
+        # Then least recently used until back under quota
+        while total > self.quota_bytes:
+            rows = []
+            over = total - self.quota_bytes
+            for sha256, size in self.index.least_recent(_BATCH, in_use):
+                rows.append((sha256, size))
+                over -= size
+                if over <= 0:
+                    break
+            if not rows:
+                break
+            freed_now, total = self._delete(rows, total)
+            freed += freed_now
+            deleted += len(rows)
+
+        swept, swept_bytes = self._sweep()
+        freed += swept_bytes
+        tracks, tracks_bytes = self.tracks.collect(self.tracks_ttl, self.tracks_quota_bytes)
+        freed += tracks_bytes
+
+        count, total = self.index.totals()
+        elapsed = time.perf_counter() - started
+        self.stats.update(
+            runs=self.stats["runs"] + 1,
+            last_run=time.time(),
+            last_scan_seconds=round(elapsed, 4),
+            freed_bytes_total=self.stats["freed_bytes_total"] + freed,
+            deleted_blobs_total=self.stats["deleted_blobs_total"] + deleted,
+            swept_files_total=self.stats["swept_files_total"] + swept,
+            deleted_tracks_total=self.stats["deleted_tracks_total"] + tracks,
+            kept_in_use=len(in_use),
+            stored_blobs=count,
+            stored_bytes=total,
+        )
+        if deleted or swept or tracks:
+            logger.info(
+                "Retention removed %d blob(s), %d trajectory file(s) and %d stale temporary file(s), %d bytes in %.3fs",
+                deleted, tracks, swept, freed, elapsed
+            )
+        return self.stats
+
+    def _in_use(self) -> Set[str]:
+        """Blobs referenced by a live job of any worker, or open in this one"""
+        digests = self.store.readers()
+        for spec in load_manifests(self.jobs_root):
+            if spec.get("sha256"):
+                digests.add(spec["sha256"])
+        return digests
+
+    def _sweep(self):
+        """Delete upload parts and blob temporaries untouched for the session TTL
+
+        Sessions of this process are expired by UploadSessionManager.expire();
+        anything else idle that long belongs to an abandoned upload or to a
+        worker that died mid-write. Returns (files, bytes) removed.
+        """
+        cutoff = time.time() - self.sessions.ttl
+        open_parts = self.sessions.paths()
+        swept = swept_bytes = 0
+        candidates = [(self.sessions.partial_dir, "*.part"), (self.store.tmp_dir, "*")]
+        for directory, pattern in candidates:
+            if not directory.is_dir():
+                continue
+            for path in directory.glob(pattern):
+                if path in open_parts:
+                    continue
+                try:
+                    stat = path.stat()
+                    if stat.st_mtime >= cutoff or not path.is_file():
+                        continue
+                    path.unlink()
+                except FileNotFoundError:
+                    continue
+                swept += 1
+                swept_bytes += stat.st_size
+        return swept, swept_bytes
+
+    def _delete(self, rows, total: int):
+        for sha256, _ in rows:
+            self.store.delete(sha256)
+        self.index.remove(sha256 for sha256, _ in rows)
+        freed = sum(size for _, size in rows)
+        return freed, total - freed
+
+    def _seed(self) -> None:
+        """One-off walk to index blobs written before the index existed"""
+        entries = []
+        root = self.store.root
+        if root.exists():
+            for dirpath, _, filenames in os.walk(root):
+                if Path(dirpath) == self.store.tmp_dir:
+                    continue
+                for name in filenames:
+                    try:
+                        self.store.validate(name)
+                    except InvalidDigest:
+                        continue
+                    stat = os.stat(os.path.join(dirpath, name))
+                    entries.append((name, stat.st_size, stat.st_atime))
+        self.index.record_many(entries)
+        self.index.needs_seed = False
+        logger.info("Indexed %d existing blob(s)", len(entries))
+
+
+retention = RetentionManager(
+    blob_store,
+    upload_sessions,
+    job_manager.work_root,
+    trajectory_store,
+    ttl=settings.UPLOAD_RETENTION_TTL,
+    quota_bytes=settings.UPLOAD_QUOTA_BYTES,
+    tracks_ttl=settings.TRACKS_RETENTION_TTL,
+    tracks_quota_bytes=settings.TRACKS_QUOTA_BYTES,
+    interval=settings.RETENTION_INTERVAL,
+)
@@ -0,0 +1,286 @@
+"""
+Per-track trajectories for Sperm Analyzer AI
+Tracks from a video analysis are kept per job and exported in a compact
+binary form: each track's first point absolute, every later point as an
+int16 delta in sub-pixel units, optionally Douglas-Peucker simplified.
+"""
+
+import io
+import json
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from backend.config import settings
+from backend.services.checkpoints import write_atomic
+
+try:
+    import pyarrow as pa
+except ImportError:  # Arrow IPC export is optional
+    pa = None
+
+NPZ_MEDIA_TYPE = "application/x-npz"
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+JSON_MEDIA_TYPE = "application/json"
+
+# Coordinates are sent in 1/SUBPIXEL px; halved if a delta would not fit in int16
+SUBPIXEL = 8
+_INT16_MAX = np.iinfo(np.int16).max
+_UINT16_MAX = np.iinfo(np.uint16).max
+
+_ID_KEYS = ("track_id", "id")
+_POINT_KEYS = ("positions", "trajectory", "points", "centroids", "history")
+
+
+@dataclass
+class Trajectories:
+    """Tracks as flat columns: points of track i are offsets[i]:offsets[i + 1]"""
+
+    track_ids: np.ndarray  # unicode
+    offsets: np.ndarray  # int64, len(track_ids) + 1
+    frames: np.ndarray  # int32
+    xy: np.ndarray  # float32, (points, 2) pixel coordinates
+
+    def __len__(self) -> int:
+        return len(self.track_ids)
+
+    def points(self, i: int):
+        return self.frames[self.offsets[i]:self.offsets[i + 1]], self.xy[self.offsets[i]:self.offsets[i + 1]]
+
+
+def _field(track: Any, keys: Sequence[str]) -> Any:
+    for key in keys:
+        value = track.get(key) if isinstance(track, dict) else getattr(track, key, None)
+        if value is not None:
+            return value
+    return None
+
+
+def _point(point: Any, index: int):
+    """(frame, x, y) from (x, y), (frame, x, y), an (l, t, r, b) box or a {frame, x, y} mapping"""
+    if isinstance(point, dict):
+        return point.get("frame", index), point["x"], point["y"]
+    if len(point) == 2:
+        return index, point[0], point[1]
+    if len(point) == 3:
+        return point
+    left, top, right, bottom = point[:4]
+    return index, (left + right) / 2, (top + bottom) / 2
+
+
+def normalize_tracks(tracks: Sequence[Any]) -> Trajectories:
+    """Adapt tracker output (mappings or objects with an id and a point list) to columns"""
+    ids: List[str] = []
+    offsets = [0]
+    points: List[tuple] = []
+    for number, track in enumerate(tracks):
+        path = _field(track, _POINT_KEYS)
+        if path is None or not len(path):
+            continue
+        track_id = _field(track, _ID_KEYS)
+        ids.append(str(number if track_id is None else track_id))
+        points.extend(_point(point, index) for index, point in enumerate(path))
+        offsets.append(len(points))
+    table = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    return Trajectories(
+        track_ids=np.asarray(ids, dtype=str),
+        offsets=np.asarray(offsets, dtype=np.int64),
+        frames=table[:, 0].astype(np.int32),
+        xy=table[:, 1:].astype(np.float32),
+    )
+
+
+def simplify(xy: np.ndarray, offsets: np.ndarray, tolerance: float) -> np.ndarray:
+    """Mask of the points Douglas-Peucker keeps at `tolerance` pixels, every track at once
+
+    Each pass measures all still-undecided points against the chord between
+    their nearest kept neighbours and keeps the farthest point of every
+    segment that is off by more than `tolerance`, so the Python loop runs
+    once per recursion depth rather than once per segment.
+    """
+    n = len(xy)
+    if tolerance <= 0:
+        return np.ones(n, dtype=bool)
+    x, y = xy[:, 0].astype(np.float64), xy[:, 1].astype(np.float64)
+    keep = np.zeros(n, dtype=bool)
+    keep[offsets[:-1][offsets[:-1] < n]] = True
+    keep[offsets[1:][offsets[1:] > 0] - 1] = True
+    undecided = np.flatnonzero(~keep)
+    while undecided.size:
+        kept = np.flatnonzero(keep)
+        after = np.searchsorted(kept, undecided)
+        start, end = kept[after - 1], kept[after]
+        x0, y0 = x[start], y[start]
+        dx, dy = x[end] - x0, y[end] - y0
+        px, py = x[undecided] - x0, y[undecided] - y0
+        length = np.hypot(dx, dy)
+        degenerate = length == 0
+        length[degenerate] = 1.0
+        distance = np.abs(dx * py - dy * px) / length
+        if degenerate.any():
+            distance[degenerate] = np.hypot(px[degenerate], py[degenerate])
+
+        # Undecided points are sorted, so each segment's points are contiguous
+        first = np.flatnonzero(np.r_[True, start[1:] != start[:-1]])
+        segment = np.repeat(np.arange(len(first)), np.diff(np.r_[first, len(start)]))
+        farthest = np.maximum.reduceat(distance, first)
+        split = farthest > tolerance
+        candidates = np.flatnonzero(distance == farthest[segment])
+        _, pick = np.unique(segment[candidates], return_index=True)
+        keep[undecided[candidates[pick][split]]] = True
+        undecided = undecided[split[segment] & ~keep[undecided]]
+    return keep
+
+
+def delta_encode(trajectories: Trajectories, tolerance: float = 0.0) -> Dict[str, Any]:
+    """Columns of the binary export; see the module docstring"""
+    kept = np.flatnonzero(simplify(trajectories.xy, trajectories.offsets, tolerance))
+    offsets = np.searchsorted(kept, trajectories.offsets).astype(np.int64)
+    frames = trajectories.frames[kept].astype(np.int64)
+    firsts = offsets[:-1]
+
+    scale = SUBPIXEL
+    while True:
+        coords = np.rint(trajectories.xy[kept].astype(np.float64) * scale).astype(np.int64)
+        deltas = np.diff(coords, axis=0, prepend=0)
+        deltas[firsts] = 0
+        if scale == 1 or np.abs(deltas).max(initial=0) <= _INT16_MAX:
+            break
+        scale //= 2
+    frame_deltas = np.diff(frames, prepend=0)
+    frame_deltas[firsts] = 0
+    if np.abs(deltas).max(initial=0) > _INT16_MAX or (frame_deltas < 0).any() or frame_deltas.max(initial=0) > _UINT16_MAX:
+        raise ValueError("Trajectory steps too large for 16-bit deltas")
+
+    return {
+        "track_id": trajectories.track_ids,
+        "offsets": offsets,
+        "frame0": frames[firsts].astype(np.int32),
+        "xy0": coords[firsts].astype(np.int32),
+        "dframe": frame_deltas.astype(np.uint16),
+        "dxy": deltas.astype(np.int16),
+        "scale": scale,
+        "tolerance": tolerance,
+    }
+
+
+def to_npz(columns: Dict[str, Any]) -> bytes:
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **{key: np.asarray(value) for key, value in columns.items()})
+    return buffer.getvalue()
+
+
+def to_arrow(columns: Dict[str, Any]) -> bytes:
+    """One row per track; point columns are lists sharing the track offsets"""
+    if pa is None:
+        raise RuntimeError("pyarrow is not installed")
+    offsets = pa.array(columns["offsets"].astype(np.int32))
+    dxy = columns["dxy"]
+    table = pa.table(
+        {
+            "track_id": pa.array(columns["track_id"].tolist(), type=pa.string()),
+            "frame0": columns["frame0"],
+            "x0": columns["xy0"][:, 0],
+            "y0": columns["xy0"][:, 1],
+            "dframe": pa.ListArray.from_arrays(offsets, pa.array(columns["dframe"])),
+            "dx": pa.ListArray.from_arrays(offsets, pa.array(dxy[:, 0])),
+            "dy": pa.ListArray.from_arrays(offsets, pa.array(dxy[:, 1])),
+        },
+        metadata={"scale": str(columns["scale"]), "tolerance": str(columns["tolerance"])},
+    )
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def to_json(trajectories: Trajectories, tolerance: float = 0.0) -> bytes:
+    """Plain JSON with the same simplification, for clients without a binary decoder"""
+    keep = simplify(trajectories.xy, trajectories.offsets, tolerance)
+    tracks = []
+    for i in range(len(trajectories)):
+        frames, xy = trajectories.points(i)
+        index = keep[trajectories.offsets[i]:trajectories.offsets[i + 1]]
+        tracks.append({
+            "track_id": str(trajectories.track_ids[i]),
+            "frames": frames[index].tolist(),
+            "points": np.round(xy[index].astype(np.float64), 2).tolist(),
+        })
+    return json.dumps({"tolerance": tolerance, "tracks": tracks}).encode()
+
+
+class TrajectoryStore:
+    """Full-precision trajectories per job, one .npz file each
+
+    A file's mtime is its last read, which retention ages and evicts by
+    (see collect()).
+    """
+
+    def __init__(self, root: Path):
+        self.root = root
+
+    def _path(self, job_id: str) -> Path:
+        return self.root / f"{job_id}.npz"
+
+    def save(self, job_id: str, trajectories: Trajectories) -> None:
+        buffer = io.BytesIO()
+        np.savez(
+            buffer,
+            track_ids=trajectories.track_ids,
+            offsets=trajectories.offsets,
+            frames=trajectories.frames,
+            xy=trajectories.xy,
+        )
+        write_atomic(self._path(job_id), buffer.getvalue())
+
+    def load(self, job_id: str) -> Optional[Trajectories]:
+        try:
+            with np.load(self._path(job_id), allow_pickle=False) as data:
+                trajectories = Trajectories(**{key: data[key] for key in ("track_ids", "offsets", "frames", "xy")})
+        except (OSError, ValueError, KeyError):
+            return None
+        try:
+            os.utime(self._path(job_id))
+        except OSError:
+            pass
+        return trajectories
+
+    def delete(self, job_id: str) -> None:
+        self._path(job_id).unlink(missing_ok=True)
+
+    def collect(self, ttl: int, quota_bytes: int) -> Tuple[int, int]:
+        """Delete files unread for `ttl` seconds, then the least recently read
+        while over `quota_bytes`; returns (files, bytes) deleted
+
+        One file per finished job, so a directory scan is cheap enough here.
+        """
+        entries = []
+        try:
+            for entry in os.scandir(self.root):
+                if entry.name.endswith(".npz"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        except FileNotFoundError:
+            return 0, 0
+        entries.sort()
+        cutoff = time.time() - ttl
+        total = sum(size for _, size, _ in entries)
+        deleted = freed = 0
+        for mtime, size, path in entries:
+            if mtime >= cutoff and total <= quota_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            deleted += 1
+            freed += size
+        return deleted, freed
+
+
+trajectory_store = TrajectoryStore(Path(settings.UPLOAD_DIR) / "tracks")
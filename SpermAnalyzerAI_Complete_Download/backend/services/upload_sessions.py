@@ -0,0 +1,206 @@
+"""
+Resumable chunked uploads for Sperm Analyzer AI
+
+A session preallocates `<UPLOAD_DIR>/partial/<upload_id>.part` to the
+declared size. Chunks must arrive at the current received offset; they are
+written with positional writes and fed to a running SHA-256, so finalizing
+never re-reads the file before moving it into the blob store.
+"""
+
+import asyncio
+import hashlib
+import os
+import time
+import uuid
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import AsyncIterator, Dict, Optional, Set
+
+from backend.config import settings
+from backend.services.blob_store import blob_store
+
+
+# Bytes gathered from the request stream before each write
+WRITE_SIZE = 1 << 20
+
+
+class UploadError(Exception):
+    """Base error for resumable upload sessions"""
+
+
+class UploadNotFound(UploadError):
+    pass
+
+
+class OffsetMismatch(UploadError):
+    def __init__(self, expected: int):
+        super().__init__(f"Chunk must start at offset {expected}")
+        self.expected = expected
+
+
+class UploadTooLarge(UploadError):
+    pass
+
+
+class UploadIncomplete(UploadError):
+    pass
+
+
+class ChecksumMismatch(UploadError):
+    pass
+
+
+@dataclass
+class UploadSession:
+    upload_id: str
+    filename: str
+    size: int
+    path: Path
+    content_type: Optional[str] = None
+    expected_sha256: Optional[str] = None
+    received: int = 0
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+    hasher: "hashlib._Hash" = field(default_factory=hashlib.sha256, repr=False)
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock, repr=False)
+
+    @property
+    def complete(self) -> bool:
+        return self.received == self.size
+
+    def to_dict(self) -> Dict:
+        return {
+            "upload_id": self.upload_id,
+            "filename": self.filename,
+            "size": self.size,
+            "offset": self.received,
+            "complete": self.complete,
+        }
+
+
+class UploadSessionManager:
+    """Creates, fills and finalizes resumable upload sessions"""
+
+    def __init__(self, upload_dir: str, max_size: int, ttl: int):
+        self.partial_dir = Path(upload_dir) / "partial"
+        self.max_size = max_size
+        self.ttl = ttl
+        self._sessions: Dict[str, UploadSession] = {}
+
+    async def create(
+        self,
+        filename: str,
+        size: int,
+        content_type: Optional[str] = None,
+        sha256: Optional[str] = None,
+    ) -> UploadSession:
+        if size <= 0 or size > self.max_size:
+            raise UploadTooLarge(f"Upload size must be between 1 and {self.max_size} bytes")
+
+        self.expire()
+        upload_id = str(uuid.uuid4())
+        path = self.partial_dir / f"{upload_id}.part"
+        await asyncio.to_thread(self._preallocate, path, size)
+
+        session = UploadSession(
+            upload_id=upload_id,
+            filename=Path(filename).name,
+            size=size,
+            path=path,
+            content_type=content_type,
+            expected_sha256=sha256.lower() if sha256 else None,
+        )
+        self._sessions[upload_id] = session
+        return session
+
+    def _preallocate(self, path: Path, size: int) -> None:
+        self.partial_dir.mkdir(parents=True, exist_ok=True)
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            # Reserve the blocks up front so a full disk fails here, not at 99%
+            if hasattr(os, "posix_fallocate"):
+                os.posix_fallocate(fd, 0, size)
+            else:
+                os.ftruncate(fd, size)
+        finally:
+            os.close(fd)
+
+    def get(self, upload_id: str) -> UploadSession:
+        session = self._sessions.get(upload_id)
+        if session is None:
+            raise UploadNotFound(f"Upload {upload_id} not found")
+        return session
+
+    async def write_chunk(self, upload_id: str, offset: int, chunks: AsyncIterator[bytes]) -> UploadSession:
+        """Append a streamed chunk that starts at `offset`
+
+        Pieces are gathered into WRITE_SIZE writes, which are written and
+        hashed off the event loop. If the stream breaks, the bytes written
+        so far are kept and the client resumes from the session's offset.
+        """
+        session = self.get(upload_id)
+        async with session.lock:
+            if offset != session.received:
+                raise OffsetMismatch(session.received)
+
+            fd = os.open(session.path, os.O_WRONLY)
+            try:
+                pending = bytearray()
+                async for data in chunks:
+                    if not data:
+                        continue
+                    if session.received + len(pending) + len(data) > session.size:
+                        raise UploadTooLarge("Chunk extends past the declared upload size")
+                    pending += data
+                    if len(pending) >= WRITE_SIZE:
+                        await asyncio.to_thread(self._write, fd, session, pending)
+                        pending = bytearray()
+                if pending:
+                    await asyncio.to_thread(self._write, fd, session, pending)
+            finally:
+                os.close(fd)
+                session.updated_at = time.time()
+        return session
+
+    @staticmethod
+    def _write(fd: int, session: UploadSession, data: bytes) -> None:
+        view = memoryview(data)
+        while view:
+            written = os.pwrite(fd, view, session.received)
+            session.hasher.update(view[:written])
+            session.received += written
+            view = view[written:]
+
+    async def finalize(self, upload_id: str) -> str:
+        """Move a complete upload into the blob store; returns its SHA-256"""
+        session = self.get(upload_id)
+        async with session.lock:
+            if not session.complete:
+                raise UploadIncomplete(f"Received {session.received} of {session.size} bytes")
+
+            digest = session.hasher.hexdigest()
+            if session.expected_sha256 and digest != session.expected_sha256:
+                raise ChecksumMismatch("SHA-256 of received bytes does not match")
+
+            await asyncio.to_thread(blob_store.put_file, session.path, digest)
+            del self._sessions[upload_id]
+        return digest
+
+    def paths(self) -> Set[Path]:
+        """Part files of the sessions this process is tracking"""
+        return {session.path for session in list(self._sessions.values())}
+
+    def expire(self) -> None:
+        """Drop sessions that have been idle longer than the TTL"""
+        cutoff = time.time() - self.ttl
+        for upload_id, session in list(self._sessions.items()):
+            if session.updated_at < cutoff and not session.lock.locked():
+                session.path.unlink(missing_ok=True)
+                del self._sessions[upload_id]
+
+
+upload_sessions = UploadSessionManager(
+    upload_dir=settings.UPLOAD_DIR,
+    max_size=settings.MAX_FILE_SIZE,
+    ttl=settings.UPLOAD_SESSION_TTL,
+)
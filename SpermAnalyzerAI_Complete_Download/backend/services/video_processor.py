@@ -0,0 +1,437 @@
+"""
+Frame extraction for Sperm Analyzer AI
+Decodes uploaded videos/images straight into detector-sized frames
+"""
+
+import asyncio
+import io
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff"}
+
+# cv2.imread flags that let libjpeg decode at 1/2, 1/4 or 1/8 scale
+_REDUCED_FLAGS = {
+    "bgr": {2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8},
+    "gray": {2: cv2.IMREAD_REDUCED_GRAYSCALE_2, 4: cv2.IMREAD_REDUCED_GRAYSCALE_4, 8: cv2.IMREAD_REDUCED_GRAYSCALE_8},
+}
+
+# EXIF orientations that cv2.imread/imdecode apply by swapping width and height
+_EXIF_ORIENTATION = 0x0112
+_TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+# Fill around letterboxed frames; the grey ultralytics pads with
+PAD_VALUE = 114
+
+
+@dataclass(frozen=True)
+class Letterbox:
+    """Where a native frame sits inside a detector frame
+
+    The frame is scaled by `scale` on both axes (aspect ratio kept) into a
+    `width` x `height` area offset by (`pad_x`, `pad_y`); the rest is
+    PAD_VALUE.
+    """
+
+    scale: float
+    pad_x: int
+    pad_y: int
+    width: int
+    height: int
+
+    def to_native(self, xy: np.ndarray) -> np.ndarray:
+        """Frame pixel coordinates (..., 2) to native pixel coordinates"""
+        return (np.asarray(xy, dtype=np.float64) - (self.pad_x, self.pad_y)) / self.scale
+
+    def to_frame(self, xy: np.ndarray) -> np.ndarray:
+        return np.asarray(xy, dtype=np.float64) * self.scale + (self.pad_x, self.pad_y)
+
+    def content(self, frames: np.ndarray) -> np.ndarray:
+        """View of the picture area of (n, H, W[, 3]) frames, without the padding"""
+        return frames[:, self.pad_y:self.pad_y + self.height, self.pad_x:self.pad_x + self.width]
+
+
+def frame_count(cap) -> int:
+    """Frames in an opened capture: the container's count, else its duration times its frame rate
+
+    Some containers (streamed MP4/MKV, raw MJPEG) report no frame count.
+    The duration is read by seeking to the end, which moves the capture, so
+    use a capture of its own. 0 if neither is known.
+    """
+    count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    if count > 0:
+        return count
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    if fps > 0 and cap.set(cv2.CAP_PROP_POS_AVI_RATIO, 1):
+        return max(round(cap.get(cv2.CAP_PROP_POS_MSEC) / 1000 * fps), 0)
+    return 0
+
+
+class VideoProcessor:
+    """Extracts frames already resized and colour-converted for the detector
+
+    Frames are written into one preallocated (N, H, W[, 3]) uint8 array, so
+    the only full-resolution buffer is the decoder's own, reused across reads.
+    With a `target_shape` the picture is letterboxed into it, keeping its
+    aspect ratio; letterbox() tells where it ends up.
+    """
+
+    def __init__(
+        self,
+        target_shape: Optional[Tuple[int, int]] = None,
+        color_mode: str = "bgr",
+        max_frames: Optional[int] = None,
+    ):
+        if color_mode not in ("bgr", "gray"):
+            raise ValueError(f"Unsupported color mode: {color_mode}")
+        self.target_shape = target_shape  # (height, width); None keeps native size
+        self.color_mode = color_mode
+        self.max_frames = max_frames
+        self.last_stats: Dict[str, float] = {}
+
+    @property
+    def channels(self) -> int:
+        return 1 if self.color_mode == "gray" else 3
+
+    async def extract_frames(self, file_path) -> np.ndarray:
+        """Decode a video or image into an (N, H, W[, 3]) uint8 array"""
+        path = Path(file_path)
+        if path.suffix.lower() in IMAGE_EXTENSIONS:
+            frames, _ = await asyncio.to_thread(self._decode_image, path)
+            return frames
+        return await asyncio.to_thread(self._decode_video, path)
+
+    def _frame_shape(self, native_hw: Tuple[int, int]) -> Tuple[int, ...]:
+        h, w = self.target_shape or native_hw
+        return (h, w) if self.channels == 1 else (h, w, 3)
+
+    def letterbox(self, native_hw: Tuple[int, int]) -> Letterbox:
+        """Placement of a native (h, w) picture in this processor's frames"""
+        h, w = native_hw
+        if self.target_shape is None:
+            return Letterbox(1.0, 0, 0, w, h)
+        th, tw = self.target_shape
+        if not h or not w:  # size not reported by the container
+            return Letterbox(1.0, 0, 0, tw, th)
+        scale = min(th / h, tw / w)
+        height, width = min(max(round(h * scale), 1), th), min(max(round(w * scale), 1), tw)
+        return Letterbox(scale, (tw - width) // 2, (th - height) // 2, width, height)
+
+    @staticmethod
+    def _pad(dst: np.ndarray, box: Letterbox) -> None:
+        top, left = box.pad_y, box.pad_x
+        bottom, right = top + box.height, left + box.width
+        dst[:top] = PAD_VALUE
+        dst[bottom:] = PAD_VALUE
+        dst[top:bottom, :left] = PAD_VALUE
+        dst[top:bottom, right:] = PAD_VALUE
+
+    def _convert_into(
+        self,
+        src: np.ndarray,
+        dst: np.ndarray,
+        scratch: Optional[np.ndarray],
+        box: Optional[Letterbox] = None,
+    ) -> None:
+        """Letterbox/convert a decoded BGR (or already converted) frame into dst without extra allocations"""
+        box = box or self.letterbox(src.shape[:2])
+        self._pad(dst, box)
+        inner = dst[box.pad_y:box.pad_y + box.height, box.pad_x:box.pad_x + box.width]
+        size = (box.width, box.height)
+        resize = src.shape[:2] != (box.height, box.width)
+        if self.channels == 3 or src.ndim == 2:
+            if resize:
+                cv2.resize(src, size, dst=inner, interpolation=cv2.INTER_AREA)
+            else:
+                inner[...] = src
+        elif resize:
+            # Shrink first so the colour conversion only touches target-sized pixels
+            small = scratch[:box.height, :box.width]
+            cv2.resize(src, size, dst=small, interpolation=cv2.INTER_AREA)
+            cv2.cvtColor(small, cv2.COLOR_BGR2GRAY, dst=inner)
+        else:
+            cv2.cvtColor(src, cv2.COLOR_BGR2GRAY, dst=inner)
+
+    def _decode_video(self, path: Path) -> np.ndarray:
+        cap = cv2.VideoCapture(str(path))
+        if not cap.isOpened():
+            raise ValueError(f"Could not open video: {path.name}")
+
+        try:
+            native_hw = (
+                int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+                int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            )
+            capacity = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            if capacity <= 0:
+                capacity = 256  # container doesn't report a count; grow as needed
+            if self.max_frames:
+                capacity = min(capacity, self.max_frames)
+
+            shape = self._frame_shape(native_hw)
+            frames = np.empty((capacity,) + shape, dtype=np.uint8)
+            scratch = np.empty(shape[:2] + (3,), dtype=np.uint8) if self.channels == 1 else None
+            decoded = None  # decoder output buffer, reused by cap.read
+            box = None
+            count = 0
+
+            while self.max_frames is None or count < self.max_frames:
+                ok, decoded = cap.read(decoded)
+                if not ok:
+                    break
+                if count == len(frames):
+                    grown = np.empty((len(frames) * 2,) + shape, dtype=np.uint8)
+                    grown[:count] = frames
+                    frames = grown
+                box = box or self.letterbox(decoded.shape[:2])
+                self._convert_into(decoded, frames[count], scratch, box)
+                count += 1
+        finally:
+            cap.release()
+
+        if count == 0:
+            raise ValueError(f"No frames decoded from: {path.name}")
+
+        self._record_stats(native_hw, frames[:count])
+        return frames[:count]
+
+    @staticmethod
+    def native_shape(file_path) -> Tuple[int, int]:
+        """(height, width) reported by the container, without decoding"""
+        cap = cv2.VideoCapture(str(file_path))
+        try:
+            return int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)), int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        finally:
+            cap.release()
+
+    @staticmethod
+    def count_frames(file_path) -> int:
+        """Frames in a video without decoding it (0 if unknown), see frame_count()"""
+        cap = cv2.VideoCapture(str(file_path))
+        try:
+            return frame_count(cap)
+        finally:
+            cap.release()
+
+    def iter_frames(self, file_path, indices: Iterable[int]) -> Iterator[Tuple[int, np.ndarray]]:
+        """Yield (index, frame) for just the given frame indices, in order
+
+        One forward pass: frames in between are grabbed, not converted. The
+        yielded frame is a reused buffer, valid until the next one.
+        """
+        wanted = sorted(set(indices))
+        if not wanted:
+            return
+        cap = cv2.VideoCapture(str(file_path))
+        if not cap.isOpened():
+            raise ValueError(f"Could not open video: {Path(file_path).name}")
+        try:
+            native_hw = (
+                int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+                int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            )
+            shape = self._frame_shape(native_hw)
+            frame = np.empty(shape, dtype=np.uint8)
+            scratch = np.empty(shape[:2] + (3,), dtype=np.uint8) if self.channels == 1 else None
+            decoded = None
+            box = None
+            position = 0
+            for index in wanted:
+                while position < index:
+                    if not cap.grab():
+                        return
+                    position += 1
+                ok, decoded = cap.read(decoded)
+                if not ok:
+                    return
+                position += 1
+                box = box or self.letterbox(decoded.shape[:2])
+                self._convert_into(decoded, frame, scratch, box)
+                yield index, frame
+        finally:
+            cap.release()
+
+    def stream_frames(self, file_path, batch_size: int = 32) -> "FrameStream":
+        """Decode a video lazily in batches so the caller can stop part-way"""
+        return FrameStream(self, Path(file_path), batch_size)
+
+    async def decode_image(self, data: bytes) -> Tuple[np.ndarray, Tuple[int, int]]:
+        """Decode an in-memory still image; returns (1, H, W[, 3]) frames and native (h, w)"""
+        return await asyncio.to_thread(self._decode_image, data)
+
+    def _decode_image(self, source: Union[Path, bytes]) -> Tuple[np.ndarray, Tuple[int, int]]:
+        flags = cv2.IMREAD_GRAYSCALE if self.channels == 1 else cv2.IMREAD_COLOR
+        native_hw = None
+        if self.target_shape is not None:
+            native_hw = self._probe_image_size(source)
+            if native_hw is not None:
+                factor = self._reduction_factor(native_hw)
+                if factor > 1:
+                    flags = _REDUCED_FLAGS[self.color_mode][factor]
+
+        if isinstance(source, bytes):
+            image = cv2.imdecode(np.frombuffer(source, dtype=np.uint8), flags)
+        else:
+            image = cv2.imread(str(source), flags)
+        if image is None:
+            raise ValueError("Could not decode image")
+
+        native_hw = native_hw or image.shape[:2]
+        frames = np.empty((1,) + self._frame_shape(native_hw), dtype=np.uint8)
+        # Placed by the native size, so reduced decodes land exactly where full ones would
+        self._convert_into(image, frames[0], None, self.letterbox(native_hw))
+
+        self._record_stats(native_hw, frames)
+        return frames, native_hw
+
+    def _reduction_factor(self, native_hw: Tuple[int, int]) -> int:
+        """Largest libjpeg scale factor that still decodes at or above the letterboxed size"""
+        box = self.letterbox(native_hw)
+        for factor in (8, 4, 2):
+            if native_hw[0] // factor >= box.height and native_hw[1] // factor >= box.width:
+                return factor
+        return 1
+
+    @staticmethod
+    def _probe_image_size(source: Union[Path, bytes]) -> Optional[Tuple[int, int]]:
+        """Read image dimensions from the header without decoding pixels
+
+        The size is as cv2 decodes the image, i.e. after its EXIF
+        orientation is applied.
+        """
+        try:
+            from PIL import Image
+
+            if isinstance(source, bytes):
+                source = io.BytesIO(source)
+            with Image.open(source) as img:
+                if img.getexif().get(_EXIF_ORIENTATION) in _TRANSPOSED_ORIENTATIONS:
+                    return img.width, img.height
+                return img.height, img.width
+        except Exception:
+            return None
+
+    def _record_stats(self, native_hw: Tuple[int, int], frames: np.ndarray) -> None:
+        native_bytes = native_hw[0] * native_hw[1] * 3
+        frame_bytes = frames[0].nbytes
+        self.last_stats = {
+            "frames": len(frames),
+            "native_bytes_per_frame": native_bytes,
+            "bytes_per_frame": frame_bytes,
+            "reduction": round(native_bytes / frame_bytes, 2),
+        }
+        logger.info(
+            "Decoded %d frame(s): %d bytes/frame (native BGR %d bytes/frame, %.1fx smaller)",
+            len(frames), frame_bytes, native_bytes, native_bytes / frame_bytes,
+        )
+
+
+class FrameStream:
+    """Batched, abandonable video decoding
+
+    Iterating yields (n, H, W[, 3]) views into one reused batch buffer, so a
+    batch is only valid until the next one is requested.
+
+    With `stride` > 1 only every stride-th frame is decoded; the frames in
+    between are grabbed (demuxed, not converted) and `gaps[i]` holds how
+    many were skipped after batch frame i. `stride` may change between
+    batches.
+    """
+
+    def __init__(self, processor: VideoProcessor, path: Path, batch_size: int):
+        self._processor = processor
+        self._cap = cv2.VideoCapture(str(path))
+        if not self._cap.isOpened():
+            raise ValueError(f"Could not open video: {path.name}")
+
+        self.native_shape = (
+            int(self._cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+            int(self._cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        )
+        self.letterbox = processor.letterbox(self.native_shape)
+        self.fps = self._cap.get(cv2.CAP_PROP_FPS) or None
+        # Container estimate, else from the duration; 0 when neither is known
+        self.total_frames = max(int(self._cap.get(cv2.CAP_PROP_FRAME_COUNT)), 0) or VideoProcessor.count_frames(path)
+        if processor.max_frames:
+            self.total_frames = min(self.total_frames, processor.max_frames)
+        self.frames_read = 0
+        self.stride = 1
+        self.gaps = np.zeros(batch_size, dtype=np.int32)
+
+        shape = processor._frame_shape(self.native_shape)
+        self._batch = np.empty((batch_size,) + shape, dtype=np.uint8)
+        self._scratch = np.empty(shape[:2] + (3,), dtype=np.uint8) if processor.channels == 1 else None
+        self._decoded = None
+
+    def _read_batch(self) -> np.ndarray:
+        limit = self._processor.max_frames
+        count = 0
+        while count < len(self._batch):
+            if limit is not None and self.frames_read >= limit:
+                break
+            ok, self._decoded = self._cap.read(self._decoded)
+            if not ok:
+                break
+            if self._decoded.shape[:2] != self.native_shape:
+                # The container misreported (or left out) the frame size
+                self.native_shape = self._decoded.shape[:2]
+                self.letterbox = self._processor.letterbox(self.native_shape)
+            self._processor._convert_into(self._decoded, self._batch[count], self._scratch, self.letterbox)
+            self.frames_read += 1
+
+            skipped = 0
+            while skipped < self.stride - 1 and (limit is None or self.frames_read < limit):
+                if not self._cap.grab():
+                    break
+                skipped += 1
+                self.frames_read += 1
+            self.gaps[count] = skipped
+            count += 1
+        return self._batch[:count]
+
+    async def seek(self, frame_index: int) -> None:
+        """Continue decoding from `frame_index` (e.g. when resuming a checkpoint)"""
+        await asyncio.to_thread(self._seek, frame_index)
+
+    def _seek(self, frame_index: int) -> None:
+        # Container seeks land on the nearest keyframe for some codecs, so
+        # verify the position and fall back to grabbing forward
+        if not (
+            self._cap.set(cv2.CAP_PROP_POS_FRAMES, frame_index)
+            and int(self._cap.get(cv2.CAP_PROP_POS_FRAMES)) == frame_index
+        ):
+            self._cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            for _ in range(frame_index):
+                if not self._cap.grab():
+                    break
+        self.frames_read = frame_index
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> np.ndarray:
+        if self._cap is None:
+            raise StopAsyncIteration
+        batch = await asyncio.to_thread(self._read_batch)
+        if len(batch) == 0:
+            self.close()
+            raise StopAsyncIteration
+        return batch
+
+    def close(self) -> None:
+        if self._cap is not None:
+            self._cap.release()
+            self._cap = None
+
+    async def __aenter__(self) -> "FrameStream":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        self.close()
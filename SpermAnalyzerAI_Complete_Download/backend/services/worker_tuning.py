@@ -0,0 +1,164 @@
+"""
+Per-worker thread pools and CPU pinning for Sperm Analyzer AI
+Torch, OpenCV and the BLAS under NumPy each size their thread pools to the
+whole machine, so several uvicorn workers on one node oversubscribe the
+CPUs many times over. These limits are applied once per worker process.
+"""
+
+import logging
+import os
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from backend.config import settings
+from backend.services.checkpoints import claim
+
+logger = logging.getLogger(__name__)
+
+# Read by OpenBLAS, MKL and OpenMP when they load, i.e. before NumPy/torch are imported
+_BLAS_ENV = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "NUMEXPR_NUM_THREADS")
+
+
+@dataclass
+class ThreadConfig:
+    workers: int = 1
+    intraop_threads: Optional[int] = None  # None leaves the library default
+    interop_threads: Optional[int] = None
+    opencv_threads: Optional[int] = None
+    blas_threads: Optional[int] = None
+    pin: bool = False  # each worker on its own share of the CPUs
+
+    @classmethod
+    def from_settings(cls) -> "ThreadConfig":
+        return cls(
+            settings.WORKERS,
+            settings.INTRAOP_THREADS,
+            settings.INTEROP_THREADS,
+            settings.OPENCV_THREADS,
+            settings.BLAS_THREADS,
+            settings.CPU_AFFINITY,
+        )
+
+
+def available_cpus() -> List[int]:
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:  # not Linux
+        return list(range(os.cpu_count() or 1))
+
+
+def cpu_share(cpus: List[int], workers: int, slot: int) -> List[int]:
+    """Contiguous, disjoint share of `cpus` for worker `slot` of `workers`
+
+    With fewer CPUs than workers, workers share CPUs round-robin.
+    """
+    if workers >= len(cpus):
+        return [cpus[slot % len(cpus)]]
+    size, extra = divmod(len(cpus), workers)
+    start = slot * size + min(slot, extra)
+    return cpus[start:start + size + (slot < extra)]
+
+
+def thread_env(config: ThreadConfig) -> Dict[str, str]:
+    """Environment that sizes the BLAS/OpenMP pools of a process started with it"""
+    threads = config.blas_threads or config.intraop_threads
+    return {name: str(threads) for name in _BLAS_ENV} if threads else {}
+
+
+def pin(cpus: List[int]) -> bool:
+    """Restrict every thread of this process, and any started later, to `cpus`"""
+    try:
+        # Pools created at import time already have their threads; set each one
+        for task in os.listdir("/proc/self/task"):
+            try:
+                os.sched_setaffinity(int(task), cpus)
+            except (ProcessLookupError, PermissionError):
+                continue
+        os.sched_setaffinity(0, cpus)
+    except (AttributeError, FileNotFoundError, OSError) as e:
+        logger.warning("Could not pin worker to CPUs %s: %s", cpus, e)
+        return False
+    return True
+
+
+def apply_thread_limits(config: ThreadConfig) -> Dict[str, Any]:
+    """Resize the thread pools of the libraries already loaded; returns what was applied"""
+    applied: Dict[str, Any] = {}
+    if config.opencv_threads is not None:
+        import cv2
+
+        cv2.setNumThreads(config.opencv_threads)
+        applied["opencv_threads"] = cv2.getNumThreads()
+
+    blas_threads = config.blas_threads or config.intraop_threads
+    if blas_threads:
+        os.environ.update(thread_env(config))
+        try:
+            from threadpoolctl import threadpool_limits
+        except ImportError:  # only the environment, for pools not loaded yet
+            pass
+        else:
+            threadpool_limits(limits=blas_threads)
+        applied["blas_threads"] = blas_threads
+
+    if config.intraop_threads or config.interop_threads:
+        try:
+            import torch
+        except ImportError:
+            torch = None
+        if torch is not None:
+            if config.intraop_threads:
+                torch.set_num_threads(config.intraop_threads)
+                applied["intraop_threads"] = torch.get_num_threads()
+            if config.interop_threads:
+                try:
+                    torch.set_num_interop_threads(config.interop_threads)
+                    applied["interop_threads"] = torch.get_num_interop_threads()
+                except RuntimeError as e:
+                    # Only allowed before torch runs its first parallel work
+                    logger.warning("Could not set torch inter-op threads: %s", e)
+    return applied
+
+
+def _claim_slot(root: Path, workers: int) -> Optional[int]:
+    """Lowest worker slot not held by a live process; the lock is kept for the process lifetime"""
+    for slot in range(workers):
+        if claim(root / str(slot), create=True) is not None:
+            return slot
+    return None
+
+
+def configure_worker(config: Optional[ThreadConfig] = None) -> Dict[str, Any]:
+    """Pin this worker to its CPU share (if enabled) and apply the thread limits
+
+    When pinned, unset thread counts default to the size of the share, so
+    the pools fill the worker's CPUs and no more.
+    """
+    config = config or ThreadConfig.from_settings()
+    applied: Dict[str, Any] = {"pid": os.getpid(), "slot": None, "cpus": None}
+    if config.pin:
+        slot = _claim_slot(Path(settings.UPLOAD_DIR) / "workers", config.workers)
+        if slot is None:
+            logger.warning("All %d worker CPU slots are taken; this worker is not pinned", config.workers)
+        else:
+            cpus = cpu_share(available_cpus(), config.workers, slot)
+            if pin(cpus):
+                applied["slot"], applied["cpus"] = slot, cpus
+                share = len(cpus)
+                config = ThreadConfig(
+                    config.workers,
+                    config.intraop_threads or share,
+                    config.interop_threads or 1,
+                    config.opencv_threads if config.opencv_threads is not None else share,
+                    config.blas_threads or share,
+                    config.pin,
+                )
+    applied.update(apply_thread_limits(config))
+    applied["config"] = asdict(config)
+    logger.info("Worker thread configuration: %s", applied)
+    return applied
+
+
+# Filled in by configure_worker() at startup; reported by /metrics
+worker_config: Dict[str, Any] = {}
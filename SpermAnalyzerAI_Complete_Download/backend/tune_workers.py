@@ -0,0 +1,167 @@
+"""
+Worker thread sweep for Sperm Analyzer AI
+Runs the per-frame work of the video pipeline (quality control and
+detection) in several worker processes at once, under each combination of
+worker count, thread counts and CPU pinning, and prints the aggregate
+throughput so WORKERS, INTRAOP_THREADS, ... can be chosen for a node.
+
+    python -m backend.tune_workers --video sample.avi --seconds 10
+"""
+
+import argparse
+import multiprocessing
+import os
+import time
+from typing import List, Optional
+
+# NumPy, OpenCV and torch are imported in the worker processes only, after
+# their thread environment is set
+from backend.config import settings
+from backend.services.worker_tuning import ThreadConfig, apply_thread_limits, available_cpus, cpu_share, pin, thread_env
+
+
+def sweep_configs(cpus: int, max_workers: int) -> List[ThreadConfig]:
+    """Library defaults, one thread, and an equal share of the CPUs, per worker count"""
+    configs = []
+    workers = 1
+    while workers <= max_workers:
+        share = max(cpus // workers, 1)
+        configs.append(ThreadConfig(workers))
+        for threads in sorted({1, share}):
+            for pinned in (False, True):
+                configs.append(ThreadConfig(workers, threads, 1, threads, threads, pinned))
+        workers *= 2
+    return configs
+
+
+def _load_frames(video: Optional[str], count: int):
+    import asyncio
+
+    import numpy as np
+
+    from backend.services.video_processor import VideoProcessor
+
+    if video:
+        processor = VideoProcessor(
+            target_shape=(settings.MODEL_INPUT_SIZE, settings.MODEL_INPUT_SIZE),
+            color_mode=settings.MODEL_COLOR_MODE,
+            max_frames=count
+        )
+        return asyncio.run(processor.extract_frames(video))
+    channels = () if settings.MODEL_COLOR_MODE == "gray" else (3,)
+    shape = (count, settings.MODEL_INPUT_SIZE, settings.MODEL_INPUT_SIZE) + channels
+    return np.random.default_rng(0).integers(0, 256, shape, dtype=np.uint8)
+
+
+def _load_detector(model: Optional[str]):
+    if model:
+        from backend.services.model_registry import UltralyticsDetector
+
+        return UltralyticsDetector(model, settings.MODEL_INPUT_SIZE, settings.DETECTION_CONFIDENCE)
+    from backend.services.sperm_detector import SpermDetector
+
+    return SpermDetector()
+
+
+def _worker(slot: int, config: ThreadConfig, args: argparse.Namespace, barrier, results) -> None:
+    # A spawned process has not loaded NumPy yet, so the BLAS environment still takes effect
+    os.environ.update(thread_env(config))
+    if config.pin:
+        pin(cpu_share(available_cpus(), config.workers, slot))
+    apply_thread_limits(config)
+
+    import asyncio
+
+    from backend.services.frame_qc import FrameQC
+
+    frames = _load_frames(args.video, args.frames)
+    detector = _load_detector(args.model)
+    batch_size = settings.DECODE_BATCH_SIZE
+
+    async def run():
+        await detector.detect(frames[0])
+        barrier.wait()
+        qc = FrameQC.from_settings()
+        done, latencies, start = 0, [], 0
+        deadline = time.perf_counter() + args.seconds
+        while time.perf_counter() < deadline:
+            batch = frames[start:start + batch_size]
+            start = (start + batch_size) % len(frames)
+            started = time.perf_counter()
+            keep = qc.check(batch)
+            for frame, ok in zip(batch, keep):
+                if ok:
+                    await detector.detect(frame)
+            latencies.append((time.perf_counter() - started) / len(batch))
+            done += len(batch)
+        return done, latencies
+
+    results.put(asyncio.run(run()))
+
+
+def measure(config: ThreadConfig, args: argparse.Namespace) -> dict:
+    """Frames per second over all workers, and the p95 per-frame latency"""
+    context = multiprocessing.get_context("spawn")
+    barrier = context.Barrier(config.workers)
+    results = context.Queue()
+    processes = [
+        context.Process(target=_worker, args=(slot, config, args, barrier, results))
+        for slot in range(config.workers)
+    ]
+    for process in processes:
+        process.start()
+    outcomes = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    latencies = sorted(latency for _, worker_latencies in outcomes for latency in worker_latencies)
+    return {
+        "frames_per_second": sum(done for done, _ in outcomes) / args.seconds,
+        "p95_ms": latencies[int(0.95 * (len(latencies) - 1))] * 1000 if latencies else None,
+    }
+
+
+def _threads(value: Optional[int]) -> str:
+    return "default" if value is None else str(value)
+
+
+def _milliseconds(value: Optional[float]) -> str:
+    # None when no batch finished in the measured time
+    return "n/a" if value is None else f"{value:.1f}"
+
+
+def main() -> None:
+    cpus = len(available_cpus())
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--video", help="clip to take frames from (default: random frames)")
+    parser.add_argument("--model", help="ultralytics weights to use instead of the built-in detector")
+    parser.add_argument("--frames", type=int, default=64, help="frames per worker, reused in a loop")
+    parser.add_argument("--seconds", type=float, default=5.0, help="measured time per configuration")
+    parser.add_argument("--max-workers", type=int, default=cpus)
+    args = parser.parse_args()
+
+    print(f"{cpus} CPUs available")
+    print(f"{'workers':>7} {'threads':>8} {'pinned':>6} {'frames/s':>9} {'p95 ms':>8}")
+    best = None
+    for config in sweep_configs(cpus, args.max_workers):
+        result = measure(config, args)
+        print(
+            f"{config.workers:>7} {_threads(config.intraop_threads):>8} {'yes' if config.pin else 'no':>6} "
+            f"{result['frames_per_second']:>9.1f} {_milliseconds(result['p95_ms']):>8}"
+        )
+        if best is None or result["frames_per_second"] > best[1]["frames_per_second"]:
+            best = (config, result)
+
+    config, result = best
+    print(f"\nBest: {result['frames_per_second']:.1f} frames/s")
+    print(f"WORKERS={config.workers} CPU_AFFINITY={str(config.pin).lower()}", end="")
+    if config.intraop_threads is not None:
+        print(
+            f" INTRAOP_THREADS={config.intraop_threads} INTEROP_THREADS={config.interop_threads}"
+            f" OPENCV_THREADS={config.opencv_threads} BLAS_THREADS={config.blas_threads}",
+            end=""
+        )
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Scheduling order, aging and Retry-After of the admission controller
+"""
+
+import asyncio
+
+import pytest
+
+from backend.services.admission import AdmissionController, Overloaded, Priority
+
+
+def _run_in_order(controller, requests, before_release=None):
+    """Hold the only slot while `requests` ((name, lane, tenant)) queue up, then
+    release it; returns the names in the order they were granted a slot"""
+    granted = []
+
+    async def run():
+        holder = controller.admit()
+        await holder.__aenter__()
+
+        async def job(name, ticket):
+            async with ticket:
+                granted.append(name)
+
+        tasks = []
+        for name, lane, tenant in requests:
+            tasks.append(asyncio.create_task(job(name, controller.admit(lane, tenant))))
+            await asyncio.sleep(0)  # enqueue in submission order
+        if before_release is not None:
+            await before_release()
+        await holder.__aexit__(None, None, None)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    return granted
+
+
+def test_more_urgent_lanes_run_first():
+    controller = AdmissionController(max_concurrent=1, max_queue=10, aging_seconds=0)
+    order = _run_in_order(controller, [
+        ("bulk", Priority.bulk, "a"),
+        ("routine", Priority.routine, "a"),
+        ("stat", Priority.stat, "a"),
+    ])
+    assert order == ["stat", "routine", "bulk"]
+
+
+def test_tenants_share_a_lane_fairly():
+    controller = AdmissionController(max_concurrent=1, max_queue=10, aging_seconds=0)
+    requests = [(f"a{i}", Priority.routine, "a") for i in range(4)]
+    requests += [(f"b{i}", Priority.routine, "b") for i in range(2)]
+    assert _run_in_order(controller, requests) == ["a0", "b0", "a1", "b1", "a2", "a3"]
+
+
+def test_tenant_weights_scale_the_share():
+    controller = AdmissionController(max_concurrent=1, max_queue=10, aging_seconds=0, tenant_weights={"b": 2.0})
+    requests = [(f"a{i}", Priority.routine, "a") for i in range(2)]
+    requests += [(f"b{i}", Priority.routine, "b") for i in range(4)]
+    assert _run_in_order(controller, requests) == ["b0", "a0", "b1", "b2", "a1", "b3"]
+
+
+def _bulk_then_stat(controller, wait):
+    """Bulk ticket queued `wait` seconds before a stat ticket; returns the grant order"""
+    granted = []
+
+    async def run():
+        holder = controller.admit()
+        await holder.__aenter__()
+
+        async def job(name, ticket):
+            async with ticket:
+                granted.append(name)
+
+        bulk = asyncio.create_task(job("bulk", controller.admit(Priority.bulk, "a")))
+        await asyncio.sleep(wait)
+        stat = asyncio.create_task(job("stat", controller.admit(Priority.stat, "b")))
+        await asyncio.sleep(0)
+        await holder.__aexit__(None, None, None)
+        await asyncio.gather(bulk, stat)
+
+    asyncio.run(run())
+    return granted
+
+
+def test_waiting_promotes_bulk_work_past_newer_stat_work():
+    # 0.1 s at 0.04 s per lane lifts bulk two lanes, level with stat; it was queued first
+    assert _bulk_then_stat(AdmissionController(1, 10, aging_seconds=0.04), 0.1) == ["bulk", "stat"]
+    assert _bulk_then_stat(AdmissionController(1, 10, aging_seconds=60), 0.1) == ["stat", "bulk"]
+
+
+def test_retry_after_before_any_completion_uses_the_default_service_time():
+    controller = AdmissionController(max_concurrent=2, max_queue=0)
+    # 2 slots / 10 s assumed service time = 0.2 analyses per second
+    assert controller.retry_after(1) == 5
+    assert controller.retry_after(3) == 15
+    assert controller.retry_after(10_000) == 300
+
+
+def test_full_controller_rejects_with_retry_after():
+    controller = AdmissionController(max_concurrent=1, max_queue=1)
+    controller.admit_many(2)
+    with pytest.raises(Overloaded) as rejected:
+        controller.admit()
+    assert rejected.value.retry_after == controller.retry_after(1)
+    assert controller.stats["rejected"] == 1
+
+
+def test_retry_after_follows_the_measured_drain_rate():
+    controller = AdmissionController(max_concurrent=1, max_queue=10)
+
+    async def run():
+        for _ in range(5):
+            async with controller.admit():
+                pass
+
+    asyncio.run(run())
+    # Five analyses finished almost at once: the queue drains in well under a second
+    assert controller.drain_rate() > 1
+    assert controller.retry_after(1) == 1
@@ -0,0 +1,84 @@
+"""
+Content addressing, deduplication and the pre-check lookups of the blob store
+"""
+
+import hashlib
+
+import pytest
+
+from backend.services.blob_index import BlobIndex
+from backend.services.blob_store import BlobStore, InvalidDigest
+
+CONTENT = b"frame data" * 1000
+DIGEST = hashlib.sha256(CONTENT).hexdigest()
+
+
+@pytest.fixture
+def store(tmp_path):
+    return BlobStore(tmp_path / "blobs", BlobIndex(tmp_path / "blob_index.db"))
+
+
+def test_blobs_are_sharded_by_digest(store):
+    digest, path = store.put_bytes(CONTENT)
+    assert digest == DIGEST
+    assert path == store.root / DIGEST[:2] / DIGEST[2:4] / DIGEST
+    assert path.read_bytes() == CONTENT
+    assert store.size(DIGEST) == len(CONTENT)
+    assert store.exists(DIGEST.upper())
+
+
+def test_identical_bytes_are_stored_once(store):
+    _, first = store.put_bytes(CONTENT)
+    mtime = first.stat().st_mtime_ns
+    _, second = store.put_bytes(CONTENT)
+    assert second == first
+    assert first.stat().st_mtime_ns == mtime  # not rewritten
+    assert [p for p in store.root.rglob("*") if p.is_file()] == [first]
+    assert store.index.totals() == (1, len(CONTENT))
+    assert not list(store.tmp_dir.iterdir())
+
+
+def test_put_file_moves_a_new_upload_and_drops_a_duplicate(store, tmp_path):
+    upload = tmp_path / "upload.part"
+    upload.write_bytes(CONTENT)
+    path = store.put_file(upload, DIGEST)
+    assert path.read_bytes() == CONTENT
+    assert not upload.exists()
+
+    again = tmp_path / "again.part"
+    again.write_bytes(CONTENT)
+    assert store.put_file(again, DIGEST) == path
+    assert not again.exists()
+    assert store.index.totals() == (1, len(CONTENT))
+
+
+def test_missing_blob_has_no_size(store):
+    assert store.size("0" * 64) is None
+    assert not store.exists("0" * 64)
+
+
+@pytest.mark.parametrize("digest", ["", "abc", "g" * 64, "0" * 63, "../" + "0" * 61, "0" * 65])
+def test_malformed_digests_are_refused(store, digest):
+    with pytest.raises(InvalidDigest):
+        store.size(digest)
+
+
+def test_in_use_marks_readers_until_the_block_exits(store):
+    store.put_bytes(CONTENT)
+    with store.in_use(DIGEST) as path:
+        with store.in_use(DIGEST.upper()):
+            assert store.readers() == {DIGEST}
+        assert store.readers() == {DIGEST}
+        assert path.read_bytes() == CONTENT
+    assert store.readers() == set()
+
+
+def test_delete_prunes_empty_shards(store):
+    _, path = store.put_bytes(CONTENT)
+    other, other_path = store.put_bytes(b"another clip")
+    store.delete(DIGEST)
+    assert not path.exists()
+    assert not path.parent.exists()
+    assert other_path.exists()
+    store.delete(other)
+    assert [p for p in store.root.iterdir() if p != store.tmp_dir] == []
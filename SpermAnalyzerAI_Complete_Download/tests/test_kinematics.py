@@ -0,0 +1,128 @@
+"""
+Vectorized CASA kinematics against a per-track reference
+"""
+
+import math
+
+import numpy as np
+import pytest
+
+from backend.services.kinematics import KINEMATIC_KEYS, measure, summarize
+from backend.services.trajectories import normalize_tracks
+
+
+def _reference(frames, xy, frame_rate, microns_per_pixel, window, min_points):
+    """One track at a time, straight from the definitions"""
+    nan = dict.fromkeys(KINEMATIC_KEYS, math.nan)
+    n = len(xy)
+    if n < min_points:
+        return nan
+    seconds = (frames[-1] - frames[0]) / frame_rate
+    if seconds <= 0:
+        return nan
+    xy = np.asarray(xy, dtype=np.float64) * microns_per_pixel
+
+    def path(points):
+        return sum(math.dist(points[i], points[i + 1]) for i in range(len(points) - 1))
+
+    average = []
+    for i in range(n):
+        half = min(i, n - 1 - i, window // 2)
+        average.append(xy[i - half:i + half + 1].mean(axis=0))
+    average = np.array(average)
+
+    lateral = []
+    for i in range(n):
+        if i == 0:
+            heading = average[1] - average[0]
+        elif i == n - 1:
+            heading = average[-1] - average[-2]
+        else:
+            heading = (average[i + 1] - average[i - 1]) / 2
+        norm = math.hypot(*heading) or 1.0
+        deviation = xy[i] - average[i]
+        lateral.append((heading[0] * deviation[1] - heading[1] * deviation[0]) / norm)
+    crossings = sum(1 for a, b in zip(lateral, lateral[1:]) if a * b < 0)
+
+    vcl, vsl, vap = path(xy) / seconds, math.dist(xy[0], xy[-1]) / seconds, path(average) / seconds
+    return {
+        "vcl": vcl,
+        "vsl": vsl,
+        "vap": vap,
+        "lin": 100 * vsl / vcl if vcl else math.nan,
+        "str": 100 * vsl / vap if vap else math.nan,
+        "wob": 100 * vap / vcl if vcl else math.nan,
+        "alh": 2 * float(np.mean(np.abs(lateral))),
+        "bcf": crossings / seconds,
+    }
+
+
+def _tracks():
+    rng = np.random.default_rng(3)
+    tracks = []
+    for i, length in enumerate([1, 2, 3, 5, 6, 12, 40, 150]):
+        frames = np.cumsum(rng.integers(1, 3, length))  # with gaps
+        xy = np.cumsum(rng.normal(0, 3, (length, 2)), axis=0) + rng.uniform(0, 600, 2)
+        tracks.append({"track_id": i, "positions": np.c_[frames, xy]})
+    # Zero-length path: detected 20 times at the same spot
+    tracks.append({"track_id": "still", "positions": [(f, 100.0, 100.0) for f in range(20)]})
+    # Every point in the same frame: no elapsed time
+    tracks.append({"track_id": "instant", "positions": [(7, 10.0 * k, 0.0) for k in range(6)]})
+    return tracks
+
+
+@pytest.mark.parametrize("window, min_points", [(5, 5), (11, 5), (3, 1), (5, 2)])
+def test_matches_the_per_track_reference(window, min_points):
+    trajectories = normalize_tracks(_tracks())
+    metrics = measure(trajectories, 30.0, 0.5, window=window, min_points=min_points)
+    for i in range(len(trajectories)):
+        frames, xy = trajectories.points(i)
+        expected = _reference(frames, xy, 30.0, 0.5, window, min_points)
+        for key in KINEMATIC_KEYS:
+            assert metrics[key][i] == pytest.approx(expected[key], rel=1e-9, abs=1e-9, nan_ok=True), (
+                trajectories.track_ids[i], key
+            )
+
+
+def test_short_and_degenerate_tracks_are_nan_not_inf():
+    trajectories = normalize_tracks(_tracks())
+    with np.errstate(all="raise"):
+        metrics = measure(trajectories, 30.0, 0.5, min_points=5)
+    ids = list(trajectories.track_ids)
+    for short in ("0", "1", "2", "instant"):
+        assert all(np.isnan(metrics[key][ids.index(short)]) for key in KINEMATIC_KEYS)
+    still = ids.index("still")
+    assert metrics["vcl"][still] == metrics["vsl"][still] == metrics["vap"][still] == 0
+    assert all(np.isnan(metrics[key][still]) for key in ("lin", "str", "wob"))
+    assert not any(np.isinf(values).any() for values in metrics.values())
+
+
+def test_sine_track():
+    # 50 um/s forward with a 3 um, 3 Hz lateral sine, at 30 fps
+    fps, amplitude, frequency, speed = 30.0, 3.0, 3.0, 50.0
+    t = np.arange(150) / fps
+    positions = np.c_[np.arange(150), speed * t, amplitude * np.sin(2 * np.pi * frequency * t)]
+    metrics = measure(normalize_tracks([{"track_id": 1, "positions": positions}]), fps, 1.0, window=11)
+    assert metrics["vsl"][0] == pytest.approx(speed, rel=0.01)
+    assert speed <= metrics["vap"][0] < metrics["vcl"][0]
+    # Twice the mean |sine|: 4A/pi
+    assert metrics["alh"][0] == pytest.approx(4 * amplitude / np.pi, rel=0.05)
+    # The path crosses its average twice per beat
+    assert metrics["bcf"][0] == pytest.approx(2 * frequency, abs=0.5)
+
+
+def test_summarize_skips_unmeasured_tracks():
+    trajectories = normalize_tracks(_tracks())
+    metrics = measure(trajectories, 30.0, 0.5)
+    summary = summarize(metrics)
+    measured = np.isfinite(metrics["vcl"])
+    assert summary["tracks_measured"] == int(measured.sum())
+    assert summary["vcl"] == round(float(metrics["vcl"][measured].mean()), 2)
+    # The still track has a VCL but no LIN
+    assert summary["lin"] == round(float(np.nanmean(metrics["lin"][measured])), 2)
+
+
+def test_no_tracks():
+    metrics = measure(normalize_tracks([]), 30.0, 0.5)
+    assert all(len(values) == 0 for values in metrics.values())
+    assert summarize(metrics) == {"tracks_measured": 0, **dict.fromkeys(KINEMATIC_KEYS)}
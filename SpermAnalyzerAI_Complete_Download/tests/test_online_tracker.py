@@ -0,0 +1,103 @@
+"""
+Linking, windowing and per-frame cost of the online tracker
+"""
+
+import time
+
+import numpy as np
+
+from backend.services.online_tracker import OnlineTracker, _greedy_pairs, detection_centres
+
+
+def _clip(cells, frames, seed=0, size=1000.0, noise=1.5, missed=0.1, spurious=5):
+    """Per-frame {"center"} detections of cells moving in straight lines, with
+    jitter, missed detections and spurious ones"""
+    rng = np.random.default_rng(seed)
+    start = rng.uniform(0, size, (cells, 2))
+    velocity = rng.uniform(-4, 4, (cells, 2))
+    clip = []
+    for frame in range(frames):
+        centres = start + velocity * frame + rng.normal(0, noise, (cells, 2))
+        centres = np.vstack([centres[rng.random(cells) > missed], rng.uniform(0, size, (spurious, 2))])
+        clip.append([{"center": list(centre)} for centre in centres])
+    return clip
+
+
+def _reference_pairs(distance):
+    """Walk every pair closest first, as the tracker used to"""
+    rows, columns = set(), set()
+    pairs = []
+    for flat in np.argsort(distance, axis=None, kind="stable"):
+        row, column = divmod(int(flat), distance.shape[1])
+        if np.isfinite(distance[row, column]) and row not in rows and column not in columns:
+            rows.add(row)
+            columns.add(column)
+            pairs.append((row, column))
+    return sorted(pairs)
+
+
+def test_greedy_pairs_match_the_closest_first_walk():
+    rng = np.random.default_rng(1)
+    for _ in range(200):
+        distance = rng.uniform(0, 50, rng.integers(1, 30, size=2))
+        distance[distance > rng.uniform(5, 50)] = np.inf
+        rows, columns = _greedy_pairs(distance)
+        assert sorted(zip(rows.tolist(), columns.tolist())) == _reference_pairs(distance)
+
+
+def test_greedy_pairs_with_nothing_in_reach():
+    rows, columns = _greedy_pairs(np.full((3, 4), np.inf))
+    assert len(rows) == len(columns) == 0
+
+
+def test_cells_are_linked_into_one_track_each():
+    tracker = OnlineTracker(max_distance=20, max_missed=30)
+    tracker.extend(_clip(20, 100, missed=0, spurious=0, noise=0.5))
+    tracks = tracker.tracks()
+    assert len(tracks) == 20
+    assert all(len(track["positions"]) == 100 for track in tracks)
+
+
+def test_a_track_is_not_extended_beyond_its_gate():
+    tracker = OnlineTracker(max_distance=10, max_missed=5)
+    tracker.extend([[{"center": [0, 0]}], [{"center": [9, 0]}], [], [{"center": [28, 0]}], [{"center": [60, 0]}]])
+    assert [len(track["positions"]) for track in tracker.tracks()] == [3, 1]
+
+
+def test_incremental_linking_matches_one_pass():
+    clip = _clip(30, 120)
+    whole = OnlineTracker(20, 30)
+    whole.extend(clip)
+    chunked = OnlineTracker(20, 30)
+    for start in range(0, len(clip), 25):
+        chunked.extend(clip[start:start + 25])
+    assert chunked.tracks() == whole.tracks()
+
+
+def test_drop_forgets_old_points():
+    tracker = OnlineTracker(20, 30)
+    tracker.extend(_clip(10, 60, missed=0, spurious=0))
+    tracker.drop(50)
+    assert min(point[0] for track in tracker.tracks() for point in track["positions"]) == 50
+    assert len(tracker.tracks()) == 10
+
+
+def test_detection_formats():
+    centres = detection_centres([
+        {"bbox": [0, 0, 10, 20]},
+        {"centroid": [3, 4]},
+        ([10, 10, 4, 6], 0.9, 0),
+        [0, 0, 2, 2, 0.5, 1],
+        7,
+    ])
+    assert centres.tolist() == [[5, 10], [3, 4], [12, 13], [1, 1]]
+
+
+def test_a_crowded_field_links_in_a_few_milliseconds_per_frame():
+    # 200 cells plus spurious detections; linking every pair in Python took ~35 ms a frame
+    clip = _clip(200, 100)
+    tracker = OnlineTracker(20, 30)
+    started = time.perf_counter()
+    tracker.extend(clip)
+    per_frame = (time.perf_counter() - started) / len(clip)
+    assert per_frame < 0.015
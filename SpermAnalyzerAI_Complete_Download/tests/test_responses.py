@@ -0,0 +1,88 @@
+"""
+orjson rendering, content negotiation and compression helpers
+"""
+
+import gzip
+import json
+from datetime import date, datetime, timezone
+
+import numpy as np
+import pytest
+
+from backend.responses import FastJSONResponse, choose_encoding, compress, dumps, etag_match, parse_accept
+
+
+def test_round_trip_of_a_result_with_numpy_values():
+    content = {
+        "timestamp": datetime(2024, 5, 1, 12, 30, 15, 250000),
+        "aware": datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc),
+        "day": date(2024, 5, 1),
+        "count": np.int64(42),
+        "small": np.int32(-7),
+        "concentration": np.float32(12.5),
+        "vcl": np.float64(51.25),
+        "flag": np.bool_(True),
+        "path": np.arange(6, dtype=np.int16).reshape(3, 2),
+        "velocities": np.array([1.5, 2.5]),
+        "missing": None,
+    }
+    decoded = json.loads(FastJSONResponse(content).body)
+    assert decoded == {
+        "timestamp": "2024-05-01T12:30:15.250000",
+        "aware": "2024-05-01T12:30:00+00:00",
+        "day": "2024-05-01",
+        "count": 42,
+        "small": -7,
+        "concentration": 12.5,
+        "vcl": 51.25,
+        "flag": True,
+        "path": [[0, 1], [2, 3], [4, 5]],
+        "velocities": [1.5, 2.5],
+        "missing": None,
+    }
+
+
+def test_non_string_keys_become_strings():
+    # e.g. per-track results keyed by track id
+    decoded = json.loads(dumps({1: "a", 2.5: "b", None: "c", date(2024, 1, 2): "d"}))
+    assert decoded == {"1": "a", "2.5": "b", "null": "c", "2024-01-02": "d"}
+
+
+def test_non_finite_floats_become_null():
+    assert json.loads(dumps({"lin": float("nan"), "str": np.float64("inf")})) == {"lin": None, "str": None}
+
+
+def test_response_headers():
+    response = FastJSONResponse({"a": 1}, status_code=201)
+    assert response.status_code == 201
+    assert response.headers["content-type"] == "application/json"
+    assert response.headers["content-length"] == str(len(b'{"a":1}'))
+
+
+def test_parse_accept():
+    assert parse_accept("gzip;q=0.5, br , identity;q=x") == [("gzip", 0.5), ("br", 1.0), ("identity", 0.0)]
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("", None),
+    ("identity", None),
+    ("gzip", "gzip"),
+    ("deflate, gzip;q=0.8", "gzip"),
+    ("gzip;q=0", None),
+])
+def test_choose_encoding(header, expected):
+    assert choose_encoding(header) == expected
+
+
+def test_gzip_round_trip():
+    body = dumps({"tracks": [{"path": list(range(100))}] * 50})
+    assert gzip.decompress(compress(body, "gzip")) == body
+
+
+def test_etag_match_accepts_the_compressed_variant():
+    etag = '"job-1-3"'
+    assert etag_match('"job-1-3"', etag) == '"job-1-3"'
+    assert etag_match('W/"job-1-3-gzip"', etag) == 'W/"job-1-3-gzip"'
+    assert etag_match('"job-1-4", "job-1-3-br"', etag) == '"job-1-3-br"'
+    assert etag_match('"job-1-3-deflate"', etag) is None
+    assert etag_match(None, etag) is None
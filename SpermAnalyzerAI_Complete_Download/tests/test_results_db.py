@@ -0,0 +1,140 @@
+"""
+Batched writes, upserts and history queries of the results store, on SQLite
+"""
+
+import asyncio
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+pytest.importorskip("aiosqlite")
+
+from backend.services.results_db import ResultsStore, async_url, record_row
+
+
+def _result(count):
+    return {
+        "analysis": {
+            "sperm_count": np.int64(count),
+            "concentration": np.float32(12.5),
+            "motility": {"progressive": 40.0, "non_progressive": 20.0, "immotile": 40.0},
+            "velocities": {"vcl": 50.0, "vsl": 30.0, "vap": 35.0},
+            "linearity": 0.6,
+            "morphology": {"normal": 5.0, "abnormal": 95.0},
+        },
+        "per_track": np.arange(3),
+    }
+
+
+def _store(tmp_path):
+    return ResultsStore(f"sqlite:///{tmp_path / 'results.db'}", pool_size=2, batch_size=50, flush_interval=0.01)
+
+
+def test_async_url():
+    assert async_url("sqlite:///./x.db") == "sqlite+aiosqlite:///./x.db"
+    assert async_url("postgresql://u@h/db") == "postgresql+asyncpg://u@h/db"
+    assert async_url("postgresql+psycopg://u@h/db") == "postgresql+psycopg://u@h/db"
+
+
+def test_rows_are_written_and_read_back(tmp_path):
+    async def run():
+        store = _store(tmp_path)
+        await store.start()
+        store.record(record_row("job-1", "completed", result=_result(42), patient_id="p1", sha256="ab" * 32))
+        await store.stop()
+        # A fresh store on the same file sees what the first one wrote
+        await store.start()
+        try:
+            return await store.get("job-1"), await store.get("missing")
+        finally:
+            await store.stop()
+
+    record, missing = asyncio.run(run())
+    assert missing is None
+    assert record["status"] == "completed"
+    assert record["sperm_count"] == 42
+    assert record["concentration"] == 12.5
+    assert record["patient_id"] == "p1"
+    # NumPy values in the result document are stored as plain JSON
+    assert record["result"]["analysis"]["sperm_count"] == 42
+    assert record["result"]["per_track"] == [0, 1, 2]
+
+
+def test_later_rows_for_a_job_replace_earlier_ones(tmp_path):
+    created = datetime(2024, 1, 1, 12, 0)
+
+    async def run():
+        store = _store(tmp_path)
+        await store.start()
+        store.record(record_row("job-1", "running", created_at=created))
+        await store.stop()
+        await store.start()
+        store.record(record_row("job-1", "completed", result=_result(7), created_at=created + timedelta(hours=1)))
+        store.record(record_row("job-2", "failed", error="boom"))
+        await store.stop()
+        await store.start()
+        try:
+            return await store.get("job-1"), await store.get("job-2"), store.stats
+        finally:
+            await store.stop()
+
+    first, second, stats = asyncio.run(run())
+    assert first["status"] == "completed"
+    assert first["sperm_count"] == 7
+    assert first["created_at"] == created.isoformat()  # kept from the first write
+    assert second["error"] == "boom"
+    assert stats["failed"] == 0
+
+
+def test_history_filters_and_pages_newest_first(tmp_path):
+    start = datetime(2024, 1, 1)
+
+    async def run():
+        store = _store(tmp_path)
+        await store.start()
+        for i in range(7):
+            store.record(record_row(
+                f"job-{i}", "completed", result=_result(i),
+                created_at=start + timedelta(days=i), patient_id="p1" if i % 2 else "p2",
+            ))
+        await store.stop()
+        await store.start()
+        try:
+            pages, cursor = [], None
+            while True:
+                items, cursor = await store.history(patient_id="p1", limit=2, cursor=cursor)
+                pages.append([item["job_id"] for item in items])
+                if cursor is None:
+                    break
+            since, _ = await store.history(since=start + timedelta(days=5))
+            return pages, since
+        finally:
+            await store.stop()
+
+    pages, since = asyncio.run(run())
+    assert pages == [["job-5", "job-3"], ["job-1"]]
+    assert [item["job_id"] for item in since] == ["job-6", "job-5"]
+    assert "result" not in since[0]
+
+
+def test_write_hooks_see_each_completed_job_once(tmp_path):
+    seen = []
+
+    async def hook(conn, rows):
+        seen.append(sorted(row["job_id"] for row in rows))
+
+    async def run():
+        store = _store(tmp_path)
+        store.write_hooks.append(hook)
+        await store.start()
+        store.record(record_row("job-1", "completed", result=_result(1)))
+        store.record(record_row("job-2", "running"))
+        await store.stop()
+        await store.start()
+        store.record(record_row("job-1", "completed", result=_result(1)))
+        store.record(record_row("job-2", "completed", result=_result(2)))
+        await store.stop()
+
+    asyncio.run(run())
+    assert seen == [["job-1"], ["job-2"]]
@@ -0,0 +1,154 @@
+"""
+TTL expiry, quota eviction, temporary-file sweeping and in-use protection
+of upload retention
+"""
+
+import asyncio
+import json
+import os
+import time
+
+import pytest
+
+from backend.services.blob_index import BlobIndex
+from backend.services.blob_store import BlobStore
+from backend.services.retention import RetentionManager
+from backend.services.trajectories import TrajectoryStore
+from backend.services.upload_sessions import UploadSessionManager
+
+TTL = 3600
+DAY = 24 * 3600
+
+
+@pytest.fixture
+def make_retention(tmp_path):
+    def make(quota_bytes=10 ** 9, tracks_quota_bytes=10 ** 9):
+        store = BlobStore(tmp_path / "blobs", BlobIndex(tmp_path / "blob_index.db"))
+        sessions = UploadSessionManager(str(tmp_path), max_size=10 ** 6, ttl=TTL)
+        return RetentionManager(
+            store, sessions, tmp_path / "jobs", TrajectoryStore(tmp_path / "tracks"),
+            ttl=DAY, quota_bytes=quota_bytes,
+            tracks_ttl=DAY, tracks_quota_bytes=tracks_quota_bytes,
+            interval=60,
+        )
+
+    return make
+
+
+def _put(retention, content: bytes, age: float = 0.0) -> str:
+    """Store `content`, last accessed `age` seconds ago"""
+    digest, _ = retention.store.put_bytes(content)
+    retention.index.record(digest, len(content), time.time() - age)
+    return digest
+
+
+def _age_file(path, age: float) -> None:
+    when = time.time() - age
+    os.utime(path, (when, when))
+
+
+def test_blobs_past_their_ttl_are_deleted(make_retention):
+    retention = make_retention()
+    old = _put(retention, b"old clip", age=2 * DAY)
+    recent = _put(retention, b"recent clip", age=DAY / 2)
+
+    stats = retention.collect()
+    assert not retention.store.exists(old)
+    assert retention.store.exists(recent)
+    assert stats["deleted_blobs_total"] == 1
+    assert stats["freed_bytes_total"] == len(b"old clip")
+    assert stats["stored_blobs"] == 1
+
+
+def test_a_read_since_the_last_pass_resets_the_ttl(make_retention):
+    retention = make_retention()
+    digest = _put(retention, b"clip", age=2 * DAY)
+    retention.store.access(digest)  # buffered, flushed by collect()
+    retention.collect()
+    assert retention.store.exists(digest)
+
+
+def test_least_recently_used_blobs_are_evicted_down_to_the_quota(make_retention):
+    retention = make_retention(quota_bytes=2500)
+    oldest = _put(retention, b"a" * 1000, age=300)
+    older = _put(retention, b"b" * 1000, age=200)
+    newer = _put(retention, b"c" * 1000, age=100)
+    newest = _put(retention, b"d" * 1000, age=0)
+
+    stats = retention.collect()
+    assert [retention.store.exists(d) for d in (oldest, older, newer, newest)] == [False, False, True, True]
+    assert stats["stored_bytes"] == 2000
+
+
+def test_blobs_a_job_still_needs_are_kept(make_retention):
+    retention = make_retention(quota_bytes=0)
+    queued = _put(retention, b"queued clip", age=2 * DAY)
+    reading = _put(retention, b"clip being read", age=2 * DAY)
+    idle = _put(retention, b"idle clip", age=2 * DAY)
+    manifest = retention.jobs_root / "job-1" / "job.json"
+    manifest.parent.mkdir(parents=True)
+    manifest.write_text(json.dumps({"job_id": "job-1", "sha256": queued}))
+
+    with retention.store.in_use(reading):
+        stats = retention.collect()
+    assert retention.store.exists(queued)
+    assert retention.store.exists(reading)
+    assert not retention.store.exists(idle)
+    assert stats["kept_in_use"] == 2
+
+    # Once the job is gone and the read is over, both are fair game
+    manifest.unlink()
+    retention.collect()
+    assert not retention.store.exists(queued)
+    assert not retention.store.exists(reading)
+
+
+def test_stale_temporaries_are_swept_and_open_uploads_kept(make_retention):
+    retention = make_retention()
+    partial_dir, tmp_dir = retention.sessions.partial_dir, retention.store.tmp_dir
+    partial_dir.mkdir(parents=True)
+    tmp_dir.mkdir(parents=True)
+    abandoned = partial_dir / "abandoned.part"
+    crashed = tmp_dir / "crashed-writer"
+    fresh = tmp_dir / "writing-now"
+    for path in (abandoned, crashed, fresh):
+        path.write_bytes(b"x" * 10)
+    _age_file(abandoned, 2 * TTL)
+    _age_file(crashed, 2 * TTL)
+
+    # A session this process still tracks keeps its part file however idle
+    session = asyncio.run(retention.sessions.create("clip.avi", 10))
+    _age_file(session.path, 2 * TTL)
+
+    stats = retention.collect()
+    assert not abandoned.exists()
+    assert not crashed.exists()
+    assert fresh.exists()
+    assert session.path.exists()
+    assert stats["swept_files_total"] == 2
+
+
+def test_blobs_stored_before_the_index_are_seeded(make_retention, tmp_path):
+    legacy = BlobStore(tmp_path / "blobs")
+    digest, path = legacy.put_bytes(b"stored before the index")
+    _age_file(path, 2 * DAY)
+
+    retention = make_retention()
+    stats = retention.collect()
+    assert retention.index.needs_seed is False
+    assert not retention.store.exists(digest)  # seeded with its atime, so already expired
+    assert stats["deleted_blobs_total"] == 1
+
+
+def test_trajectories_have_their_own_ttl(make_retention):
+    retention = make_retention()
+    retention.tracks.root.mkdir(parents=True)
+    old, recent = retention.tracks.root / "old.npz", retention.tracks.root / "recent.npz"
+    old.write_bytes(b"x" * 10)
+    recent.write_bytes(b"x" * 10)
+    _age_file(old, 2 * DAY)
+
+    stats = retention.collect()
+    assert not old.exists()
+    assert recent.exists()
+    assert stats["deleted_tracks_total"] == 1
@@ -0,0 +1,108 @@
+"""
+Douglas-Peucker simplification and the delta-encoded trajectory export
+"""
+
+import numpy as np
+import pytest
+
+from backend.services.trajectories import SUBPIXEL, delta_encode, normalize_tracks, simplify
+
+
+def _tracks(seed=0, count=20):
+    rng = np.random.default_rng(seed)
+    tracks = []
+    for track_id in range(count):
+        n = int(rng.integers(1, 200))
+        start = int(rng.integers(0, 100))
+        xy = rng.uniform(0, 640, 2) + np.cumsum(rng.normal(0, 3, (n, 2)), axis=0)
+        tracks.append({"track_id": track_id, "positions": [(start + k, x, y) for k, (x, y) in enumerate(xy)]})
+    return normalize_tracks(tracks)
+
+
+def _decode(columns):
+    """Inverse of delta_encode: (frames, xy) per track"""
+    offsets, scale = columns["offsets"], columns["scale"]
+    decoded = []
+    for i in range(len(offsets) - 1):
+        dframe = columns["dframe"][offsets[i]:offsets[i + 1]].astype(np.int64)
+        dxy = columns["dxy"][offsets[i]:offsets[i + 1]].astype(np.int64)
+        frames = columns["frame0"][i] + np.cumsum(dframe)
+        xy = (columns["xy0"][i] + np.cumsum(dxy, axis=0)) / scale
+        decoded.append((frames, xy))
+    return decoded
+
+
+def _douglas_peucker(xy, tolerance):
+    """Textbook recursive Douglas-Peucker over one track; indices kept"""
+    keep = {0, len(xy) - 1}
+
+    def split(first, last):
+        if last - first < 2:
+            return
+        start, end = xy[first], xy[last]
+        dx, dy = end - start
+        points = xy[first + 1:last] - start
+        length = np.hypot(dx, dy)
+        if length == 0:
+            distance = np.hypot(points[:, 0], points[:, 1])
+        else:
+            distance = np.abs(dx * points[:, 1] - dy * points[:, 0]) / length
+        farthest = int(np.argmax(distance))
+        if distance[farthest] > tolerance:
+            keep.add(first + 1 + farthest)
+            split(first, first + 1 + farthest)
+            split(first + 1 + farthest, last)
+
+    split(0, len(xy) - 1)
+    return sorted(keep)
+
+
+@pytest.mark.parametrize("tolerance", [0.5, 2.0, 10.0])
+def test_simplify_matches_recursive_douglas_peucker(tolerance):
+    trajectories = _tracks()
+    keep = simplify(trajectories.xy, trajectories.offsets, tolerance)
+    for i in range(len(trajectories)):
+        start, end = trajectories.offsets[i], trajectories.offsets[i + 1]
+        xy = trajectories.xy[start:end].astype(np.float64)
+        assert np.flatnonzero(keep[start:end]).tolist() == _douglas_peucker(xy, tolerance)
+
+
+def test_simplify_keeps_every_point_at_zero_tolerance():
+    trajectories = _tracks()
+    assert simplify(trajectories.xy, trajectories.offsets, 0.0).all()
+
+
+def test_simplify_reduces_a_straight_track_to_its_ends():
+    xy = np.stack([np.linspace(0, 100, 50), np.linspace(0, 50, 50)], axis=1).astype(np.float32)
+    keep = simplify(xy, np.array([0, 50]), 0.1)
+    assert np.flatnonzero(keep).tolist() == [0, 49]
+
+
+def test_delta_encoding_round_trips_to_subpixel_precision():
+    trajectories = _tracks()
+    columns = delta_encode(trajectories)
+    assert columns["scale"] == SUBPIXEL
+    for i, (frames, xy) in enumerate(_decode(columns)):
+        expected_frames, expected_xy = trajectories.points(i)
+        assert frames.tolist() == expected_frames.tolist()
+        np.testing.assert_allclose(xy, expected_xy, atol=0.5 / SUBPIXEL + 1e-6)
+
+
+def test_delta_encoding_of_a_simplified_track_keeps_the_chosen_points():
+    trajectories = _tracks()
+    tolerance = 2.0
+    keep = simplify(trajectories.xy, trajectories.offsets, tolerance)
+    columns = delta_encode(trajectories, tolerance)
+    for i, (frames, xy) in enumerate(_decode(columns)):
+        expected_frames, expected_xy = trajectories.points(i)
+        kept = keep[trajectories.offsets[i]:trajectories.offsets[i + 1]]
+        assert frames.tolist() == expected_frames[kept].tolist()
+        np.testing.assert_allclose(xy, expected_xy[kept], atol=0.5 / SUBPIXEL + 1e-6)
+
+
+def test_large_steps_coarsen_the_scale_instead_of_overflowing():
+    trajectories = normalize_tracks([{"track_id": 0, "positions": [(0, 0.0, 0.0), (1, 20000.0, 0.0)]}])
+    columns = delta_encode(trajectories)
+    assert columns["scale"] < SUBPIXEL
+    (frames, xy), = _decode(columns)
+    np.testing.assert_allclose(xy, trajectories.xy, atol=0.5 / columns["scale"] + 1e-6)
@@ -0,0 +1,104 @@
+"""
+Offsets, resumption and checksums of resumable upload sessions
+"""
+
+import asyncio
+import hashlib
+
+import pytest
+
+from backend.services import upload_sessions as module
+from backend.services.blob_index import BlobIndex
+from backend.services.blob_store import BlobStore
+from backend.services.upload_sessions import (
+    WRITE_SIZE,
+    ChecksumMismatch,
+    OffsetMismatch,
+    UploadIncomplete,
+    UploadSessionManager,
+    UploadTooLarge,
+)
+
+DATA = bytes(range(256)) * (WRITE_SIZE // 256 * 3)  # three write buffers' worth
+
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    monkeypatch.setattr(module, "blob_store", BlobStore(tmp_path / "blobs", BlobIndex(tmp_path / "blob_index.db")))
+    return UploadSessionManager(str(tmp_path), max_size=len(DATA), ttl=3600)
+
+
+async def _stream(data, piece=64 * 1024, fail_after=None):
+    """A request body in `piece`-sized parts, dropping the connection after `fail_after` bytes"""
+    for start in range(0, len(data), piece):
+        if fail_after is not None and start >= fail_after:
+            raise ConnectionResetError("client went away")
+        yield data[start:start + piece]
+
+
+def test_upload_in_two_chunks(manager):
+    async def run():
+        session = await manager.create("clip.avi", len(DATA), sha256=hashlib.sha256(DATA).hexdigest())
+        assert session.path.stat().st_size == len(DATA)  # preallocated
+        half = len(DATA) // 2
+        await manager.write_chunk(session.upload_id, 0, _stream(DATA[:half]))
+        assert manager.get(session.upload_id).to_dict()["offset"] == half
+        await manager.write_chunk(session.upload_id, half, _stream(DATA[half:]))
+        return await manager.finalize(session.upload_id)
+
+    digest = asyncio.run(run())
+    assert digest == hashlib.sha256(DATA).hexdigest()
+    assert module.blob_store.path_for(digest).read_bytes() == DATA
+
+
+def test_resume_after_a_dropped_connection(manager):
+    async def run():
+        session = await manager.create("clip.avi", len(DATA))
+        with pytest.raises(ConnectionResetError):
+            await manager.write_chunk(session.upload_id, 0, _stream(DATA, fail_after=WRITE_SIZE + 100_000))
+        # Whole writes are kept; the client asks for the offset and carries on from there
+        offset = manager.get(session.upload_id).to_dict()["offset"]
+        assert offset == WRITE_SIZE
+        await manager.write_chunk(session.upload_id, offset, _stream(DATA[offset:]))
+        return await manager.finalize(session.upload_id)
+
+    digest = asyncio.run(run())
+    assert digest == hashlib.sha256(DATA).hexdigest()
+    assert module.blob_store.path_for(digest).read_bytes() == DATA
+
+
+def test_out_of_order_chunk_is_rejected_with_the_expected_offset(manager):
+    async def run():
+        session = await manager.create("clip.avi", len(DATA))
+        await manager.write_chunk(session.upload_id, 0, _stream(DATA[:1000]))
+        with pytest.raises(OffsetMismatch) as error:
+            await manager.write_chunk(session.upload_id, 5000, _stream(DATA[5000:6000]))
+        assert error.value.expected == 1000
+        assert manager.get(session.upload_id).received == 1000
+
+    asyncio.run(run())
+
+
+def test_chunk_past_the_declared_size(manager):
+    async def run():
+        session = await manager.create("clip.avi", 1000)
+        with pytest.raises(UploadTooLarge):
+            await manager.write_chunk(session.upload_id, 0, _stream(DATA[:2000], piece=500))
+
+    asyncio.run(run())
+    with pytest.raises(UploadTooLarge):
+        asyncio.run(manager.create("clip.avi", len(DATA) + 1))
+
+
+def test_finalize_checks_completeness_and_digest(manager):
+    async def run():
+        session = await manager.create("clip.avi", len(DATA), sha256=hashlib.sha256(b"other bytes").hexdigest())
+        await manager.write_chunk(session.upload_id, 0, _stream(DATA[:1000]))
+        with pytest.raises(UploadIncomplete):
+            await manager.finalize(session.upload_id)
+        await manager.write_chunk(session.upload_id, 1000, _stream(DATA[1000:]))
+        with pytest.raises(ChecksumMismatch):
+            await manager.finalize(session.upload_id)
+
+    asyncio.run(run())
+    assert module.blob_store.size(hashlib.sha256(DATA).hexdigest()) is None
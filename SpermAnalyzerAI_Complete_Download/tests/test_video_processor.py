@@ -0,0 +1,89 @@
+"""
+Still-image probing and letterboxing of the video processor
+"""
+
+import io
+
+import cv2
+import numpy as np
+import pytest
+
+from backend.services.video_processor import PAD_VALUE, VideoProcessor, frame_count
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def _jpeg(width, height, orientation=None):
+    """A mid-grey JPEG stored as width x height, optionally with an EXIF orientation"""
+    image = Image.new("RGB", (width, height), (200, 200, 200))
+    exif = Image.Exif()
+    if orientation is not None:
+        exif[0x0112] = orientation
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", exif=exif.tobytes())
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("orientation, expected", [
+    (None, (300, 400)),
+    (1, (300, 400)),
+    (3, (300, 400)),
+    (6, (400, 300)),
+    (8, (400, 300)),
+])
+def test_probe_reports_the_size_cv2_decodes(orientation, expected):
+    data = _jpeg(400, 300, orientation)
+    assert VideoProcessor._probe_image_size(data) == expected
+    assert VideoProcessor(target_shape=None)._decode_image(data)[0].shape[1:3] == expected
+
+
+@pytest.mark.parametrize("size", [(400, 300), (3200, 2400)])  # the larger one takes the reduced decode
+def test_rotated_still_is_letterboxed_upright(size):
+    processor = VideoProcessor(target_shape=(640, 640))
+    frames, native_hw = processor._decode_image(_jpeg(*size, orientation=6))
+
+    assert native_hw == (size[0], size[1])
+    box = processor.letterbox(native_hw)
+    assert (box.scale, box.pad_x, box.pad_y) == (640 / size[0], 80, 0)
+    assert (box.width, box.height) == (480, 640)
+    # Picture exactly where the letterbox says, padding either side
+    assert (frames[0][:, :box.pad_x] == PAD_VALUE).all()
+    assert (frames[0][:, box.pad_x + box.width:] == PAD_VALUE).all()
+    assert np.abs(box.content(frames).astype(int) - 200).max() <= 2
+
+
+class _Capture:
+    """Stands in for cv2.VideoCapture; seeking to the end lands at `duration_ms`"""
+
+    def __init__(self, count, fps, duration_ms=None):
+        self.props = {cv2.CAP_PROP_FRAME_COUNT: count, cv2.CAP_PROP_FPS: fps, cv2.CAP_PROP_POS_MSEC: 0.0}
+        self.duration_ms = duration_ms
+
+    def get(self, prop):
+        return self.props[prop]
+
+    def set(self, prop, value):
+        if prop != cv2.CAP_PROP_POS_AVI_RATIO or self.duration_ms is None:
+            return False
+        self.props[cv2.CAP_PROP_POS_MSEC] = self.duration_ms * value
+        return True
+
+
+@pytest.mark.parametrize("capture, expected", [
+    (_Capture(450, 30.0), 450),
+    (_Capture(0, 30.0, duration_ms=15_000), 450),
+    (_Capture(-192153584101141, 25.0, duration_ms=2_000), 50),  # raw MJPEG reports garbage
+    (_Capture(0, 0.0, duration_ms=15_000), 0),
+    (_Capture(0, 30.0), 0),
+])
+def test_frame_count_falls_back_to_duration(capture, expected):
+    assert frame_count(capture) == expected
+
+
+def test_count_frames_of_a_written_clip(tmp_path):
+    path = str(tmp_path / "clip.avi")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 30, (64, 48))
+    for i in range(45):
+        writer.write(np.full((48, 64, 3), i * 5, np.uint8))
+    writer.release()
+    assert VideoProcessor.count_frames(path) == 45